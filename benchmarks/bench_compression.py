@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: proxy bandwidth and CPU for streamed statement pages per content-encoding.
+For each codec the cluster could use (identity, gzip, zstd), a multi-MB data page is relayed
+the way stream_response does it, in 8 KB upstream chunks:
+  identity     - upstream uncompressed, head URIs rewritten (the only path before compression)
+  passthrough  - compressed upstream relayed untouched, decoded on the side for the page scanner
+  recompressed - decoded, head URIs rewritten, re-encoded with the streaming encoder
+Reports bytes sent to the client, proxy CPU per page and MB/s, and the transfer time at
+--mbps. Checks that every path decodes to the same page as the identity path.
+
+Usage: python benchmarks/bench_compression.py [--rows 50000] [--iterations 5] [--mbps 1000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from compression import CODECS, Decoder, Encoder, decode  # noqa: E402
+from page_rewriter import PageRewriter  # noqa: E402
+from query_stats import PageScanner  # noqa: E402
+from url_rewriter import UrlRewriter  # noqa: E402
+
+CLUSTER_URL = 'http://trino-emr-standard.internal:8080'
+PROXY_URL = 'http://localhost:8080/c/emr-standard.x7Kp2QbVf0c'
+CHUNK = 8192
+
+
+def data_page(rows):
+    query_id = '20260101_120000_00042_x7k2p'
+    page = {
+        'id': query_id,
+        'infoUri': f'{CLUSTER_URL}/ui/query.html?{query_id}',
+        'partialCancelUri': f'{CLUSTER_URL}/v1/statement/executing/partialCancel/{query_id}/0/y1/3',
+        'nextUri': f'{CLUSTER_URL}/v1/statement/executing/{query_id}/y1/4',
+        'columns': [{'name': name, 'type': kind, 'typeSignature': {'rawType': kind, 'arguments': []}}
+                    for name, kind in (('order_id', 'bigint'), ('customer', 'varchar'), ('status', 'varchar'),
+                                       ('amount', 'double'), ('created_at', 'timestamp(3)'), ('region', 'varchar'))],
+        'data': [[1000000 + i, f'customer-{i % 977}', ('OPEN', 'SHIPPED', 'CLOSED')[i % 3], round(i * 13.37, 2),
+                  '2026-01-01 12:00:00.000', ('us-east-1', 'sa-east-1', 'eu-west-1')[i % 3]] for i in range(rows)],
+        'stats': {'state': 'RUNNING', 'nodes': 4, 'processedRows': 4194304, 'processedBytes': 293601280},
+        'warnings': [],
+    }
+    return json.dumps(page).encode('utf-8')
+
+
+def upstream_body(page, encoding):
+    """What the cluster sends (Trino compresses at its own level; gzip 6 / zstd 3 here)."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        return compressor.compress(page) + compressor.flush()
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(page)
+    return page
+
+
+def relay(raw_chunks, encoding, rewrite):
+    """stream_response: returns the chunks sent to the client."""
+    scanner = PageScanner()
+    rewriter = PageRewriter(rewrite) if rewrite is not None else None
+    decoder = Decoder(encoding) if encoding else None
+    encoder = Encoder(encoding) if encoding and rewriter is not None else None
+    out = []
+    for raw in raw_chunks:
+        chunk = decoder.decompress(raw) if decoder is not None else raw
+        scanner.feed(chunk)
+        if rewriter is None:
+            out.append(raw)
+            continue
+        chunk = rewriter.feed(chunk)
+        if encoder is not None:
+            chunk = encoder.compress(chunk)
+        if chunk:
+            out.append(chunk)
+    if rewriter is not None:
+        tail = rewriter.close()
+        if encoder is not None:
+            tail = encoder.compress(tail) + encoder.flush()
+        if tail:
+            out.append(tail)
+    if scanner.terminal:
+        scanner.result()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--mbps', type=float, default=1000, help='client link bandwidth for the transfer estimate')
+    args = parser.parse_args()
+
+    page = data_page(args.rows)
+    url_rewriter = UrlRewriter({CLUSTER_URL: PROXY_URL})
+    rewrite = lambda content: url_rewriter.rewrite(content)[0]  # noqa: E731
+    expected = b''.join(relay([page[i:i + CHUNK] for i in range(0, len(page), CHUNK)], '', rewrite))
+
+    print(f"page={len(page)} bytes rows={args.rows} iterations={args.iterations} link={args.mbps:.0f} Mbit/s")
+    print(f"{'path':22} {'client bytes':>12} {'ratio':>6} {'cpu ms':>8} {'MB/s':>8} {'transfer ms':>11} {'total ms':>9}")
+    mismatches = 0
+    for encoding in ('',) + CODECS:
+        body = upstream_body(page, encoding)
+        chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+        paths = [('identity', rewrite)] if not encoding else [(f'{encoding} passthrough', None), (f'{encoding} recompressed', rewrite)]
+        for name, path_rewrite in paths:
+            sent = b''.join(relay(chunks, encoding, path_rewrite))
+            decoded = decode(sent, encoding)
+            if decoded != (expected if path_rewrite is not None else page):
+                mismatches += 1
+                print(f"mismatch path={name}")
+            started = time.process_time()
+            for _ in range(args.iterations):
+                relay(chunks, encoding, path_rewrite)
+            cpu = (time.process_time() - started) / args.iterations
+            transfer = len(sent) * 8 / (args.mbps * 1e6)
+            print(f"{name:22} {len(sent):12d} {len(page) / len(sent):5.1f}x {cpu * 1e3:8.2f} "
+                  f"{len(page) / cpu / 1e6 if cpu else 0:8.0f} {transfer * 1e3:11.2f} {(cpu + transfer) * 1e3:9.2f}")
+    print(f"mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
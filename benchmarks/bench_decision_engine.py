@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: DecisionEngine.decide() (per query) vs decide_batch() (columnar).
+Checks that both paths produce identical clusters, scores and factors.
+
+Usage: python benchmarks/bench_decision_engine.py [--rows 200000] [--seed 42]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from decision_engine import DecisionEngine, COMPLEXITY_KEYS  # noqa: E402
+
+
+class FixedHistory:
+    """Stand-in for HistoryManager returning a precomputed historical factor per fingerprint."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_historical_factor(self, fingerprint, query):
+        return self.values[fingerprint]
+
+
+def generate_rows(rows, seed):
+    """Random feature rows spanning tiny to multi-TB scans; ~5% without metadata."""
+    rng = np.random.default_rng(seed)
+    size_bytes = 10 ** rng.uniform(3, 13.5, rows)
+    size_bytes[rng.random(rows) < 0.05] = np.nan
+    complexity = {key: rng.integers(0, 6, rows) for key in COMPLEXITY_KEYS}
+    historical = rng.uniform(0, 1, rows)
+    return size_bytes, complexity, historical
+
+
+def run_scalar(engine, size_bytes, complexity, historical):
+    history = FixedHistory(historical.tolist())
+    sizes = size_bytes.tolist()
+    columns = {key: values.tolist() for key, values in complexity.items()}
+    decisions = []
+    for i, size in enumerate(sizes):
+        metadata = {} if size != size else {'t': {'total_size_bytes': size, 'total_records': 0}}
+        row_complexity = {key: columns[key][i] for key in COMPLEXITY_KEYS}
+        decisions.append(engine.decide(None, i, metadata, row_complexity, history))
+    return decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    engine = DecisionEngine()
+    size_bytes, complexity, historical = generate_rows(args.rows, args.seed)
+
+    start = time.perf_counter()
+    scalar = run_scalar(engine, size_bytes, complexity, historical)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = engine.decide_batch(size_bytes, complexity, historical)
+    batch_seconds = time.perf_counter() - start
+
+    clusters_match = np.array([d['cluster'] for d in scalar]) == batch['cluster']
+    # Bit-exact: a 1-ulp score difference at a band edge changes the cluster
+    values_match = np.array([d['score'] for d in scalar]) == batch['score']
+    for key in scalar[0]['factors'] if scalar else ():
+        values_match &= np.array([d['factors'][key] for d in scalar]) == batch['factors'][key]
+    mismatches = int(np.count_nonzero(~(clusters_match & values_match)))
+
+    print(f"rows={args.rows}")
+    print(f"scalar  {scalar_seconds:8.3f}s  {scalar_seconds / args.rows * 1e6:8.3f} us/row")
+    print(f"batch   {batch_seconds:8.3f}s  {batch_seconds / args.rows * 1e6:8.3f} us/row")
+    print(f"speedup {scalar_seconds / batch_seconds:8.1f}x")
+    clusters, counts = np.unique(batch['cluster'], return_counts=True)
+    print("clusters " + " ".join(f"{c}={n}" for c, n in zip(clusters, counts)))
+    print(f"mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: QueryAnalyzer parsing on the request path, over an SQL corpus.
+Times generate_fingerprint, _normalize_query_with_catalog, analyze_complexity,
+_extract_where_clause (statements), _parse_explain_io (EXPLAIN (TYPE IO) JSON) and
+_parse_distributed_plan (EXPLAIN (TYPE DISTRIBUTED) text) on:
+  corpus       - the anonymized statements and plans in benchmarks/corpus (plus the saved
+                 explains of --explains-dir, e.g. a copy of production's EXPLAINS_DIR)
+  union/line   - corpus statements UNION ALL'ed up to each --sizes (multi-line, and collapsed
+                 to one line as BI tools and ORMs send them)
+  in_list      - a filter on an IN list of literals up to each --sizes
+  tables       - EXPLAIN outputs with enough tables/fragments to reach each --sizes
+Reports microseconds and MB/s per call, and the allocation peak per call (tracemalloc).
+
+Backtracking guard: every function also runs on adversarial inputs (a WHERE per line, long
+whitespace runs, join chains, unclosed quotes, ...) at two sizes, each in a child process with
+a deadline. Time must grow about linearly: the run fails (exit 1) when the growth exponent
+log(t2/t1)/log(size2/size1) exceeds --max-exponent (quadratic matching measures ~2, allocation
+effects alone up to ~1.6) with the larger input above --min-ms, or a case misses the deadline.
+
+Usage: python benchmarks/bench_query_analyzer.py [--sizes 64k,1m,4m] [--repeat 5]
+                                                 [--explains-dir DIR] [--no-guard | --guard-only]
+                                                 [--guard-sizes 64k,512k] [--max-exponent 1.75]
+"""
+
+import argparse
+import gc
+import glob
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import re
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+
+# Benchmarks must never write explains
+os.environ['SAVE_EXPLAINS'] = 'false'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'dyrasql-core'))
+
+from query_analyzer import QueryAnalyzer  # noqa: E402
+
+CORPUS = os.path.join(HERE, 'corpus')
+# Function -> input kind
+FUNCTIONS = {
+    'generate_fingerprint': 'sql',
+    '_normalize_query_with_catalog': 'sql',
+    'analyze_complexity': 'sql',
+    '_extract_where_clause': 'sql',
+    '_parse_explain_io': 'explain',
+    '_parse_distributed_plan': 'plan',
+}
+_BLOCK = re.compile(r'^-- name: (\S+)\n', re.MULTILINE)
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    scale = {'k': 1024, 'm': 1024 ** 2}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+def letters(n):
+    out = ''
+    while True:
+        n, r = divmod(n, 26)
+        out = string.ascii_lowercase[r] + out
+        if n == 0:
+            return out
+
+
+def read_blocks(path):
+    """`-- name:` blocks of a corpus file -> {name: text}."""
+    with open(path, encoding='utf-8') as f:
+        parts = _BLOCK.split(f.read())
+    return {parts[i]: parts[i + 1].strip() for i in range(1, len(parts), 2)}
+
+
+def load_corpus(explains_dir=None):
+    statements = list(read_blocks(os.path.join(CORPUS, 'queries.sql')).values())
+    with open(os.path.join(CORPUS, 'explain_io.json'), encoding='utf-8') as f:
+        explains = [entry['explain'] for entry in json.load(f)]
+    plans = list(read_blocks(os.path.join(CORPUS, 'distributed_plans.txt')).values())
+    if explains_dir:
+        for path in sorted(glob.glob(os.path.join(explains_dir, '*.json'))):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('query'):
+                statements.append(saved['query'])
+            if saved.get('raw_explain', {}).get('inputTableColumnInfos'):
+                explains.append(saved['raw_explain'])
+    return {'sql': statements, 'explain': explains, 'plan': plans}
+
+
+def repeat_to(pieces, separator, size):
+    """Joins `pieces` (cycling, each one renamed by `piece(i)`) until `size` characters."""
+    out, length, i = [], 0, 0
+    while length < size:
+        text = pieces(i)
+        out.append(text)
+        length += len(text) + len(separator)
+        i += 1
+    return separator.join(out)
+
+
+def scaled_inputs(corpus, size):
+    """Generated inputs of about `size` bytes, per kind: [(class, input)]."""
+    selects = [s for s in corpus['sql'] if s.lstrip().lower().startswith(('select', 'with'))]
+    union = repeat_to(lambda i: selects[i % len(selects)].replace('dw_', f'dw{letters(i)}_'), '\nUNION ALL\n', size)
+    in_list = ('SELECT * FROM dw_vendas.pedidos WHERE created_at >= DATE \'2026-10-01\' AND pedido_id IN ('
+               + repeat_to(lambda i: f"'ped-{letters(i)}'", ', ', size) + ')')
+
+    tables = [t for explain in corpus['explain'] for t in explain['inputTableColumnInfos']]
+
+    def table(i):
+        renamed = json.loads(json.dumps(tables[i % len(tables)]))
+        renamed['table']['schemaTable']['table'] += f'_{letters(i)}'
+        return json.dumps(renamed)
+
+    explain = json.loads('{"inputTableColumnInfos": [' + repeat_to(table, ', ', size) + ']}')
+    plans = corpus['plan']
+    plan = repeat_to(lambda i: plans[i % len(plans)].replace('dw_', f'dw{letters(i)}_'), '\n\n', size)
+    return {
+        'sql': [('union', union), ('line', ' '.join(union.split())), ('in_list', in_list)],
+        'explain': [('tables', explain)],
+        'plan': [('tables', plan)],
+    }
+
+
+def adversarial(kind, case, size):
+    """Inputs built to expose super-linear matching, of about `size` bytes."""
+    n = max(1, size)
+    if kind == 'sql':
+        if case == 'where_per_statement':
+            # One line, many WHEREs, no date-like word after any of them
+            return repeat_to(lambda i: "select a from s.t where x = 'k'", ' union all ', n)
+        if case == 'whitespace_run':
+            return 'select * from s.t where a = 1' + ' ' * n + 'x'
+        if case == 'join_chain':
+            return 'select * from s.t ' + repeat_to(lambda i: 'left outer join s.u on a = b', '\n', n)
+        if case == 'unclosed_quote':
+            return "select * from s.t where a = '" + 'x ' * (n // 2)
+        if case == 'newline_per_token':
+            return repeat_to(lambda i: 'where\ndate\njoin\nfrom\ns.t', '\n', n)
+    if kind == 'explain':
+        if case == 'ranges':
+            ranges = [{'low': {'value': str(i), 'bound': 'EXACTLY'}, 'high': {'value': str(i), 'bound': 'EXACTLY'}}
+                      for i in range(n // 90)]
+            return {'inputTableColumnInfos': [{
+                'table': {'catalog': 'iceberg', 'schemaTable': {'schema': 's', 'table': 't'}},
+                'constraint': {'columnConstraints': [{'columnName': 'id', 'domain': {'ranges': ranges}}]},
+                'estimate': {'outputRowCount': 1.0, 'outputSizeInBytes': 1.0, 'cpuCost': 1.0}}]}
+    if kind == 'plan':
+        if case == 'scan_without_bracket':
+            return 'TableScan[table = ' + 'a' * n
+        if case == 'estimate_digits':
+            return 'TableScan[table = c.s.t]\n' + repeat_to(lambda i: 'est. ' + '9' * 40, ' ', n)
+    raise ValueError(case)
+
+
+ADVERSARIAL = {
+    'sql': ('where_per_statement', 'whitespace_run', 'join_chain', 'unclosed_quote', 'newline_per_token'),
+    'explain': ('ranges',),
+    'plan': ('scan_without_bracket', 'estimate_digits'),
+}
+
+
+def length(value):
+    return len(value) if isinstance(value, str) else len(json.dumps(value))
+
+
+def time_calls(fn, inputs, repeat):
+    """Median over `repeat` passes of the seconds per call."""
+    passes = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for value in inputs:
+                fn(value)
+            passes.append((time.perf_counter() - start) / len(inputs))
+    finally:
+        gc.enable()
+    return statistics.median(passes)
+
+
+def allocation_peak(fn, inputs):
+    """Largest allocation peak (bytes above the starting point) of one call."""
+    peak = 0
+    tracemalloc.start()
+    try:
+        for value in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(value)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def guard_case(name, case, sizes, results):
+    """Child process: seconds per call (best of 3) at each size."""
+    logging.disable(logging.INFO)
+    fn = getattr(QueryAnalyzer(), name)
+    timings = []
+    for size in sizes:
+        value = adversarial(FUNCTIONS[name], case, size)
+        best = math.inf
+        for _ in range(3):
+            start = time.perf_counter()
+            fn(value)
+            best = min(best, time.perf_counter() - start)
+        timings.append(best)
+    results.put(timings)
+
+
+def run_guard(args):
+    """[(function, case, timings or None, exponent, ok)]."""
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for name, kind in FUNCTIONS.items():
+        for case in ADVERSARIAL[kind]:
+            results = context.Queue()
+            child = context.Process(target=guard_case, args=(name, case, args.guard_sizes, results), daemon=True)
+            child.start()
+            child.join(args.guard_timeout)
+            if child.is_alive():
+                child.kill()
+                rows.append((name, case, None, math.inf, False))
+                continue
+            try:
+                timings = results.get(timeout=5)
+            except queue.Empty:
+                timings = None
+            if not timings:
+                rows.append((name, case, None, math.inf, False))
+                continue
+            first, last = timings[0], timings[-1]
+            # Below the timer's useful resolution the ratio is noise
+            exponent = (math.log(max(last, 1e-5) / max(first, 1e-5))
+                        / math.log(args.guard_sizes[-1] / args.guard_sizes[0]))
+            ok = exponent <= args.max_exponent or last * 1000 < args.min_ms
+            rows.append((name, case, timings, exponent, ok))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='64k,1m,4m', type=lambda v: [parse_size(s) for s in v.split(',')])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--explains-dir', help='saved explains (EXPLAINS_DIR) added to the corpus')
+    parser.add_argument('--no-guard', action='store_true')
+    parser.add_argument('--guard-only', action='store_true')
+    parser.add_argument('--guard-sizes', default='64k,512k', type=lambda v: [parse_size(s) for s in v.split(',')])
+    parser.add_argument('--max-exponent', type=float, default=1.75)
+    parser.add_argument('--min-ms', type=float, default=10, help='cases faster than this never fail')
+    parser.add_argument('--guard-timeout', type=float, default=60, help='seconds per adversarial case')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if not args.guard_only:
+        analyzer = QueryAnalyzer()
+        corpus = load_corpus(args.explains_dir)
+        classes = {kind: [('corpus', inputs)] for kind, inputs in corpus.items()}
+        for size in args.sizes:
+            for kind, generated in scaled_inputs(corpus, size).items():
+                classes[kind].extend((name, [value]) for name, value in generated)
+        print(f"corpus: {len(corpus['sql'])} statements, {len(corpus['explain'])} EXPLAIN IO, "
+              f"{len(corpus['plan'])} distributed plans")
+        print(f"{'function':<30} {'input':<8} {'bytes':>9} {'us/call':>11} {'MB/s':>8} {'peak KB':>9}")
+        for name, kind in FUNCTIONS.items():
+            fn = getattr(analyzer, name)
+            for label, inputs in classes[kind]:
+                size = statistics.mean(length(value) for value in inputs)
+                seconds = time_calls(fn, inputs, args.repeat)
+                peak = allocation_peak(fn, inputs)
+                print(f"{name:<30} {label:<8} {size:>9.0f} {seconds * 1e6:>11.1f} "
+                      f"{size / seconds / 1e6:>8.1f} {peak / 1024:>9.1f}")
+
+    if args.no_guard:
+        return 0
+    sizes = ' -> '.join(f'{s // 1024}k' for s in args.guard_sizes)
+    print(f"\nbacktracking guard ({sizes}, max exponent {args.max_exponent})")
+    failed = 0
+    for name, case, timings, exponent, ok in run_guard(args):
+        if timings is None:
+            detail = f'no result within {args.guard_timeout:g}s'
+        else:
+            detail = ' -> '.join(f'{t * 1000:.2f}ms' for t in timings) + f'  exponent {exponent:.2f}'
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<30} {case:<22} {detail}")
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: routing decision latency in trino-gateway-proxy, per DYRASQL_ROUTING_MODE.
+A minimal DyraSQL Core answers /api/v1/route with a cached decision (the common case), and
+each path decides the same statements:
+  remote (client per call)  - a new httpx.AsyncClient per statement (the proxy before embedded mode)
+  remote (shared client)    - one keep-alive client for all statements
+  embedded (L1 hit)         - routing library in-process, decision already in the L1 cache
+Reports mean/p50/p99 microseconds per decision and decisions/s.
+
+Usage: python benchmarks/bench_routing.py [--decisions 2000] [--queries 100]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from routing import DecisionCache, Router, fingerprint  # noqa: E402
+
+
+class Registry:
+    """Just what Router reads from a ClusterRegistry."""
+
+    class Config:
+        names = ('ecs', 'emr-standard', 'emr-optimized')
+        default_tier = 'ecs'
+
+    def current(self):
+        return self.Config
+
+
+async def serve_core():
+    """Cached decision for every /api/v1/route; returns (server, port)."""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line[:15].lower() == b'content-length:':
+                        length = int(line[15:])
+                query = json.loads(await reader.readexactly(length))['query']
+                body = json.dumps({'fingerprint': fingerprint(query), 'cluster': 'emr-standard', 'score': 0.52,
+                                   'factors': {'volume': 0.4, 'complexity': 0.3, 'historical': 0.5},
+                                   'cached': True, 'expected_runtime': 12.5}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: '
+                             + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def summary(name, samples):
+    samples = sorted(samples)
+    mean = statistics.fmean(samples)
+    print(f"{name:26} {mean * 1e6:10.1f} {samples[len(samples) // 2] * 1e6:10.1f} "
+          f"{samples[int(len(samples) * 0.99)] * 1e6:10.1f} {1 / mean:12.0f}")
+
+
+async def main_async(args):
+    server, port = await serve_core()
+    url = f'http://127.0.0.1:{port}/api/v1/route'
+    queries = [f"SELECT order_id, amount FROM iceberg.sales.orders_{i % args.queries} "
+               f"WHERE created_at > DATE '2026-01-01' AND region = 'sa-east-1'" for i in range(args.decisions)]
+
+    async def per_call(query):
+        async with httpx.AsyncClient(timeout=5) as client:
+            return (await client.post(url, json={'query': query})).json()
+
+    shared = httpx.AsyncClient(timeout=5)
+
+    async def shared_call(query):
+        return (await shared.post(url, json={'query': query})).json()
+
+    router = Router(Registry(), cache=DecisionCache(max_entries=args.queries * 2, ttl=3600))
+    for query in queries[:args.queries]:
+        data = await shared_call(query)
+        router.save(data['fingerprint'], {'cluster': data['cluster'], 'score': data['score'],
+                                          'factors': data['factors'], 'expected_runtime': data['expected_runtime']})
+
+    async def embedded(query):
+        return router.route(query, 'bench')[1]
+
+    print(f"decisions={args.decisions} distinct_queries={args.queries}")
+    print(f"{'path':26} {'mean us':>10} {'p50 us':>10} {'p99 us':>10} {'decisions/s':>12}")
+    mismatches = 0
+    for name, decide in (('remote (client per call)', per_call), ('remote (shared client)', shared_call),
+                         ('embedded (L1 hit)', embedded)):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            decision = await decide(query)
+            samples.append(time.perf_counter() - started)
+            if decision is None or decision['cluster'] != 'emr-standard':
+                mismatches += 1
+        summary(name, samples)
+    await shared.aclose()
+    server.close()
+    print(f"mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--decisions', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=100, help='distinct statements (all cached)')
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: per-cluster str rewrite chain (decode, json.loads for the id, two re.sub per
+cluster, encode) vs UrlRewriter (one bytes pass that also extracts the id).
+Pages mimic Trino's protocol: queued, running (stats with a stage tree), data and final.
+Checks that both paths produce identical bytes and query ids.
+
+Usage: python benchmarks/bench_url_rewriter.py [--iterations 2000] [--rows 400] [--clusters 3]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from url_rewriter import UrlRewriter  # noqa: E402
+
+PROXY_URL = 'http://localhost:8080'
+
+
+def legacy_rewrite(content, cluster_urls):
+    """The rewrite path the proxy used before UrlRewriter."""
+    text = content.decode('utf-8')
+    try:
+        query_id = json.loads(text).get('id')
+    except (json.JSONDecodeError, AttributeError):
+        query_id = None
+    for cluster_url in cluster_urls:
+        text = re.sub(re.escape(cluster_url) + r'(/v1/statement/[^\"]+)', PROXY_URL + r'\1', text)
+        text = re.sub(re.escape(cluster_url) + r'(/ui/[^\"]+)', PROXY_URL + r'\1', text)
+    return text.encode('utf-8'), query_id
+
+
+def stats(state, stages):
+    def stage(n, depth):
+        return {
+            'stageId': str(n), 'state': state, 'done': state == 'FINISHED', 'nodes': 4,
+            'totalSplits': 120, 'queuedSplits': 3, 'runningSplits': 17, 'completedSplits': 100,
+            'cpuTimeMillis': 81234, 'wallTimeMillis': 90211, 'processedRows': 1048576,
+            'processedBytes': 73400320, 'physicalInputBytes': 73400320, 'failedTasks': 0,
+            'coordinatorOnly': False,
+            'subStages': [stage(n * 2 + i, depth + 1) for i in range(1, 3)] if depth < stages else [],
+        }
+    return {
+        'state': state, 'queued': state == 'QUEUED', 'scheduled': state != 'QUEUED', 'progressPercentage': 42.5,
+        'runningPercentage': 12.0, 'nodes': 4, 'totalSplits': 480, 'queuedSplits': 12, 'runningSplits': 68,
+        'completedSplits': 400, 'cpuTimeMillis': 324936, 'wallTimeMillis': 360844, 'queuedTimeMillis': 3,
+        'elapsedTimeMillis': 15213, 'processedRows': 4194304, 'processedBytes': 293601280,
+        'physicalInputBytes': 293601280, 'peakMemoryBytes': 268435456, 'spilledBytes': 0,
+        'rootStage': stage(0, 0) if stages else None,
+    }
+
+
+def build_pages(cluster_url, rows):
+    query_id = '20260101_120000_00042_x7k2p'
+    head = {
+        'id': query_id,
+        'infoUri': f'{cluster_url}/ui/query.html?{query_id}',
+        'partialCancelUri': f'{cluster_url}/v1/statement/executing/partialCancel/{query_id}/0/y1b2c3/1',
+        'nextUri': f'{cluster_url}/v1/statement/executing/{query_id}/y1b2c3/2',
+    }
+    columns = [
+        {'name': name, 'type': kind, 'typeSignature': {'rawType': kind, 'arguments': []}}
+        for name, kind in (('order_id', 'bigint'), ('customer', 'varchar'), ('status', 'varchar'),
+                           ('amount', 'double'), ('created_at', 'timestamp(3)'), ('region', 'varchar'),
+                           ('items', 'integer'), ('note', 'varchar'))
+    ]
+    data = [
+        [1000000 + i, f'customer-{i % 977}', ('OPEN', 'SHIPPED', 'CLOSED')[i % 3], round(i * 13.37, 2),
+         '2026-01-01 12:00:00.000', ('us-east-1', 'sa-east-1', 'eu-west-1')[i % 3], i % 17,
+         'see https://docs.example.com/orders for details' if i % 50 == 0 else None]
+        for i in range(rows)
+    ]
+    queued = {'id': query_id, 'infoUri': head['infoUri'], 'nextUri': f'{cluster_url}/v1/statement/queued/{query_id}/y0/1',
+              'stats': stats('QUEUED', 0), 'warnings': []}
+    running = {**head, 'stats': stats('RUNNING', 3), 'warnings': []}
+    data_page = {**head, 'columns': columns, 'data': data, 'stats': stats('RUNNING', 3), 'warnings': []}
+    final = {'id': query_id, 'infoUri': head['infoUri'], 'columns': columns, 'stats': stats('FINISHED', 3), 'warnings': []}
+    return {name: json.dumps(page).encode('utf-8') for name, page in
+            (('queued', queued), ('running', running), ('data', data_page), ('final', final))}
+
+
+def measure(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=400, help='rows in the data page (keep it under STREAMING_THRESHOLD)')
+    parser.add_argument('--clusters', type=int, default=3)
+    args = parser.parse_args()
+
+    cluster_urls = [f'http://trino-cluster-{i}.internal:8080' for i in range(args.clusters)]
+    rewriter = UrlRewriter({url: PROXY_URL for url in cluster_urls})
+    # Pages come from the last cluster: the legacy chain scans every cluster before it
+    pages = build_pages(cluster_urls[-1], args.rows)
+
+    mismatches = 0
+    print(f"clusters={args.clusters} iterations={args.iterations}")
+    print(f"{'page':8} {'bytes':>8} {'legacy us':>10} {'single us':>10} {'speedup':>8}")
+    for name, page in pages.items():
+        if legacy_rewrite(page, cluster_urls) != rewriter.rewrite(page):
+            mismatches += 1
+            print(f"mismatch page={name}")
+        legacy = measure(lambda: legacy_rewrite(page, cluster_urls), args.iterations)
+        single = measure(lambda: rewriter.rewrite(page), args.iterations)
+        print(f"{name:8} {len(page):8d} {legacy * 1e6:10.1f} {single * 1e6:10.1f} {legacy / single:7.1f}x")
+    print(f"mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
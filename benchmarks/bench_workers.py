@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: trino-gateway-proxy throughput with 1..N workers (DYRASQL_WORKERS).
+Starts a minimal coordinator that answers every statement poll with the same running page
+(stats, columns and rows, so the proxy rewrites and scans a realistic page), then the proxy in
+proxy mode with each worker count, and drives keep-alive polls through /c/<token>/ URLs from
+several load processes. Reports requests/s, speedup and scaling efficiency
+(rps_N / (N * rps_1)).
+
+The coordinator and the load processes need cores of their own: the check is only meaningful
+when the host has at least workers + --load-procs + --backend-procs cores (otherwise it is
+reported and skipped).
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--seconds 10] [--connections 64]
+                                          [--load-procs 2] [--backend-procs 1] [--min-efficiency 0.7]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'dyrasql-core'))
+
+from routing_token import RoutingTokens  # noqa: E402
+
+QUERY_ID = '20260101_120000_00042_x7k2p'
+SECRET = 'bench-workers'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def running_page(coordinator_url, rows):
+    page = {
+        'id': QUERY_ID,
+        'infoUri': f'{coordinator_url}/ui/query.html?{QUERY_ID}',
+        'partialCancelUri': f'{coordinator_url}/v1/statement/executing/partialCancel/{QUERY_ID}/0/y1/1',
+        'nextUri': f'{coordinator_url}/v1/statement/executing/{QUERY_ID}/y1/2',
+        'columns': [{'name': f'c{i}', 'type': 'varchar', 'typeSignature': {'rawType': 'varchar', 'arguments': []}}
+                    for i in range(6)],
+        'data': [[f'value-{row}-{i}' for i in range(6)] for row in range(rows)],
+        'stats': {'state': 'RUNNING', 'queued': False, 'scheduled': True, 'nodes': 4, 'totalSplits': 480,
+                  'completedSplits': 400, 'cpuTimeMillis': 324936, 'wallTimeMillis': 360844,
+                  'elapsedTimeMillis': 15213, 'processedRows': 4194304, 'processedBytes': 293601280},
+        'warnings': [],
+    }
+    return json.dumps(page).encode('utf-8')
+
+
+def serve_coordinator(port, rows):
+    """One coordinator process (SO_REUSEPORT): the same page for every request."""
+    body = running_page(f'http://127.0.0.1:{port}', rows)
+    response = (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: '
+                + str(len(body)).encode() + b'\r\n\r\n' + body)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                if not head:
+                    break
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', port, reuse_port=True, backlog=2048)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def load(port, path, connections, seconds, warmup):
+    """One load process: `connections` keep-alive clients; completed requests after warm-up."""
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+               'X-Trino-User: bench\r\nAccept-Encoding: identity\r\n\r\n').encode()
+
+    async def client(started, deadline, counts):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while time.monotonic() < deadline:
+                writer.write(request)
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line[:15].lower() == b'content-length:':
+                        length = int(line[15:])
+                await reader.readexactly(length)
+                if not head.startswith(b'HTTP/1.1 200'):
+                    counts['errors'] += 1
+                elif time.monotonic() >= started + warmup:
+                    counts['ok'] += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            counts['errors'] += 1
+        finally:
+            writer.close()
+
+    async def main():
+        counts = {'ok': 0, 'errors': 0}
+        started = time.monotonic()
+        await asyncio.gather(*(client(started, started + warmup + seconds, counts) for _ in range(connections)))
+        return counts
+
+    return asyncio.run(main())
+
+
+def wait_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_proxy(workers, proxy_port, coordinator_port, workdir):
+    registry = os.path.join(workdir, 'clusters.yaml')
+    with open(registry, 'w') as f:
+        f.write('default_tier: ecs\ntiers:\n')
+        f.write(f'  - {{name: ecs, url: "http://127.0.0.1:{coordinator_port}", max_score: 1.0, inclusive: true}}\n')
+    env = dict(
+        os.environ,
+        DYRASQL_WORKERS=str(workers),
+        DYRASQL_CLUSTER_REGISTRY=registry,
+        DYRASQL_ROUTING_TOKEN_SECRET=SECRET,
+        BYPASS_MODE='false',
+        PORT=str(proxy_port),
+        LOG_LEVEL='WARNING',
+        LOG_DIR=workdir,
+        DYRASQL_CORE_URL='http://127.0.0.1:9',
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'trino-gateway-proxy', 'app.py')],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def measure(workers, args, coordinator_port, workdir):
+    proxy_port = free_port()
+    proxy = run_proxy(workers, proxy_port, coordinator_port, workdir)
+    try:
+        if not wait_port(proxy_port):
+            raise RuntimeError(f'proxy with {workers} workers did not start')
+        time.sleep(1.0)
+        path = RoutingTokens(SECRET).prefix('ecs') + f'/v1/statement/executing/{QUERY_ID}/y1/1'
+        per_proc = max(1, args.connections // args.load_procs)
+        with multiprocessing.get_context('spawn').Pool(args.load_procs) as pool:
+            results = pool.starmap(load, [(proxy_port, path, per_proc, args.seconds, args.warmup)] * args.load_procs)
+        ok = sum(r['ok'] for r in results)
+        errors = sum(r['errors'] for r in results)
+        return ok / args.seconds, errors
+    finally:
+        proxy.terminate()
+        proxy.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker counts')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--connections', type=int, default=64, help='keep-alive connections in total')
+    parser.add_argument('--load-procs', type=int, default=2)
+    parser.add_argument('--backend-procs', type=int, default=1)
+    parser.add_argument('--rows', type=int, default=100, help='rows in the polled page')
+    parser.add_argument('--min-efficiency', type=float, default=0.7)
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.workers.split(',')]
+    cores = os.cpu_count() or 1
+    coordinator_port = free_port()
+    backends = [multiprocessing.get_context('spawn').Process(target=serve_coordinator, args=(coordinator_port, args.rows), daemon=True)
+                for _ in range(args.backend_procs)]
+    for backend in backends:
+        backend.start()
+    wait_port(coordinator_port)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench-workers-') as workdir:
+        try:
+            print(f"cores={cores} load_procs={args.load_procs} backend_procs={args.backend_procs} "
+                  f"connections={args.connections} seconds={args.seconds}")
+            print(f"{'workers':>7} {'req/s':>10} {'errors':>7} {'speedup':>8} {'efficiency':>10}")
+            for workers in counts:
+                rps, errors = measure(workers, args, coordinator_port, workdir)
+                results[workers] = rps
+                base = results.get(counts[0]) or rps
+                speedup = rps / base if base else 0.0
+                efficiency = speedup * counts[0] / workers
+                print(f"{workers:7d} {rps:10.0f} {errors:7d} {speedup:7.2f}x {efficiency:10.0%}")
+        finally:
+            for backend in backends:
+                backend.terminate()
+
+    top = max(counts)
+    needed = top + args.load_procs + args.backend_procs
+    if cores < needed:
+        print(f"efficiency not judged: {top} workers need {needed} cores, host has {cores}")
+        return 0
+    efficiency = results[top] / results[counts[0]] * counts[0] / top
+    print(f"efficiency at {top} workers: {efficiency:.0%} (min {args.min_efficiency:.0%})")
+    return 0 if efficiency >= args.min_efficiency else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
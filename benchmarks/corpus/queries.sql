@@ -0,0 +1,140 @@
+-- Anonymized statements as received by the proxy (schema, table, column and literal values
+-- replaced; structure, formatting and size kept). One statement per `-- name:` block.
+
+-- name: dashboard_daily_revenue
+SELECT date_trunc('day', o.created_at) AS dia,
+       o.channel,
+       count(*) AS pedidos,
+       sum(o.total_amount) AS receita
+FROM dw_vendas.pedidos o
+WHERE o.created_at >= DATE '2026-09-01'
+  AND o.created_at < DATE '2026-10-01'
+  AND o.status IN ('PAID', 'SHIPPED', 'DELIVERED')
+GROUP BY 1, 2
+ORDER BY 1, 2
+
+-- name: point_lookup
+select * from prod_db_core.clientes where cliente_id = 'c9f1e2a7-0b44-4d1b-9a55-2f0c3e8d6b11' limit 1
+
+-- name: quoted_identifiers
+SELECT "p"."sku", "p"."descricao", "e"."quantidade"
+FROM "dw_estoque"."produtos" "p"
+LEFT JOIN "dw_estoque"."estoque_atual" "e" ON "p"."sku" = "e"."sku"
+WHERE "e"."quantidade" < 10
+
+-- name: star_join_with_catalog
+SELECT d.ano, d.mes, l.regiao, c.segmento, sum(f.valor_liquido) AS valor
+FROM iceberg.dw_financeiro.fato_lancamentos f
+JOIN iceberg.dw_financeiro.dim_data d ON f.data_id = d.data_id
+JOIN iceberg.dw_financeiro.dim_loja l ON f.loja_id = l.loja_id
+JOIN iceberg.dw_financeiro.dim_cliente c ON f.cliente_id = c.cliente_id
+LEFT OUTER JOIN iceberg.dw_financeiro.dim_promocao p ON f.promocao_id = p.promocao_id
+WHERE d.ano = 2026 AND d.mes BETWEEN 1 AND 9
+GROUP BY d.ano, d.mes, l.regiao, c.segmento
+ORDER BY valor DESC
+LIMIT 500
+
+-- name: cte_pipeline
+WITH eventos AS (
+    SELECT user_id, event_name, event_timestamp,
+           lag(event_timestamp) OVER (PARTITION BY user_id ORDER BY event_timestamp) AS anterior
+    FROM prod_db_events.app_events
+    WHERE event_date >= current_date - INTERVAL '7' DAY
+),
+sessoes AS (
+    SELECT user_id, event_timestamp,
+           sum(CASE WHEN anterior IS NULL OR event_timestamp - anterior > INTERVAL '30' MINUTE THEN 1 ELSE 0 END)
+               OVER (PARTITION BY user_id ORDER BY event_timestamp) AS sessao
+    FROM eventos
+)
+SELECT user_id, sessao, min(event_timestamp) AS inicio, max(event_timestamp) AS fim, count(*) AS eventos
+FROM sessoes
+GROUP BY user_id, sessao
+
+-- name: nested_subqueries
+SELECT c.cliente_id, c.nome
+FROM dw_crm.clientes c
+WHERE c.cliente_id IN (
+    SELECT p.cliente_id FROM dw_vendas.pedidos p
+    WHERE p.total_amount > (SELECT avg(total_amount) FROM dw_vendas.pedidos WHERE created_at >= DATE '2026-01-01')
+)
+AND EXISTS (SELECT 1 FROM dw_crm.contatos t WHERE t.cliente_id = c.cliente_id AND t.canal = 'email')
+
+-- name: bi_tool_single_line
+SELECT "t0"."regiao" AS "d0", "t0"."categoria" AS "d1", SUM("t0"."valor") AS "m0", COUNT(DISTINCT "t0"."pedido_id") AS "m1" FROM (select p.regiao, i.categoria, i.valor, p.pedido_id from dw_vendas.pedidos p inner join dw_vendas.itens_pedido i on p.pedido_id = i.pedido_id where p.data_pedido >= date '2026-06-01') "t0" WHERE ("t0"."categoria" IN ('Eletronicos', 'Moveis', 'Vestuario', 'Alimentos')) GROUP BY "t0"."regiao", "t0"."categoria" LIMIT 1000001
+
+-- name: window_ranking
+select *
+from (
+  select vendedor_id, regiao, mes, valor,
+         rank() over (partition by regiao, mes order by valor desc) as posicao
+  from dw_comercial.metas_realizadas
+  where ano = 2026
+) ranked
+where posicao <= 10
+order by regiao, mes, posicao
+
+-- name: unnest_lateral
+SELECT o.pedido_id, item.sku, item.qtd
+FROM prod_db_core.pedidos_json o
+CROSS JOIN UNNEST(CAST(json_extract(o.payload, '$.itens') AS array(row(sku varchar, qtd integer)))) AS item(sku, qtd)
+WHERE o.dt = '2026-10-01'
+
+-- name: strings_and_comments
+-- relatório semanal (não alterar o filtro de data sem falar com o time de BI)
+SELECT id, 'where date from x.y join a.b' AS texto_literal, /* join dw.fake on 1 = 1 */ valor
+FROM dw_auditoria.registros
+WHERE descricao LIKE '%group by%' AND data_registro > DATE '2026-10-10'
+
+-- name: ctas_etl
+CREATE TABLE dw_staging.resumo_clientes_202610 AS
+SELECT c.cliente_id, c.segmento, count(p.pedido_id) AS pedidos, sum(p.total_amount) AS total
+FROM dw_crm.clientes c
+LEFT JOIN dw_vendas.pedidos p ON p.cliente_id = c.cliente_id AND p.created_at >= DATE '2026-10-01'
+GROUP BY 1, 2
+
+-- name: insert_select
+INSERT INTO dw_agregados.vendas_hora
+SELECT date_trunc('hour', created_at), loja_id, count(*), sum(total_amount)
+FROM dw_vendas.pedidos
+WHERE created_at >= timestamp '2026-10-17 00:00:00' AND created_at < timestamp '2026-10-18 00:00:00'
+GROUP BY 1, 2
+
+-- name: jdbc_columns
+SELECT TABLE_CAT, TABLE_SCHEM, TABLE_NAME, COLUMN_NAME, DATA_TYPE, TYPE_NAME, COLUMN_SIZE, BUFFER_LENGTH, DECIMAL_DIGITS, NUM_PREC_RADIX, NULLABLE, REMARKS, COLUMN_DEF, SQL_DATA_TYPE, SQL_DATETIME_SUB, CHAR_OCTET_LENGTH, ORDINAL_POSITION, IS_NULLABLE, SCOPE_CATALOG, SCOPE_SCHEMA, SCOPE_TABLE, SOURCE_DATA_TYPE, IS_AUTOINCREMENT, IS_GENERATEDCOLUMN
+FROM system.jdbc.columns
+WHERE TABLE_CAT = 'iceberg' AND TABLE_SCHEM LIKE 'dw\_vendas' ESCAPE '\' AND TABLE_NAME LIKE '%' ESCAPE '\'
+ORDER BY TABLE_CAT, TABLE_SCHEM, TABLE_NAME, ORDINAL_POSITION
+
+-- name: information_schema
+SELECT table_schema, table_name, column_name, data_type
+FROM iceberg.information_schema.columns
+WHERE table_schema = 'dw_vendas'
+
+-- name: case_heavy
+SELECT pedido_id,
+       CASE WHEN canal = 'APP' AND plataforma = 'IOS' THEN 'mobile_ios'
+            WHEN canal = 'APP' AND plataforma = 'ANDROID' THEN 'mobile_android'
+            WHEN canal = 'WEB' AND dispositivo = 'DESKTOP' THEN 'web_desktop'
+            WHEN canal = 'WEB' THEN 'web_mobile'
+            WHEN canal IN ('LOJA', 'QUIOSQUE') THEN 'fisico'
+            ELSE 'outros' END AS origem,
+       CASE WHEN total_amount >= 1000 THEN 'alto' WHEN total_amount >= 200 THEN 'medio' ELSE 'baixo' END AS faixa
+FROM dw_vendas.pedidos
+WHERE year(created_at) = 2026 AND month(created_at) = 10
+
+-- name: union_report
+SELECT 'pedidos' AS origem, count(*) FROM dw_vendas.pedidos WHERE created_at >= DATE '2026-10-01'
+UNION ALL
+SELECT 'devolucoes', count(*) FROM dw_vendas.devolucoes WHERE created_at >= DATE '2026-10-01'
+UNION ALL
+SELECT 'cancelamentos', count(*) FROM dw_vendas.cancelamentos WHERE created_at >= DATE '2026-10-01'
+
+-- name: full_outer_reconciliation
+SELECT coalesce(a.transacao_id, b.transacao_id) AS transacao_id, a.valor AS valor_erp, b.valor AS valor_banco
+FROM dw_financeiro.transacoes_erp a
+FULL OUTER JOIN dw_financeiro.transacoes_banco b ON a.transacao_id = b.transacao_id
+WHERE a.valor IS DISTINCT FROM b.valor
+
+-- name: keepalive
+SELECT 1
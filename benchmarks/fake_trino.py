@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fake Trino coordinator for protocol, performance and failure tests of both proxies, without a
+cluster. Speaks the client protocol: POST /v1/statement, then QUEUED and RUNNING pages, data
+pages and a FINISHED (or FAILED) page through nextUri; DELETE on a nextUri or /v1/query/{id}
+cancels (USER_CANCELED on the next poll). EXPLAIN (TYPE IO) answers the JSON QueryAnalyzer
+parses, with a deterministic size per table (1 MB .. 5 TB, or `tables` of the rule) so
+decisions spread over the tiers; EXPLAIN (TYPE DISTRIBUTED) answers a plan in Trino's text
+format. Also /v1/info, /v1/info/state and GET /v1/query/{id}.
+
+Behaviour is scripted per statement: the first rule whose `match` regex is found in the
+statement applies, over the defaults from the command line. Rule keys:
+  latency_ms, jitter_ms   every response          submit_ms, page_ms   extra on submit / polls
+  queued_pages            QUEUED pages (>= 1)     running_pages        RUNNING pages before rows
+  rows, page_rows         result volume and rows per data page; row_bytes: width of each row
+  error                   Trino error name (or {"name", "code", "type", "message"}) failing the
+                          query at page `error_page` (default: the first data page)
+  http_error              {"status": 503, "page": 0, "times": 1}: HTTP status instead of the
+                          page (`page` 0 is the submit) for the first `times` matching requests,
+                          so a client retry then succeeds
+  time_scale              multiplies the reported elapsed/cpu times (long queries, fast tests)
+  tables                  {"schema.table": size_bytes} for EXPLAIN (TYPE IO)
+  columns, data           fixed result instead of the generated (id, label) rows: columns as
+                          [[name, type], ...] and data as a list of rows, paged by page_rows
+Rules are a JSON list (--script FILE, or PUT /_fake/script at runtime); GET /_fake/stats
+returns the counters, POST /_fake/reset clears queries and counters.
+
+Usage: python benchmarks/fake_trino.py [--ports 18081] [--script rules.json] [--latency-ms 0]
+                                       [--rows 100] [--page-rows 1000] [--row-bytes 16]
+                                       [--queued-pages 1] [--running-pages 1] [--error NAME]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import time
+
+_TABLE = re.compile(r'\b(?:FROM|JOIN)\s+((?:"?[A-Za-z_][\w]*"?\.){0,2}"?[A-Za-z_][\w]*"?)', re.IGNORECASE)
+_QUERY_PATH = re.compile(r'^/v1/statement/(?:queued|executing)/([^/]+)/[^/]+/(\d+)')
+_EXPLAIN = re.compile(r'^\s*EXPLAIN\s*(?:\(([^)]*)\))?\s*(.*)$', re.IGNORECASE | re.DOTALL)
+
+DEFAULTS = {
+    'latency_ms': 0.0,
+    'jitter_ms': 0.0,
+    'submit_ms': 0.0,
+    'page_ms': 0.0,
+    'queued_pages': 1,
+    'running_pages': 1,
+    'rows': 100,
+    'page_rows': 1000,
+    'row_bytes': 16,
+    'error': None,
+    'error_page': None,
+    'http_error': None,
+    'time_scale': 1.0,
+    'tables': {},
+    'columns': None,
+    'data': None,
+}
+
+# Error name -> (errorCode, errorType), as in io.trino.spi.StandardErrorCode
+ERRORS = {
+    'GENERIC_USER_ERROR': (0, 'USER_ERROR'),
+    'SYNTAX_ERROR': (1, 'USER_ERROR'),
+    'ABANDONED_QUERY': (2, 'USER_ERROR'),
+    'USER_CANCELED': (3, 'USER_ERROR'),
+    'PERMISSION_DENIED': (4, 'USER_ERROR'),
+    'NOT_FOUND': (5, 'USER_ERROR'),
+    'CATALOG_NOT_FOUND': (44, 'USER_ERROR'),
+    'SCHEMA_NOT_FOUND': (45, 'USER_ERROR'),
+    'TABLE_NOT_FOUND': (46, 'USER_ERROR'),
+    'COLUMN_NOT_FOUND': (47, 'USER_ERROR'),
+    'GENERIC_INTERNAL_ERROR': (65536, 'INTERNAL_ERROR'),
+    'TOO_MANY_REQUESTS_FAILED': (65537, 'INTERNAL_ERROR'),
+    'REMOTE_TASK_ERROR': (65542, 'INTERNAL_ERROR'),
+    'GENERIC_INSUFFICIENT_RESOURCES': (131072, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_GLOBAL_MEMORY_LIMIT': (131073, 'INSUFFICIENT_RESOURCES'),
+    'QUERY_QUEUE_FULL': (131074, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_TIME_LIMIT': (131075, 'INSUFFICIENT_RESOURCES'),
+    'CLUSTER_OUT_OF_MEMORY': (131076, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_CPU_LIMIT': (131077, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_SPILL_LIMIT': (131078, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_LOCAL_MEMORY_LIMIT': (131079, 'INSUFFICIENT_RESOURCES'),
+    'ADMINISTRATIVELY_PREEMPTED': (131080, 'INSUFFICIENT_RESOURCES'),
+    'EXCEEDED_SCAN_LIMIT': (131081, 'INSUFFICIENT_RESOURCES'),
+}
+RESULT_COLUMNS = [
+    {'name': 'id', 'type': 'bigint', 'typeSignature': {'rawType': 'bigint', 'arguments': []}},
+    {'name': 'label', 'type': 'varchar', 'typeSignature': {'rawType': 'varchar', 'arguments': []}},
+]
+PLAN_COLUMNS = [{'name': 'Query Plan', 'type': 'varchar', 'typeSignature': {'rawType': 'varchar', 'arguments': []}}]
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found', 410: 'Gone',
+           429: 'Too Many Requests', 500: 'Internal Server Error', 502: 'Bad Gateway',
+           503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+
+async def pause(latency_ms, jitter_ms=0.0):
+    delay = latency_ms + (random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000.0)
+
+
+async def serve_http(handler, port, host='127.0.0.1'):
+    """
+    Minimal keep-alive HTTP/1.1 server for the stand-ins: `await handler(method, path, headers,
+    body)` returns (status, content type, body) or (status, content type, body, extra headers).
+    """
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', '0')))
+                status, content_type, payload, *extra = await handler(method, path, headers, body)
+                response = [f'HTTP/1.1 {status} {REASONS.get(status, "Unknown")}',
+                            f'Content-Type: {content_type}', f'Content-Length: {len(payload)}']
+                for key, value in (extra[0] if extra else {}).items():
+                    response.append(f'{key}: {value}')
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1') + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, backlog=2048)
+
+
+def table_size(table):
+    """Deterministic size per table, log-uniform between 1 MB and 5 TB."""
+    fraction = int(hashlib.sha256(table.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return 10 ** (6 + fraction * 6.7)
+
+
+def referenced_tables(statement):
+    """catalog.schema.table of each FROM/JOIN target (missing parts from iceberg.default)."""
+    tables = []
+    for name in dict.fromkeys(_TABLE.findall(statement)):
+        parts = name.replace('"', '').split('.')
+        tables.append(tuple((['iceberg', 'default'] + parts)[-3:]))
+    return tables
+
+
+def result_columns(columns):
+    """Trino column descriptors of a rule's [[name, type], ...]."""
+    return [{'name': name, 'type': kind, 'typeSignature': {'rawType': kind, 'arguments': []}} for name, kind in columns]
+
+
+def error_object(error, message=None):
+    if isinstance(error, dict):
+        name = error.get('name', 'GENERIC_INTERNAL_ERROR')
+        code, kind = ERRORS.get(name, (65536, 'INTERNAL_ERROR'))
+        code, kind, message = error.get('code', code), error.get('type', kind), error.get('message', message)
+    else:
+        name = error
+        code, kind = ERRORS.get(name, (65536, 'INTERNAL_ERROR'))
+    message = message or f'Query failed: {name} (fake_trino)'
+    return {'message': message, 'errorCode': code, 'errorName': name, 'errorType': kind,
+            'failureInfo': {'type': 'io.trino.spi.TrinoException', 'message': message,
+                            'suppressed': [], 'stack': []}}
+
+
+class Query:
+    __slots__ = ('id', 'statement', 'user', 'rule', 'columns', 'rows', 'plan', 'submitted', 'sent_rows',
+                 'canceled', 'done', 'error_page', 'pages')
+
+    def __init__(self, query_id, statement, user, rule, plan=None):
+        self.id = query_id
+        self.statement = statement
+        self.user = user
+        self.rule = rule
+        self.plan = plan
+        if plan is not None:
+            self.columns, self.rows = PLAN_COLUMNS, 1
+        elif rule['data'] is not None:
+            self.columns, self.rows = result_columns(rule['columns'] or []), len(rule['data'])
+        else:
+            self.columns, self.rows = RESULT_COLUMNS, max(0, int(rule['rows']))
+        self.submitted = time.monotonic()
+        self.sent_rows = 0
+        self.canceled = False
+        self.done = False
+        first_data = rule['queued_pages'] + rule['running_pages']
+        data_pages = math.ceil(self.rows / max(1, rule['page_rows'])) if plan is None else 1
+        # Pages: QUEUED..., RUNNING..., data..., FINISHED
+        self.pages = first_data + data_pages + 1
+        self.error_page = None
+        if rule['error']:
+            self.error_page = rule['error_page'] if rule['error_page'] is not None else first_data
+
+
+class FakeTrino:
+    """One coordinator; `base_url` is what its nextUri/infoUri point at."""
+
+    def __init__(self, base_url, defaults=None, rules=None):
+        self.base_url = base_url.rstrip('/')
+        self.defaults = dict(DEFAULTS, **(defaults or {}))
+        self.queries = {}
+        self.set_rules(rules or [])
+        self.counters = {}
+        self._ids = itertools.count()
+        self._data = {}
+        self.started = time.time()
+
+    def set_rules(self, rules):
+        self.rules = [(re.compile(r.get('match') or '', re.IGNORECASE | re.DOTALL), dict(self.defaults, **r))
+                      for r in rules]
+        self.http_errors = {}
+
+    def count(self, key, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def rule(self, statement):
+        for pattern, rule in self.rules:
+            if pattern.search(statement):
+                return rule
+        return self.defaults
+
+    def _query_id(self):
+        n = next(self._ids)
+        return f"{time.strftime('%Y%m%d_%H%M%S', time.gmtime())}_{n % 100000:05d}_{n // 100000:05x}"
+
+    def explain(self, options, statement, rule):
+        """Plan text of EXPLAIN with `options` (e.g. 'TYPE IO, FORMAT JSON')."""
+        tables = referenced_tables(statement)
+        sizes = {}
+        for catalog, schema, table in tables:
+            name = f'{catalog}.{schema}.{table}'
+            sizes[name] = rule['tables'].get(f'{schema}.{table}', rule['tables'].get(name, table_size(name)))
+        kind = (options or '').upper()
+        if 'TYPE IO' in kind:
+            inputs = [{
+                'table': {'catalog': c, 'schemaTable': {'schema': s, 'table': t}},
+                'columnConstraints': [],
+                'estimate': {'outputRowCount': sizes[f'{c}.{s}.{t}'] / 120, 'outputSizeInBytes': sizes[f'{c}.{s}.{t}'],
+                             'cpuCost': sizes[f'{c}.{s}.{t}'], 'maxMemory': 0.0, 'networkCost': 0.0},
+            } for c, s, t in tables]
+            total = sum(sizes.values())
+            return json.dumps({'inputTableColumnInfos': inputs,
+                               'estimate': {'outputRowCount': total / 120, 'outputSizeInBytes': total,
+                                            'cpuCost': total, 'maxMemory': 0.0, 'networkCost': 0.0}}, indent=2)
+        fragments = ['Fragment 0 [SINGLE]\n    Output layout: [id, label]\n    Output partitioning: SINGLE []\n'
+                     '    Output[columnNames = [id, label]]\n    └─ RemoteSource[sourceFragmentIds = [1]]']
+        for i, (c, s, t) in enumerate(tables, start=1):
+            size = sizes[f'{c}.{s}.{t}']
+            fragments.append(
+                f'Fragment {i} [SOURCE]\n    Output layout: [id, label]\n    Output partitioning: SINGLE []\n'
+                f'    TableScan[table = {c}:{s}.{t}$data@{int(size) % 10 ** 12}]\n'
+                f'        Layout: [id:bigint, label:varchar]\n'
+                f'        Estimates: est. {size / 120:.0f} rows, {size / 1024 ** 3:.2f} GB')
+        return '\n\n'.join(fragments)
+
+    def _data_json(self, start, count, width):
+        """Serialized rows of one data page (cached per shape; ids are rebased per page)."""
+        key = (count, width)
+        cached = self._data.get(key)
+        if cached is None:
+            label = 'x' * max(0, width - 8)
+            cached = self._data[key] = json.dumps([[i, label] for i in range(count)], separators=(',', ':'))
+        return cached if start == 0 else json.dumps([[start + i, 'x' * max(0, width - 8)] for i in range(count)],
+                                                     separators=(',', ':'))
+
+    def page(self, query, token):
+        """Page `token` of the query as bytes, in Trino's field order (stats after data)."""
+        rule = query.rule
+        first_data = rule['queued_pages'] + rule['running_pages']
+        failed = query.canceled or (query.error_page is not None and token >= query.error_page)
+        last = failed or token >= query.pages - 1
+        if failed:
+            state = 'FAILED'
+        elif last:
+            state = 'FINISHED'
+        elif token < rule['queued_pages']:
+            state = 'QUEUED'
+        else:
+            state = 'RUNNING'
+        stage = 'queued' if token < rule['queued_pages'] else 'executing'
+        head = {'id': query.id, 'infoUri': f'{self.base_url}/ui/query.html?{query.id}'}
+        if not last:
+            head['partialCancelUri'] = f'{self.base_url}/v1/stage/{query.id}.0'
+            head['nextUri'] = f'{self.base_url}/v1/statement/{stage}/{query.id}/y{token + 1}/{token + 1}'
+        if token >= first_data and not failed:
+            head['columns'] = query.columns
+        parts = [json.dumps(head, separators=(',', ':'))[:-1]]
+
+        data_count = 0
+        if not failed and first_data <= token < query.pages - 1:
+            if query.plan is not None:
+                parts.append(',"data":' + json.dumps([[query.plan]]))
+                data_count = 1
+            else:
+                start = (token - first_data) * rule['page_rows']
+                data_count = min(rule['page_rows'], query.rows - start)
+                if data_count > 0 and rule['data'] is not None:
+                    parts.append(',"data":' + json.dumps(rule['data'][start:start + data_count], separators=(',', ':')))
+                elif data_count > 0:
+                    parts.append(',"data":' + self._data_json(start, data_count, rule['row_bytes']))
+            query.sent_rows += data_count
+
+        scale = rule['time_scale']
+        elapsed = int((time.monotonic() - query.submitted) * 1000 * scale)
+        queued = token < rule['queued_pages']
+        stats = {
+            'state': state, 'queued': queued, 'scheduled': not queued, 'nodes': 1 if queued else 3,
+            'totalSplits': query.pages, 'queuedSplits': 0, 'runningSplits': 0 if last else 1,
+            'completedSplits': token, 'cpuTimeMillis': elapsed // 2, 'wallTimeMillis': elapsed,
+            'queuedTimeMillis': 0 if queued else min(elapsed, 5), 'elapsedTimeMillis': elapsed,
+            'processedRows': query.sent_rows, 'processedBytes': query.sent_rows * rule['row_bytes'],
+            'physicalInputBytes': query.sent_rows * rule['row_bytes'], 'peakMemoryBytes': 1 << 20,
+            'spilledBytes': 0,
+        }
+        if not last:
+            stats['progressPercentage'] = round(100.0 * token / query.pages, 1)
+        parts.append(',"stats":' + json.dumps(stats, separators=(',', ':')))
+        if failed:
+            error = 'USER_CANCELED' if query.canceled else rule['error']
+            parts.append(',"error":' + json.dumps(error_object(error, 'Query was canceled' if query.canceled else None)))
+        parts.append(',"warnings":[]}')
+
+        self.count('pages')
+        self.count('rows', data_count)
+        if last:
+            query.done = True
+            self.queries.pop(query.id, None)
+            self.count('canceled' if query.canceled else 'failed' if failed else 'finished')
+        return ''.join(parts).encode()
+
+    def submit(self, statement, user):
+        explain = _EXPLAIN.match(statement)
+        rule = self.rule(statement)
+        plan = self.explain(explain.group(1), explain.group(2), rule) if explain else None
+        query = Query(self._query_id(), statement, user, rule, plan)
+        self.queries[query.id] = query
+        self.count('explains' if explain else 'submitted')
+        return query
+
+    def http_error(self, query, token):
+        spec = query.rule['http_error']
+        sent = self.http_errors.get(id(query.rule), 0)
+        if not spec or spec.get('page', 0) != token or sent >= spec.get('times', 1):
+            return None
+        self.http_errors[id(query.rule)] = sent + 1
+        self.count('http_errors')
+        return spec.get('status', 503)
+
+    async def __call__(self, method, path, headers, body):
+        path = path.split('?', 1)[0]
+        if path.startswith('/_fake/'):
+            return self.control(method, path, body)
+        if method == 'POST' and path.rstrip('/') == '/v1/statement':
+            query = self.submit(body.decode('utf-8', 'replace').strip(), headers.get('x-trino-user'))
+            rule = query.rule
+            await pause(rule['latency_ms'] + rule['submit_ms'], rule['jitter_ms'])
+            status = self.http_error(query, 0)
+            if status:
+                # The client sees no query: forget it, as a coordinator that failed the submit
+                self.queries.pop(query.id, None)
+                return status, 'text/plain', f'fake_trino: HTTP {status}'.encode()
+            return 200, 'application/json', self.page(query, 0)
+
+        match = _QUERY_PATH.match(path)
+        if match:
+            query = self.queries.get(match.group(1))
+            token = int(match.group(2))
+            if method == 'DELETE':
+                if query is not None:
+                    query.canceled = True
+                    self.count('cancel_requests')
+                return 204, 'text/plain', b''
+            if query is None:
+                return 410, 'text/plain', b'Query not found (finished, canceled or never submitted)'
+            self.count('polls')
+            rule = query.rule
+            await pause(rule['latency_ms'] + rule['page_ms'], rule['jitter_ms'])
+            status = self.http_error(query, token)
+            if status:
+                return status, 'text/plain', f'fake_trino: HTTP {status}'.encode()
+            return 200, 'application/json', self.page(query, token)
+
+        if path.startswith('/v1/query/'):
+            query_id = path[len('/v1/query/'):].strip('/')
+            query = self.queries.get(query_id)
+            if method == 'DELETE':
+                if query is not None:
+                    query.canceled = True
+                    self.count('cancel_requests')
+                return 204, 'text/plain', b''
+            if query is None:
+                return 404, 'text/plain', b'Query not found'
+            return 200, 'application/json', json.dumps({
+                'queryId': query.id, 'state': 'RUNNING', 'query': query.statement,
+                'session': {'user': query.user}, 'self': f'{self.base_url}/v1/query/{query.id}'}).encode()
+        if path == '/v1/info/state':
+            return 200, 'application/json', b'"ACTIVE"'
+        if path.startswith('/v1/info'):
+            return 200, 'application/json', json.dumps({
+                'nodeVersion': {'version': '467'}, 'environment': 'fake', 'coordinator': True, 'starting': False,
+                'uptime': f'{(time.time() - self.started) / 60:.2f}m'}).encode()
+        return 404, 'text/plain', b'Not Found'
+
+    def control(self, method, path, body):
+        if path == '/_fake/stats':
+            return 200, 'application/json', json.dumps({'active': len(self.queries), **self.counters}).encode()
+        if path == '/_fake/script' and method in ('PUT', 'POST'):
+            self.set_rules(json.loads(body or b'[]'))
+            return 200, 'application/json', json.dumps({'rules': len(self.rules)}).encode()
+        if path == '/_fake/reset' and method == 'POST':
+            self.queries.clear()
+            self.counters.clear()
+            self.http_errors.clear()
+            return 200, 'application/json', b'{}'
+        return 404, 'text/plain', b'Not Found'
+
+
+async def run(ports, defaults=None, rules=None, host='127.0.0.1'):
+    """Serves one FakeTrino per port until cancelled."""
+    servers = []
+    for port in ports:
+        servers.append(await serve_http(FakeTrino(f'http://{host}:{port}', defaults, rules), port, host))
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ports', default='18081', help='one coordinator per port (e.g. one per tier)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--script', help='JSON list of rules')
+    for key, value in DEFAULTS.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key != 'error_page':
+            parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument('--error', help='fail every query with this Trino error name')
+    args = parser.parse_args()
+
+    defaults = {key: getattr(args, key) for key in DEFAULTS if hasattr(args, key)}
+    rules = []
+    if args.script:
+        with open(args.script) as f:
+            rules = json.load(f)
+    ports = [int(p) for p in args.ports.split(',')]
+    print(f"fake trino on {', '.join(f'http://{args.host}:{p}' for p in ports)} ({len(rules)} rules)")
+    try:
+        asyncio.run(run(ports, defaults, rules, args.host))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
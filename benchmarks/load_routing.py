@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test: the routing path end to end (POST /api/v1/route on the core, POST /v1/statement and
+its nextUri polls through the proxy or the core) at a fixed arrival rate.
+Starts the stand-ins of stubs.py (fake Trino coordinators per tier, fake DynamoDB, each with
+--*-latency-ms), dyrasql-core and trino-gateway-proxy against them, then sends requests open
+loop (arrivals do not wait for responses, so a slowdown shows as latency instead of a lower
+offered rate) from a seeded query mix:
+  cached   - statements from a pool of --distinct queries, decided once then served from cache
+  unique   - a statement never seen before (EXPLAIN + history write on every one)
+  catalog  - IDE discovery statements (SHOW CATALOGS, information_schema); SHOW statements are
+             answered by the proxy's catalog cache once loaded, whose counters are reported
+  probe    - keepalive queries (SELECT 1)
+Reports p50/p99/p999 latency, throughput and error rate per endpoint and query kind; for
+statements `submit` is the first response and `complete` the whole query through its last
+page. --save-baseline stores the report; --baseline compares against one and exits 1 on a
+regression beyond --tolerance. Baselines only hold on the host (and settings) they were
+recorded with.
+
+Usage: python benchmarks/load_routing.py [--qps 50] [--duration 30] [--warmup 5]
+                                         [--mix cached=60,unique=25,catalog=10,probe=5]
+                                         [--endpoints statement=80,route=20] [--target proxy]
+                                         [--trino-latency-ms 5] [--dynamodb-latency-ms 3]
+                                         [--save-baseline FILE | --baseline FILE --tolerance 0.2]
+       python benchmarks/load_routing.py --no-spawn --core-url URL --proxy-url URL ...
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+
+SECRET = 'load-routing'
+TIERS = ('ecs', 'emr-standard', 'emr-optimized')
+# Minimum samples before a percentile is compared with the baseline
+MIN_SAMPLES = {'p50': 20, 'p99': 200, 'p999': 2000}
+
+SCHEMAS = ('sales', 'events', 'finance', 'marketing')
+TEMPLATES = (
+    "SELECT * FROM {s}.{t} WHERE region = 'eu' LIMIT 100",
+    "SELECT o.customer, sum(o.amount) FROM {s}.{t} o JOIN {s}.{u} c ON o.customer = c.id "
+    "WHERE o.day >= DATE '2026-01-01' GROUP BY o.customer ORDER BY 2 DESC",
+    "SELECT user_id, event, row_number() OVER (PARTITION BY user_id ORDER BY ts) AS n "
+    "FROM {s}.{t} WHERE ts > current_timestamp - INTERVAL '1' DAY",
+)
+CATALOG = (
+    'SHOW CATALOGS',
+    'SHOW SCHEMAS FROM iceberg',
+    "SELECT table_schema, table_name FROM information_schema.tables WHERE table_catalog = 'iceberg'",
+    "SELECT table_name, column_name, data_type FROM information_schema.columns WHERE table_schema = 'sales'",
+)
+PROBES = ('SELECT 1', 'select 1', 'SELECT version()')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def parse_weights(value, names):
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in names:
+            raise argparse.ArgumentTypeError(f'unknown name {name!r} (expected one of {", ".join(names)})')
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def letters(n):
+    """Identifier suffix from a number; digits would be normalised away by the fingerprint."""
+    out = ''
+    while True:
+        n, r = divmod(n, 26)
+        out = string.ascii_lowercase[r] + out
+        if n == 0:
+            return out
+
+
+class Workload:
+    """Seeded query mix: the same arguments produce the same sequence of statements."""
+
+    def __init__(self, mix, distinct, seed):
+        self.random = random.Random(seed)
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.pool = [self.statement(f'tbl_{letters(i)}') for i in range(distinct)]
+        self.unique = 0
+
+    def statement(self, table):
+        template = self.random.choice(TEMPLATES)
+        return template.format(s=self.random.choice(SCHEMAS), t=table, u=f'{table}_dim')
+
+    def next(self):
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == 'cached':
+            return kind, self.random.choice(self.pool)
+        if kind == 'unique':
+            self.unique += 1
+            return kind, self.statement(f'adhoc_{letters(self.unique)}_{letters(self.random.randrange(26 ** 4))}')
+        if kind == 'catalog':
+            return kind, self.random.choice(CATALOG)
+        return kind, self.random.choice(PROBES)
+
+
+class Recorder:
+    """Latencies and errors per (endpoint, kind), ignoring what completes during the warm-up."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.recording = False
+
+    def add(self, endpoint, kind, seconds, ok):
+        if not self.recording:
+            return
+        for key in (endpoint, f'{endpoint}:{kind}'):
+            self.samples.setdefault(key, []).append(seconds)
+            if not ok:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def rebase(uri, base):
+    """nextUri on `base`: the services advertise their docker-compose ports (8080, 5001), not ours."""
+    parts = urlsplit(uri)
+    return f"{base}{parts.path}{'?' + parts.query if parts.query else ''}"
+
+
+async def route(client, core_url, kind, query, recorder):
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = await client.post(f'{core_url}/api/v1/route', json={'query': query})
+        ok = response.status_code == 200 and 'cluster' in response.json()
+    except (httpx.HTTPError, ValueError):
+        pass
+    recorder.add('route', kind, time.perf_counter() - started, ok)
+
+
+async def statement(client, url, kind, query, recorder):
+    headers = {'X-Trino-User': 'load', 'X-Trino-Source': 'load_routing'}
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = await client.post(f'{url}/v1/statement', content=query.encode(), headers=headers)
+        page = response.json() if response.status_code == 200 else {}
+        recorder.add('submit', kind, time.perf_counter() - started, 'id' in page)
+        while page.get('nextUri'):
+            response = await client.get(rebase(page['nextUri'], url), headers=headers)
+            page = response.json() if response.status_code == 200 else {}
+        ok = 'id' in page and not page.get('error') and page.get('stats', {}).get('state') == 'FINISHED'
+    except (httpx.HTTPError, ValueError):
+        pass
+    recorder.add('complete', kind, time.perf_counter() - started, ok)
+
+
+async def generate(args, core_url, statement_url):
+    workload = Workload(args.mix, args.distinct, args.seed)
+    endpoints = random.Random(args.seed + 1)
+    names, weights = list(args.endpoints), list(args.endpoints.values())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    inflight = set()
+    shed = 0
+    total = args.warmup + args.duration
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            elapsed = time.perf_counter() - started
+            if elapsed >= total:
+                break
+            recorder.recording = elapsed >= args.warmup
+            due = int(elapsed * args.qps) + 1
+            while sent < due:
+                sent += 1
+                kind, query = workload.next()
+                endpoint = endpoints.choices(names, weights)[0]
+                if len(inflight) >= args.max_inflight:
+                    # Over the client's own limit: counted, not sent
+                    shed += recorder.recording
+                    continue
+                if endpoint == 'route':
+                    task = asyncio.ensure_future(route(client, core_url, kind, query, recorder))
+                else:
+                    task = asyncio.ensure_future(statement(client, statement_url, kind, query, recorder))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            await asyncio.sleep(max(0.0, (sent / args.qps) - (time.perf_counter() - started)))
+        # Requests sent in the window finish (and count) after it
+        if inflight:
+            await asyncio.wait(inflight, timeout=args.timeout)
+        window = time.perf_counter() - started - args.warmup
+    return recorder, shed, window
+
+
+def summarize(recorder, shed, window):
+    results = {}
+    for key, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        errors = recorder.errors.get(key, 0)
+        results[key] = {
+            'count': len(ordered),
+            'p50_ms': percentile(ordered, 0.50) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000,
+            'p999_ms': percentile(ordered, 0.999) * 1000,
+            'throughput': (len(ordered) - errors) / window,
+            'error_rate': errors / len(ordered),
+        }
+    return {'window_seconds': window, 'shed': shed, 'results': results}
+
+
+def compare(report, baseline, tolerance, min_delta_ms, max_error_increase):
+    """Regressions of `report` against `baseline`, as printable lines."""
+    regressions = []
+    for key, base in baseline['results'].items():
+        current = report['results'].get(key)
+        if current is None:
+            continue
+        for name, minimum in MIN_SAMPLES.items():
+            if min(base['count'], current['count']) < minimum:
+                continue
+            before, after = base[f'{name}_ms'], current[f'{name}_ms']
+            if after > before * (1 + tolerance) and after - before > min_delta_ms:
+                regressions.append(f'{key} {name} {before:.2f} -> {after:.2f} ms')
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{key} throughput {base['throughput']:.1f} -> {current['throughput']:.1f} /s")
+        if current['error_rate'] > base['error_rate'] + max_error_increase:
+            regressions.append(f"{key} error rate {base['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    return regressions
+
+
+def spawn_services(args, workdir):
+    """Stand-ins, core and proxy as child processes; returns (processes, core URL, proxy URL)."""
+    trino_ports = [free_port() for _ in TIERS]
+    dynamodb_port = free_port()
+    stand_ins = multiprocessing.get_context('spawn').Process(
+        target=stubs.serve_stubs, daemon=True,
+        args=(trino_ports, dynamodb_port, args.pages, args.rows, args.trino_latency_ms,
+              args.dynamodb_latency_ms, args.jitter_ms),
+    )
+    stand_ins.start()
+
+    registry = os.path.join(workdir, 'clusters.yaml')
+    with open(registry, 'w') as f:
+        f.write(f'default_tier: {TIERS[1]}\ntiers:\n')
+        f.write(f'  - {{name: {TIERS[0]}, url: "http://127.0.0.1:{trino_ports[0]}", max_score: 0.3}}\n')
+        f.write(f'  - {{name: {TIERS[1]}, url: "http://127.0.0.1:{trino_ports[1]}", max_score: 0.7, inclusive: true}}\n')
+        f.write(f'  - {{name: {TIERS[2]}, url: "http://127.0.0.1:{trino_ports[2]}"}}\n')
+    # boto3 needs a profile to open the session; the stand-in accepts any credentials
+    with open(os.path.join(workdir, 'aws-config'), 'w') as f:
+        f.write('[default]\nregion = us-east-1\n')
+    with open(os.path.join(workdir, 'aws-credentials'), 'w') as f:
+        f.write('[default]\naws_access_key_id = load\naws_secret_access_key = load\n')
+
+    core_port, proxy_port = free_port(), free_port()
+    common = dict(
+        os.environ,
+        DYRASQL_CLUSTER_REGISTRY=registry,
+        DYRASQL_ROUTING_TOKEN_SECRET=SECRET,
+        DYRASQL_WORKERS=str(args.workers),
+        BYPASS_MODE='false',
+        TRINO_URL=f'http://127.0.0.1:{trino_ports[0]}',
+        SAVE_EXPLAINS='false',
+        AWS_ENDPOINT_URL=f'http://127.0.0.1:{dynamodb_port}',
+        AWS_CONFIG_FILE=os.path.join(workdir, 'aws-config'),
+        AWS_SHARED_CREDENTIALS_FILE=os.path.join(workdir, 'aws-credentials'),
+        AWS_PROFILE='default',
+        AWS_EC2_METADATA_DISABLED='true',
+        LOG_LEVEL='WARNING',
+        LOG_DIR=workdir,
+    )
+    processes = [stand_ins]
+    output = None if args.verbose else subprocess.DEVNULL
+    processes.append(subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'dyrasql-core', 'app.py')],
+        env=dict(common, PORT=str(core_port)), stdout=output, stderr=output,
+    ))
+    processes.append(subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'trino-gateway-proxy', 'app.py')],
+        env=dict(common, PORT=str(proxy_port), DYRASQL_CORE_URL=f'http://127.0.0.1:{core_port}',
+                 DYRASQL_ROUTING_MODE=args.routing_mode, TRINO_GATEWAY_URL=f'http://127.0.0.1:{trino_ports[1]}'),
+        stdout=output, stderr=output,
+    ))
+    for port in trino_ports + [dynamodb_port, core_port, proxy_port]:
+        if not wait_port(port):
+            stop(processes)
+            raise RuntimeError(f'service on port {port} did not start (rerun with --verbose)')
+    return processes, f'http://127.0.0.1:{core_port}', f'http://127.0.0.1:{proxy_port}'
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        if isinstance(process, subprocess.Popen):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        else:
+            process.join(timeout=10)
+
+
+def catalog_cache_counters(proxy_url):
+    """The proxy's catalog cache counters (merged across workers), None when unavailable."""
+    try:
+        stats = httpx.get(f'{proxy_url}/api/v1/workers', timeout=5).json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    return (stats.get('totals') or stats).get('catalog_cache')
+
+
+def print_report(report):
+    print(f"{'endpoint:kind':<22} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9} {'per s':>8} {'errors':>7}")
+    for key, r in report['results'].items():
+        print(f"{key:<22} {r['count']:>7} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['p999_ms']:>9.2f} "
+              f"{r['throughput']:>8.1f} {r['error_rate']:>7.2%}")
+    cache = report.get('catalog_cache')
+    if cache:
+        print("proxy catalog_cache " + " ".join(f"{k}={cache.get(k)}" for k in ('hits', 'misses', 'loads', 'load_failures')))
+    if report['shed']:
+        print(f"{report['shed']} arrivals not sent (--max-inflight reached): the services cannot keep up with --qps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--qps', type=float, default=50, help='arrivals per second')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds sent before measuring')
+    parser.add_argument('--mix', default='cached=60,unique=25,catalog=10,probe=5',
+                        type=lambda v: parse_weights(v, ('cached', 'unique', 'catalog', 'probe')))
+    parser.add_argument('--endpoints', default='statement=80,route=20',
+                        type=lambda v: parse_weights(v, ('statement', 'route')))
+    parser.add_argument('--target', choices=('proxy', 'core'), default='proxy', help='where statements are sent')
+    parser.add_argument('--distinct', type=int, default=200, help='queries in the cached pool')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-inflight', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=1, help='DYRASQL_WORKERS of both services')
+    parser.add_argument('--routing-mode', choices=('embedded', 'remote'), default='embedded')
+    parser.add_argument('--pages', type=int, default=3, help='fake Trino data pages per query')
+    parser.add_argument('--rows', type=int, default=50, help='fake Trino rows per page')
+    parser.add_argument('--trino-latency-ms', type=float, default=5)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=3)
+    parser.add_argument('--jitter-ms', type=float, default=1)
+    parser.add_argument('--no-spawn', action='store_true', help='use running services (--core-url, --proxy-url)')
+    parser.add_argument('--core-url', default='http://localhost:5000')
+    parser.add_argument('--proxy-url', default='http://localhost:8080')
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='fail on a regression against this report')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative latency/throughput change')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='latency changes below this never fail')
+    parser.add_argument('--max-error-increase', type=float, default=0.01)
+    parser.add_argument('--verbose', action='store_true', help='show the services output')
+    args = parser.parse_args()
+
+    settings = {name: getattr(args, name) for name in (
+        'qps', 'duration', 'warmup', 'mix', 'endpoints', 'target', 'distinct', 'seed', 'workers',
+        'routing_mode', 'pages', 'rows', 'trino_latency_ms', 'dynamodb_latency_ms', 'jitter_ms')}
+    with tempfile.TemporaryDirectory() as workdir:
+        processes = []
+        if args.no_spawn:
+            core_url, proxy_url = args.core_url.rstrip('/'), args.proxy_url.rstrip('/')
+        else:
+            processes, core_url, proxy_url = spawn_services(args, workdir)
+        try:
+            print(f"{args.qps:g} qps for {args.duration:g}s (+{args.warmup:g}s warm-up), statements to {args.target}")
+            recorder, shed, window = asyncio.run(
+                generate(args, core_url, proxy_url if args.target == 'proxy' else core_url))
+            cache = catalog_cache_counters(proxy_url) if args.target == 'proxy' else None
+        finally:
+            stop(processes)
+    report = dict(summarize(recorder, shed, window), settings=settings, catalog_cache=cache)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    changed = [name for name, value in baseline.get('settings', {}).items() if settings.get(name) != value]
+    if changed:
+        print(f"warning: settings differ from the baseline ({', '.join(changed)}); comparison may not hold")
+    regressions = compare(report, baseline, args.tolerance, args.min_delta_ms, args.max_error_increase)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    print('FAIL' if regressions else f'OK (within {args.tolerance:.0%} of {args.baseline})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Soak test: QueryClusterMap under sustained submit/poll/complete traffic.
+Most queries finish (terminal page or DELETE); a share is abandoned and only leaves through
+TTL/LRU, like bypass-mode queries. Samples entries, map size and process RSS per interval and
+fails when the second half of the run grew more than --max-growth over the first half.
+
+Usage: python benchmarks/soak_query_map.py [--seconds 60] [--rate 2000] [--abandon 0.1]
+                                           [--ttl 5] [--max-entries 20000]
+                                           [--backend memory|sqlite|redis] [--url ...]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from query_map import QueryClusterMap, backend_from_env  # noqa: E402
+
+CLUSTERS = ('ecs', 'emr-standard', 'emr-optimized')
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+async def run(args):
+    os.environ['DYRASQL_QUERY_MAP_TTL_SECONDS'] = str(args.ttl)
+    os.environ['DYRASQL_QUERY_MAP_MAX_ENTRIES'] = str(args.max_entries)
+    os.environ['DYRASQL_QUERY_MAP_BACKEND'] = args.backend
+    if args.url:
+        os.environ['DYRASQL_QUERY_MAP_URL'] = args.url
+    query_map = QueryClusterMap(backend_from_env(args.ttl))
+    query_map.start(interval=min(1.0, args.ttl))
+
+    rng = random.Random(args.seed)
+    in_flight = []
+    samples = []
+    counter = 0
+    ops = 0
+    started = time.monotonic()
+    next_sample = started
+    tick = 0.05
+    while time.monotonic() - started < args.seconds:
+        # Submissions for this tick
+        for _ in range(int(args.rate * tick)):
+            counter += 1
+            query_id = f"20260101_000000_{counter:05d}_{counter:x}"
+            await query_map.set(query_id, CLUSTERS[counter % len(CLUSTERS)])
+            in_flight.append((query_id, rng.randint(1, 5)))
+            ops += 1
+        # One poll per in-flight query; finish or abandon when its pages run out
+        still = []
+        for query_id, pages in in_flight:
+            await query_map.get(query_id)
+            ops += 1
+            if pages > 1:
+                still.append((query_id, pages - 1))
+            elif rng.random() >= args.abandon:
+                query_map.discard(query_id)
+        in_flight = still
+        await asyncio.sleep(tick)
+        if time.monotonic() >= next_sample:
+            next_sample += args.sample
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append((time.monotonic() - started, len(query_map), query_map.memory_bytes(), current, rss_bytes()))
+            print(f"t={samples[-1][0]:6.1f}s entries={samples[-1][1]:7d} map_bytes={samples[-1][2]:10d} "
+                  f"traced={current:11d} rss={samples[-1][4]:11d}")
+
+    elapsed = time.monotonic() - started
+    snapshot = await query_map.snapshot()
+    print(f"queries={counter} ops={ops} ops_per_s={ops / elapsed:.0f}")
+    print("snapshot " + " ".join(f"{k}={v}" for k, v in snapshot.items()))
+
+    # Skip the warm-up (first TTL) before comparing the two halves
+    warm = [s for s in samples if s[0] > args.ttl * 1.5]
+    half = len(warm) // 2
+    if half < 2:
+        print(f"too few samples after the {args.ttl * 1.5:.1f}s warm-up to judge growth "
+              f"(got {len(warm)}, need 4): raise --seconds or lower --sample")
+        return 1
+    first = max(s[3] for s in warm[:half])
+    second = max(s[3] for s in warm[half:])
+    growth = (second - first) / float(first) if first else 0.0
+    print(f"traced_peak first_half={first} second_half={second} growth={growth:.1%}")
+    return 1 if growth > args.max_growth else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--rate', type=int, default=2000, help='submitted queries per second')
+    parser.add_argument('--abandon', type=float, default=0.1, help='share of queries never completed')
+    parser.add_argument('--ttl', type=float, default=5)
+    parser.add_argument('--max-entries', type=int, default=20000)
+    parser.add_argument('--backend', default='memory', choices=('memory', 'sqlite', 'redis'))
+    parser.add_argument('--url', default='', help='sqlite path or redis URL')
+    parser.add_argument('--sample', type=float, default=2.0, help='seconds between samples')
+    parser.add_argument('--max-growth', type=float, default=0.10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tracemalloc.start()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the routing path's backends, with injectable latency:
+  FakeTrino    - fake coordinator from fake_trino.py (statement paging, EXPLAIN (TYPE IO) sized
+                 per table so decisions spread over the tiers, cancellation, scripted errors);
+                 the catalog cache's metadata queries get a small `iceberg` catalog of strings
+                 (METADATA_RULES), so discovery statements can be answered by the proxy
+  FakeDynamoDB - DynamoDB JSON protocol (GetItem, PutItem, DescribeTable, UpdateItem with SET,
+                 REMOVE, `+`, if_not_exists and simple conditions) kept in memory; any other AWS call (e.g. Glue GetTable from the snapshot tracker)
+                 gets a fast not-found, so nothing leaves the host
+Point boto3 at FakeDynamoDB with AWS_ENDPOINT_URL. Used by load_routing.py; runnable alone to
+drive the services by hand.
+
+Usage: python benchmarks/stubs.py [--trino-ports 18081,18082,18083] [--dynamodb-port 18000]
+                                  [--trino-latency-ms 5] [--dynamodb-latency-ms 3] [--jitter-ms 1]
+                                  [--script rules.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_trino import FakeTrino, pause, serve_http  # noqa: E402
+
+# Catalog the stand-in coordinators describe: schema -> tables (the load test's schemas)
+METADATA_SCHEMAS = {schema: [f'tbl_{c}' for c in 'abcdefgh'] + [f'tbl_{c}_dim' for c in 'abcd']
+                    for schema in ('sales', 'events', 'finance', 'marketing')}
+METADATA_COLUMNS = [['id', 'bigint'], ['customer', 'bigint'], ['region', 'varchar'], ['amount', 'double'],
+                    ['day', 'date'], ['ts', 'timestamp(3)']]
+
+
+def metadata_rules():
+    """fake_trino rules answering the catalog cache's queries (system.metadata, information_schema)."""
+    schemas = sorted(METADATA_SCHEMAS) + ['information_schema']
+    varchar = 'varchar'
+    return [
+        {'match': r'FROM\s+system\.metadata\.catalogs', 'columns': [['catalog_name', varchar]],
+         'data': [['iceberg'], ['system']]},
+        {'match': r'FROM\s+"iceberg"\.information_schema\.schemata',
+         'columns': [['schema_name', varchar]], 'data': [[schema] for schema in schemas]},
+        {'match': r'FROM\s+"iceberg"\.information_schema\.tables',
+         'columns': [['table_schema', varchar], ['table_name', varchar]],
+         'data': [[schema, table] for schema, tables in sorted(METADATA_SCHEMAS.items()) for table in tables]},
+        {'match': r'FROM\s+"iceberg"\.information_schema\.columns',
+         'columns': [['table_schema', varchar], ['table_name', varchar], ['column_name', varchar],
+                     ['data_type', varchar], ['extra_info', varchar], ['comment', varchar]],
+         'data': [[schema, table, name, kind, '', None]
+                  for schema, tables in sorted(METADATA_SCHEMAS.items()) for table in tables
+                  for name, kind in METADATA_COLUMNS]},
+        # Other catalogs (system) describe no schemas
+        {'match': r'FROM\s+"\w+"\.information_schema\.(?:schemata|tables|columns)', 'columns': [['name', varchar]],
+         'data': []},
+    ]
+
+
+_SET_CLAUSE = re.compile(r'\s*([#\w]+)\s*=\s*(.+?)\s*')
+_IF_NOT_EXISTS = re.compile(r'if_not_exists\(\s*([#\w]+)\s*,\s*(:\w+)\s*\)')
+_CONDITION = re.compile(r'\s*(?:(attribute_(?:not_)?exists)\(\s*([#\w]+)\s*\)|([#\w]+)\s*=\s*(:\w+))\s*')
+_SECTION = re.compile(r'\b(SET|REMOVE)\b', re.IGNORECASE)
+
+
+class ConditionFailed(Exception):
+    pass
+
+
+def _split(expression):
+    """Comma-separated clauses, ignoring commas inside function calls."""
+    clauses, depth, start = [], 0, 0
+    for i, char in enumerate(expression):
+        depth += (char == '(') - (char == ')')
+        if char == ',' and depth == 0:
+            clauses.append(expression[start:i])
+            start = i + 1
+    clauses.append(expression[start:])
+    return [clause for clause in clauses if clause.strip()]
+
+
+class FakeDynamoDB:
+    """In-memory tables behind the DynamoDB JSON protocol; other AWS targets answer not-found."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tables = {}
+        self.calls = {}
+
+    @staticmethod
+    def _key(request):
+        return json.dumps(request.get('Key', {}), sort_keys=True)
+
+    @staticmethod
+    def _operand(item, text, names, values):
+        text = text.strip()
+        match = _IF_NOT_EXISTS.fullmatch(text)
+        if match:
+            current = item.get(names.get(match.group(1), match.group(1)))
+            return current if current is not None else values[match.group(2)]
+        if text.startswith(':'):
+            return values[text]
+        if re.fullmatch(r'[#\w]+', text):
+            return item.get(names.get(text, text))
+        raise ValueError(f'unsupported operand: {text}')
+
+    def _value(self, item, text, names, values):
+        left, plus, right = text.rpartition('+') if '+' in text else ('', '', text)
+        if not plus:
+            return self._operand(item, right, names, values)
+        a, b = self._operand(item, left, names, values), self._operand(item, right, names, values)
+        if not a or not b or 'N' not in a or 'N' not in b:
+            raise ValueError(f'`+` needs numbers: {text}')
+        total = float(a['N']) + float(b['N'])
+        return {'N': str(int(total)) if total.is_integer() else str(total)}
+
+    def _check(self, item, request):
+        expression = request.get('ConditionExpression')
+        if not expression:
+            return
+        names = request.get('ExpressionAttributeNames', {})
+        values = request.get('ExpressionAttributeValues', {})
+        for alternative in re.split(r'\bOR\b', expression):
+            holds = True
+            for term in re.split(r'\bAND\b', alternative):
+                match = _CONDITION.fullmatch(term)
+                if not match:
+                    raise ValueError(f'unsupported condition: {term}')
+                if match.group(1):
+                    present = item.get(names.get(match.group(2), match.group(2))) is not None
+                    holds = holds and (present if match.group(1) == 'attribute_exists' else not present)
+                else:
+                    holds = holds and item.get(names.get(match.group(3), match.group(3))) == values[match.group(4)]
+            if holds:
+                return
+        raise ConditionFailed(expression)
+
+    def _update(self, item, request):
+        names = request.get('ExpressionAttributeNames', {})
+        values = request.get('ExpressionAttributeValues', {})
+        expression = request.get('UpdateExpression', '').strip()
+        parts = _SECTION.split(expression)
+        if parts[0].strip():
+            raise ValueError(f'unsupported update expression: {expression}')
+        updates = {}
+        for action, body in zip(parts[1::2], parts[2::2]):
+            for clause in _split(body):
+                if action.upper() == 'REMOVE':
+                    updates[names.get(clause.strip(), clause.strip())] = None
+                    continue
+                match = _SET_CLAUSE.fullmatch(clause)
+                if not match:
+                    raise ValueError(f'unsupported update clause: {clause}')
+                updates[names.get(match.group(1), match.group(1))] = self._value(item, match.group(2), names, values)
+        # Every operand reads the item as it was before the update
+        for name, value in updates.items():
+            if value is None:
+                item.pop(name, None)
+            else:
+                item[name] = value
+
+    async def __call__(self, method, path, headers, body):
+        await pause(self.latency_ms, self.jitter_ms)
+        target = headers.get('x-amz-target', '')
+        service, _, operation = target.partition('.')
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        if not service.startswith('DynamoDB'):
+            return 400, 'application/x-amz-json-1.1', json.dumps({
+                '__type': 'EntityNotFoundException', 'Message': f'{target} not available in the stub'}).encode()
+        request = json.loads(body or b'{}')
+        table = self.tables.setdefault(request.get('TableName', ''), {})
+        if operation == 'GetItem':
+            item = table.get(self._key(request))
+            response = {'Item': item} if item is not None else {}
+        elif operation == 'PutItem':
+            item = request['Item']
+            key = {name: item[name] for name in ('fingerprint',) if name in item} or {k: item[k] for k in list(item)[:1]}
+            table[json.dumps(key, sort_keys=True)] = item
+            response = {}
+        elif operation == 'UpdateItem':
+            key = self._key(request)
+            item = dict(table.get(key) or request.get('Key', {}))
+            try:
+                self._check(table.get(key) or {}, request)
+                self._update(item, request)
+            except ConditionFailed:
+                return 400, 'application/x-amz-json-1.0', json.dumps({
+                    '__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException',
+                    'message': 'The conditional request failed'}).encode()
+            except ValueError as e:
+                return 400, 'application/x-amz-json-1.0', json.dumps({
+                    '__type': 'com.amazon.coral.validate#ValidationException', 'message': str(e)}).encode()
+            table[key] = item
+            response = {}
+        elif operation == 'DescribeTable':
+            response = {'Table': {'TableName': request.get('TableName'), 'TableStatus': 'ACTIVE',
+                                  'ItemCount': len(table),
+                                  'KeySchema': [{'AttributeName': 'fingerprint', 'KeyType': 'HASH'}]}}
+        else:
+            return 400, 'application/x-amz-json-1.0', json.dumps({
+                '__type': 'com.amazonaws.dynamodb.v20120810#UnknownOperationException'}).encode()
+        return 200, 'application/x-amz-json-1.0', json.dumps(response).encode()
+
+
+async def run_stubs(trino_ports, dynamodb_port, pages=3, rows=50, trino_latency_ms=0.0,
+                    dynamodb_latency_ms=0.0, jitter_ms=0.0, rules=None):
+    """`pages` data pages of `rows` rows per query, over FakeTrino's QUEUED and RUNNING pages."""
+    defaults = {'rows': pages * rows, 'page_rows': max(1, rows), 'latency_ms': trino_latency_ms,
+                'jitter_ms': jitter_ms}
+    # Scripted rules come first: the first match applies
+    rules = list(rules or []) + metadata_rules()
+    servers = []
+    for port in trino_ports:
+        servers.append(await serve_http(FakeTrino(f'http://127.0.0.1:{port}', defaults, rules), port))
+    servers.append(await serve_http(FakeDynamoDB(dynamodb_latency_ms, jitter_ms), dynamodb_port))
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def serve_stubs(*args, **kwargs):
+    """Process target: runs the stubs until terminated."""
+    asyncio.run(run_stubs(*args, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trino-ports', default='18081,18082,18083', help='one fake coordinator per tier')
+    parser.add_argument('--dynamodb-port', type=int, default=18000)
+    parser.add_argument('--pages', type=int, default=3, help='data pages per query')
+    parser.add_argument('--rows', type=int, default=50, help='rows per data page')
+    parser.add_argument('--trino-latency-ms', type=float, default=0.0)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--script', help='JSON list of fake_trino rules (errors, volumes, latency per statement)')
+    args = parser.parse_args()
+    rules = None
+    if args.script:
+        with open(args.script) as f:
+            rules = json.load(f)
+    ports = [int(p) for p in args.trino_ports.split(',')]
+    print(f"fake trino on {ports}, fake dynamodb on {args.dynamodb_port} (AWS_ENDPOINT_URL=http://127.0.0.1:{args.dynamodb_port})")
+    try:
+        serve_stubs(ports, args.dynamodb_port, args.pages, args.rows, args.trino_latency_ms,
+                    args.dynamodb_latency_ms, args.jitter_ms, rules)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
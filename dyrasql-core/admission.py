@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Admission Control - per-cluster concurrency quotas for statements submitted through the proxy.
+Limits come from the tier capacity in the cluster registry (capacity.max_concurrent). When a
+cluster is full, new statements wait in a bounded FIFO queue, spill to the next tier or are
+rejected, depending on capacity.overflow. Slots are released when the query reaches a terminal
+page, is cancelled (DELETE), the coordinator reports it done (bypass mode never sees the later
+pages, so idle queries are checked against the cluster) or its lease expires. With several
+workers (DYRASQL_WORKERS) each one admits its share of max_concurrent, rounded up.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from workers import worker_count
+
+logger = logging.getLogger(__name__)
+
+
+OVERFLOW_POLICIES = ('queue', 'spill', 'reject')
+
+# Wait times kept per cluster for the percentiles in snapshot()
+WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a statement cannot be admitted (queue full, wait timeout or reject policy)."""
+
+    def __init__(self, cluster: str, reason: str, retry_after: int):
+        super().__init__(f"cluster {cluster} is at capacity ({reason})")
+        self.cluster = cluster
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Admission:
+    """One admitted statement. `cluster` may differ from `requested_cluster` after a spill."""
+
+    __slots__ = ('cluster', 'requested_cluster', 'waited', 'query_id', 'last_seen', 'expires_at', 'tracked', 'released')
+
+    def __init__(self, cluster: str, requested_cluster: str, tracked: bool, expires_at: float):
+        self.cluster = cluster
+        self.requested_cluster = requested_cluster
+        self.waited = 0.0
+        self.query_id = None
+        self.last_seen = time.monotonic()
+        self.expires_at = expires_at
+        self.tracked = tracked
+        self.released = False
+
+    @property
+    def spilled(self) -> bool:
+        return self.cluster != self.requested_cluster
+
+
+class _ClusterState:
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = set()
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+        self.waits: Deque[float] = collections.deque(maxlen=WAIT_SAMPLES)
+        self.counters = {
+            'admitted': 0,
+            'queued': 0,
+            'spilled_in': 0,
+            'spilled_out': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'expired': 0,
+            'reconciled': 0,
+        }
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class AdmissionController:
+    """Per-cluster slot accounting. All methods run on the event loop thread."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.default_limit = int(os.getenv('DYRASQL_ADMISSION_DEFAULT_LIMIT', '0'))
+        self.default_overflow = os.getenv('DYRASQL_ADMISSION_OVERFLOW', 'queue').lower()
+        self.max_queue = int(os.getenv('DYRASQL_ADMISSION_MAX_QUEUE', '100'))
+        self.max_wait = float(os.getenv('DYRASQL_ADMISSION_MAX_WAIT_SECONDS', '30'))
+        self.lease_seconds = float(os.getenv('DYRASQL_ADMISSION_LEASE_SECONDS', '300'))
+        self.reconcile_seconds = float(os.getenv('DYRASQL_ADMISSION_RECONCILE_SECONDS', '10'))
+        if self.default_overflow not in OVERFLOW_POLICIES:
+            logger.warning("admission invalid_overflow policy=%s fallback=queue", self.default_overflow)
+            self.default_overflow = 'queue'
+        self._clusters: Dict[str, _ClusterState] = {}
+        self._by_query: Dict[str, Admission] = {}
+        self._reaper = None
+        self.workers = 1
+
+    def _limit(self, tier) -> int:
+        limit = int(tier.capacity.get('max_concurrent', self.default_limit) or 0)
+        if limit > 0 and self.workers > 1:
+            # Each worker admits its share; rounding up keeps small limits usable
+            limit = -(-limit // self.workers)
+        return limit
+
+    def _overflow(self, tier) -> str:
+        policy = str(tier.capacity.get('overflow', self.default_overflow)).lower()
+        return policy if policy in OVERFLOW_POLICIES else self.default_overflow
+
+    def _state(self, name: str, limit: int) -> _ClusterState:
+        state = self._clusters.get(name)
+        if state is None:
+            state = self._clusters[name] = _ClusterState(name, limit)
+        elif state.limit != limit:
+            # Limit changed by a registry reload
+            state.limit = limit
+            self._wake(state)
+        return state
+
+    def _has_room(self, state: _ClusterState) -> bool:
+        return len(state.active) < state.limit and not state.waiters
+
+    def _take(self, state: _ClusterState, cluster: str, requested: str) -> Admission:
+        admission = Admission(cluster, requested, True, time.monotonic() + self.lease_seconds)
+        state.active.add(admission)
+        state.counters['admitted'] += 1
+        return admission
+
+    async def acquire(self, cluster: str, config=None) -> Admission:
+        """Admits a statement on `cluster`, waiting or spilling per policy. Raises AdmissionRejected."""
+        config = config or self.registry.current()
+        tier = config.tier(cluster)
+        limit = self._limit(tier)
+        if limit <= 0:
+            return Admission(cluster, cluster, False, 0.0)
+
+        state = self._state(cluster, limit)
+        if self._has_room(state):
+            return self._take(state, cluster, cluster)
+
+        policy = self._overflow(tier)
+        if policy == 'spill':
+            next_tier = config.next_tier(cluster)
+            while next_tier is not None:
+                next_limit = self._limit(next_tier)
+                if next_limit <= 0:
+                    state.counters['spilled_out'] += 1
+                    logger.info("admission_spill from=%s to=%s active=%s limit=%s", cluster, next_tier.name, len(state.active), limit)
+                    return Admission(next_tier.name, cluster, False, 0.0)
+                next_state = self._state(next_tier.name, next_limit)
+                if self._has_room(next_state):
+                    state.counters['spilled_out'] += 1
+                    next_state.counters['spilled_in'] += 1
+                    logger.info("admission_spill from=%s to=%s active=%s limit=%s", cluster, next_tier.name, len(state.active), limit)
+                    return self._take(next_state, next_tier.name, cluster)
+                next_tier = config.next_tier(next_tier.name)
+            # Every bigger tier is full too: wait for the requested one
+
+        if policy == 'reject' or len(state.waiters) >= self.max_queue:
+            state.counters['rejected'] += 1
+            reason = 'reject_policy' if policy == 'reject' else 'queue_full'
+            logger.warning("admission_rejected cluster=%s reason=%s active=%s queued=%s", cluster, reason, len(state.active), len(state.waiters))
+            raise AdmissionRejected(cluster, reason, retry_after=1)
+
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        state.counters['queued'] += 1
+        started = time.monotonic()
+        logger.info("admission_queued cluster=%s active=%s queued=%s", cluster, len(state.active), len(state.waiters))
+        try:
+            admission = await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot was handed over while we were giving up: pass it on
+                self.release(future.result())
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            state.counters['timed_out'] += 1
+            self._record_wait(state, time.monotonic() - started)
+            logger.warning("admission_timeout cluster=%s waited=%.1fs queued=%s", cluster, self.max_wait, len(state.waiters))
+            raise AdmissionRejected(cluster, 'wait_timeout', retry_after=max(1, int(self.max_wait)))
+        finally:
+            try:
+                state.waiters.remove(future)
+            except ValueError:
+                pass
+
+        admission.waited = time.monotonic() - started
+        self._record_wait(state, admission.waited)
+        logger.info("admission_dequeued cluster=%s waited=%.3fs", cluster, admission.waited)
+        return admission
+
+    def _record_wait(self, state: _ClusterState, waited: float) -> None:
+        state.waits.append(waited)
+        state.wait_total += waited
+        state.wait_max = max(state.wait_max, waited)
+
+    def _wake(self, state: _ClusterState) -> None:
+        """Hands free slots to the oldest live waiters."""
+        while state.waiters and len(state.active) < state.limit:
+            future = state.waiters.popleft()
+            if future.done():
+                continue
+            future.set_result(self._take(state, state.name, state.name))
+
+    def bind(self, admission: Admission, query_id: Optional[str]) -> None:
+        """Associates the Trino query id so later pages/DELETE can release the slot."""
+        if not admission.tracked or admission.released:
+            return
+        if not query_id:
+            # Submission failed: nothing is running on the cluster
+            self.release(admission)
+            return
+        admission.query_id = query_id
+        self._by_query[query_id] = admission
+
+    def release(self, admission: Optional[Admission]) -> None:
+        if admission is None or not admission.tracked or admission.released:
+            return
+        admission.released = True
+        if admission.query_id:
+            self._by_query.pop(admission.query_id, None)
+        state = self._clusters.get(admission.cluster)
+        if state is not None:
+            state.active.discard(admission)
+            self._wake(state)
+
+    def release_query(self, query_id: Optional[str]) -> None:
+        """Releases the slot of a finished/cancelled query (no-op for unknown ids)."""
+        if query_id:
+            self.release(self._by_query.get(query_id))
+
+    def touch(self, query_id: Optional[str]) -> None:
+        """Extends the lease of a query that is still being paged through the proxy."""
+        admission = self._by_query.get(query_id) if query_id else None
+        if admission is not None:
+            admission.last_seen = time.monotonic()
+            admission.expires_at = admission.last_seen + self.lease_seconds
+
+    def expire_leases(self) -> int:
+        now = time.monotonic()
+        expired = 0
+        for state in self._clusters.values():
+            for admission in [a for a in state.active if a.expires_at <= now]:
+                state.counters['expired'] += 1
+                expired += 1
+                logger.info("admission_lease_expired cluster=%s query_id=%s", admission.cluster, admission.query_id)
+                self.release(admission)
+        return expired
+
+    async def reconcile(self, probe: Callable[[str, str], Awaitable[bool]]) -> int:
+        """Asks the coordinator about queries idle for reconcile_seconds; releases the finished ones."""
+        now = time.monotonic()
+        idle = [
+            a for state in self._clusters.values() for a in state.active
+            if a.query_id and now - a.last_seen >= self.reconcile_seconds
+        ]
+        if not idle:
+            return 0
+        results = await asyncio.gather(*(probe(a.cluster, a.query_id) for a in idle), return_exceptions=True)
+        released = 0
+        for admission, finished in zip(idle, results):
+            admission.last_seen = now
+            if finished is True and not admission.released:
+                self._clusters[admission.cluster].counters['reconciled'] += 1
+                self.release(admission)
+                released += 1
+        if released:
+            logger.debug("admission_reconciled released=%s checked=%s", released, len(idle))
+        return released
+
+    async def _reap(self, interval: float, probe):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.expire_leases()
+                if probe is not None and self.reconcile_seconds > 0:
+                    await self.reconcile(probe)
+            except Exception as e:
+                logger.warning("admission_reaper error=%s", str(e))
+
+    def start(self, probe: Optional[Callable[[str, str], Awaitable[bool]]] = None, interval: float = 5.0):
+        """Starts the lease reaper on the running loop. `probe(cluster, query_id)` returns True once the query is done."""
+        self.workers = worker_count()
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap(interval, probe))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, active slots, counters and wait-time stats per cluster."""
+        clusters = {}
+        for name, state in self._clusters.items():
+            waits = sorted(state.waits)
+            waited = state.counters['queued']
+            clusters[name] = {
+                'limit': state.limit,
+                'active': len(state.active),
+                'queue_depth': len(state.waiters),
+                **state.counters,
+                'wait_seconds': {
+                    'avg': round(state.wait_total / waited, 4) if waited else 0.0,
+                    'p50': round(waits[len(waits) // 2], 4) if waits else 0.0,
+                    'p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+                    'max': round(state.wait_max, 4),
+                },
+            }
+        return {
+            'workers': self.workers,
+            'default_limit': self.default_limit,
+            'default_overflow': self.default_overflow,
+            'max_queue': self.max_queue,
+            'max_wait_seconds': self.max_wait,
+            'lease_seconds': self.lease_seconds,
+            'reconcile_seconds': self.reconcile_seconds,
+            'tracked_queries': len(self._by_query),
+            'clusters': clusters,
+        }
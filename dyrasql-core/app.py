@@ -11,22 +11,42 @@ from fastapi import FastAPI, Request, Response, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, AsyncGenerator
+from typing import Optional, Dict, Any, AsyncGenerator, Callable, List, Tuple
 
 import os
+import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
 import httpx
 import re
 import json
 
 from query_analyzer import QueryAnalyzer
+from routing import Router, expected_runtime
+from cluster_registry import ClusterRegistry
+from catalog_cache import CatalogCache
+from admission import AdmissionController, AdmissionRejected
+from query_stats import MetricsCollector, PageScanner, scan_page
+from escalation import EscalationContext, EscalationTracker
+from snapshot_tracker import SnapshotTracker
+from page_rewriter import PageRewriter
+from compression import Decoder, Encoder, content_encoding, counters as compression_counters, decode, encode, negotiate
+from url_rewriter import UrlRewriter, UrlRewriters
+from query_map import QueryClusterMap
+from probes import counters as probe_counters, matches as is_probe, respond as respond_probe
+from routing_token import RoutingTokens
+from spooling import HEADER as SPOOLING_HEADER, counters as spooling_counters, negotiate as negotiate_spooling
+from telemetry import inc, render as render_metrics, snapshot as telemetry_snapshot, timer
+from diagnostics import begin as begin_diagnostics, headers as diagnostic_headers, mark as mark_diagnostics
+from tracing import TracingMiddleware, configure as configure_tracing, current as current_span, headers as trace_headers, shutdown as shutdown_tracing, snapshot as tracing_snapshot
+from workers import RequestTimer, WorkerStats, serve
+from log_pipeline import configure as configure_logging, shutdown as shutdown_logging, snapshot as logging_snapshot
+from profiling import authorize as authorize_admin, cpu_profile, event_loop as event_loop_stats, memory_snapshot, start as start_profiling, stop as stop_profiling, structures as structure_sizes, track as track_structure, tracemalloc_start, tracemalloc_stop
 from decision_engine import DecisionEngine
 from metadata_connector import MetadataConnector
 from history_manager import HistoryManager
 
 
-# Configure logging with both console and file handlers
+# Logging: console and rotating file, written by a background thread (see log_pipeline)
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_DIR = os.getenv('LOG_DIR', '/app/logs')
 LOG_FILE = os.path.join(LOG_DIR, 'dyrasql-core.log')
@@ -34,27 +54,7 @@ LOG_FILE = os.path.join(LOG_DIR, 'dyrasql-core.log')
 # Create logs directory if it doesn't exist
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Create formatter
-log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Create root logger
-root_logger = logging.getLogger()
-root_logger.setLevel(LOG_LEVEL)
-
-# Console handler (stdout)
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-root_logger.addHandler(console_handler)
-
-# File handler with rotation (10MB max, keep 5 backups)
-file_handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5,
-    encoding='utf-8'
-)
-file_handler.setFormatter(log_formatter)
-root_logger.addHandler(file_handler)
+configure_logging('dyrasql-core', LOG_FILE, LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
@@ -70,30 +70,71 @@ app.add_middleware(
 )
 
 
+cluster_registry = ClusterRegistry()
 query_analyzer = QueryAnalyzer()
-decision_engine = DecisionEngine()
+decision_engine = DecisionEngine(cluster_registry)
 metadata_connector = MetadataConnector()
 history_manager = HistoryManager()
+# Iceberg snapshot sizes recorded with each decision; a material change invalidates it
+snapshot_tracker = SnapshotTracker(metadata_connector)
+admission_controller = AdmissionController(cluster_registry)
+# Fingerprint, decision cache and catalog shortcut (the part of routing that needs no EXPLAIN)
+router = Router(cluster_registry, history_manager, snapshot_tracker)
+
+
+async def save_metrics_batch(records: List[Dict[str, Any]]) -> None:
+    """Writes captured post-execution metrics to the history table off the event loop."""
+    await asyncio.to_thread(history_manager.save_metrics_batch, records)
+
+
+# Final stats of queries paged through DyraSQL Core (not available in bypass mode)
+metrics_collector = MetricsCollector(save_metrics_batch)
+
+# SELECTs that can still move to a bigger tier (no rows relayed yet)
+escalation_tracker = EscalationTracker()
+
+
+# Cluster tokens embedded in proxy-mode URLs, so any replica can route the next poll
+routing_tokens = RoutingTokens()
+
+# Cluster URL rewriters, precompiled per registry config
+url_rewriters = UrlRewriters(cluster_registry, 'http://localhost:5001', routing_tokens)
+
+# Query ID to cluster mapping for routing subsequent requests (bounded; optionally shared across workers)
+query_cluster_map = QueryClusterMap()
+
+# Per-user catalogs/schemas/tables/columns answering IDE discovery statements locally
+catalog_cache = CatalogCache(cluster_registry)
+
+# Latency histograms and component snapshots, merged across workers by /api/v1/workers
+worker_stats = WorkerStats('dyrasql-core')
+worker_stats.source('admission', admission_controller.snapshot)
+worker_stats.source('metrics', metrics_collector.snapshot)
+worker_stats.source('escalation', escalation_tracker.snapshot)
+worker_stats.source('query_map', query_cluster_map.snapshot)
+worker_stats.source('routing_tokens', lambda: dict(routing_tokens.counters))
+worker_stats.source('compression', lambda: dict(compression_counters))
+worker_stats.source('spooling', lambda: dict(spooling_counters))
+worker_stats.source('probes', lambda: dict(probe_counters))
+worker_stats.source('catalog_cache', catalog_cache.snapshot)
+worker_stats.source('telemetry', telemetry_snapshot)
+worker_stats.source('tracing', tracing_snapshot)
+worker_stats.source('logging', logging_snapshot)
+# Components sized by /api/v1/admin/structures
+track_structure('cluster_registry', cluster_registry)
+track_structure('admission_controller', admission_controller)
+track_structure('router', router)
+track_structure('metrics_collector', metrics_collector)
+track_structure('escalation_tracker', escalation_tracker)
+track_structure('routing_tokens', routing_tokens)
+track_structure('url_rewriters', url_rewriters)
+track_structure('query_cluster_map', query_cluster_map)
+track_structure('catalog_cache', catalog_cache)
+app.add_middleware(RequestTimer, stats=worker_stats)
+configure_tracing('dyrasql-core')
+app.add_middleware(TracingMiddleware)
 
 
-# Query ID to cluster mapping for routing subsequent requests
-query_cluster_map: dict = {}
-
-
-# Cluster URLs (internal Docker network)
-CLUSTER_URLS = {
-    'ecs': os.getenv('TRINO_ECS_URL', 'http://trino-ecs:8080'),
-    'emr-standard': os.getenv('TRINO_EMR_STANDARD_URL', 'http://trino-emr-standard:8080'),
-    'emr-optimized': os.getenv('TRINO_EMR_OPTIMIZED_URL', 'http://trino-emr-optimized:8080')
-}
-
-# External cluster URLs (accessible by clients) - for bypass mode
-CLUSTER_EXTERNAL_URLS = {
-    'ecs': os.getenv('TRINO_ECS_EXTERNAL_URL', 'http://localhost:8081'),
-    'emr-standard': os.getenv('TRINO_EMR_STANDARD_EXTERNAL_URL', 'http://localhost:8082'),
-    'emr-optimized': os.getenv('TRINO_EMR_OPTIMIZED_EXTERNAL_URL', 'http://localhost:8083')
-}
-
 # Bypass mode: if enabled, nextUri points directly to cluster (more efficient)
 BYPASS_MODE = os.getenv('BYPASS_MODE', 'true').lower() == 'true'
 
@@ -113,64 +154,79 @@ class MetricsRequest(BaseModel):
     metrics: Optional[Dict[str, Any]] = None
 
 
+class MetricsBatchRequest(BaseModel):
+    items: List[Dict[str, Any]]
+
+
+class EscalationRequest(BaseModel):
+    fingerprint: str
+    from_cluster: str
+    to_cluster: str
+    reason: str
+    query_id: Optional[str] = None
+
+
 def get_cluster_url(cluster_name: str) -> str:
-    """Returns the internal cluster URL by name."""
-    return CLUSTER_URLS.get(cluster_name, CLUSTER_URLS['ecs'])
+    """Returns the internal cluster URL by name (unknown names resolve to the default tier)."""
+    return cluster_registry.current().tier(cluster_name).url
 
 
 def get_cluster_external_url(cluster_name: str) -> str:
     """Returns the external cluster URL by name."""
-    return CLUSTER_EXTERNAL_URLS.get(cluster_name, CLUSTER_EXTERNAL_URLS['ecs'])
+    return cluster_registry.current().tier(cluster_name).external_url
 
 
-def rewrite_urls_for_bypass(content: str, cluster_name: str) -> str:
+def get_default_cluster() -> str:
+    """Cluster for keepalive/catalog queries and unknown query IDs."""
+    return cluster_registry.current().default_tier
+
+
+def rewrite_page(content: bytes, cluster_name: str) -> Tuple[bytes, Optional[str]]:
     """
-    Rewrite internal cluster URLs to external URLs for bypass mode.
-    Client will connect directly to the cluster for subsequent requests.
+    Rewrite internal cluster URLs in a single pass; also returns the page's query ID.
+    Bypass mode: external URL of the cluster (client connects directly to it).
+    Proxy mode: localhost:5001 (all traffic continues through dyrasql-core).
     """
-    cluster_url = get_cluster_url(cluster_name)
-    external_url = get_cluster_external_url(cluster_name)
+    return page_url_rewriter(cluster_name).rewrite(content)
 
-    # Replace internal URL with external URL
-    pattern = re.escape(cluster_url) + r'(/v1/statement/[^\"]+)'
-    replacement = external_url + r'\1'
-    content = re.sub(pattern, replacement, content)
 
-    # Also handle UI links
-    pattern_ui = re.escape(cluster_url) + r'(/ui/[^\"]+)'
-    replacement_ui = external_url + r'\1'
-    content = re.sub(pattern_ui, replacement_ui, content)
+def page_url_rewriter(cluster_name: str) -> UrlRewriter:
+    """URL rewriter for pages served by `cluster_name` in the current mode."""
+    return url_rewriters.bypass(cluster_name) if BYPASS_MODE else url_rewriters.proxy(cluster_name)
 
-    return content
 
+def page_rewrite_function(cluster_name: str) -> Callable[[bytes], bytes]:
+    """URL rewrite for pages served by `cluster_name` in the current mode."""
+    return lambda content: rewrite_page(content, cluster_name)[0]
 
-def rewrite_urls_for_proxy(content: str) -> str:
-    """
-    Rewrite internal cluster URLs to proxy URL (localhost:5001).
-    All traffic continues through dyrasql-core.
-    """
-    for cluster_name, cluster_url in CLUSTER_URLS.items():
-        pattern_next = re.escape(cluster_url) + r'(/v1/statement/[^\"]+)'
-        replacement_next = r'http://localhost:5001\1'
-        content = re.sub(pattern_next, replacement_next, content)
 
-        pattern_info = re.escape(cluster_url) + r'(/ui/[^\"]+)'
-        replacement_info = r'http://localhost:5001\1'
-        content = re.sub(pattern_info, replacement_info, content)
+async def map_query_cluster(query_id: Optional[str], cluster_name: str) -> None:
+    """Map query ID to cluster for subsequent requests."""
+    if query_id:
+        await query_cluster_map.set(query_id, cluster_name)
+        logger.debug("query_mapped query_id=%s cluster=%s", query_id, cluster_name)
 
-    return content
 
+def record_escalation(fingerprint: str, from_cluster: str, to_cluster: str, reason: str) -> None:
+    """Corrects the cached decision of a fingerprint that had to be escalated."""
+    cached = history_manager.get_cached_decision(fingerprint) or {}
+    router.save(fingerprint, {
+        'cluster': to_cluster,
+        'score': cached.get('score', 0.0),
+        'factors': cached.get('factors', {}),
+        'tables': cached.get('tables', {}),
+        'escalated_from': from_cluster,
+        'escalation_reason': reason
+    })
+    logger.info("escalation_recorded fingerprint=%s from=%s to=%s reason=%s", fingerprint[:16], from_cluster, to_cluster, reason)
 
-def extract_query_id_and_map_cluster(content: str, cluster_name: str) -> None:
-    """Extract query ID from response and map it to cluster for subsequent requests."""
-    try:
-        response_json = json.loads(content)
-        query_id = response_json.get('id')
-        if query_id:
-            query_cluster_map[query_id] = cluster_name
-            logger.debug("query_mapped query_id=%s cluster=%s", query_id, cluster_name)
-    except (json.JSONDecodeError, KeyError):
-        pass
+
+def finish_query(query_id: Optional[str], scanner: Optional[PageScanner]) -> None:
+    """Terminal page relayed (or query cancelled): frees the admission slot, captures the final stats
+    and forgets the query's cluster."""
+    admission_controller.release_query(query_id)
+    metrics_collector.complete(query_id, scanner)
+    query_cluster_map.discard(query_id)
 
 
 @app.get('/health')
@@ -194,39 +250,14 @@ async def route_query(request_data: RouteRequest):
         query = request_data.query
         logger.info("route_request query_preview=%s", query[:80].replace('\n', ' '))
 
-        fingerprint = query_analyzer.generate_fingerprint(query)
-        logger.debug("route_request fingerprint=%s", fingerprint[:16])
-
-        cached_decision = history_manager.get_cached_decision(fingerprint)
-        if cached_decision:
-            logger.info("route_response cached=true fingerprint=%s cluster=%s", fingerprint[:16], cached_decision['cluster'])
-            return {
-                'fingerprint': fingerprint,
-                'cluster': cached_decision['cluster'],
-                'score': cached_decision.get('score'),
-                'factors': cached_decision.get('factors', {}),
-                'cached': True,
-                'cluster_url': get_cluster_url(cached_decision['cluster']),
-                'cluster_external_url': get_cluster_external_url(cached_decision['cluster'])
-            }
-
-        if query_analyzer.is_catalog_or_metadata_query(query):
-            logger.info("route_response catalog_query=true cluster=ecs fingerprint=%s", fingerprint[:16])
-            decision_catalog = {
-                'cluster': 'ecs',
-                'score': 0.0,
-                'factors': {'volume': 0, 'complexity': 0, 'historical': 0}
-            }
-            history_manager.save_decision(fingerprint, decision_catalog)
-            return {
-                'fingerprint': fingerprint,
-                'cluster': 'ecs',
-                'score': decision_catalog['score'],
-                'factors': decision_catalog['factors'],
-                'cached': False,
-                'cluster_url': get_cluster_url('ecs'),
-                'cluster_external_url': get_cluster_external_url('ecs')
-            }
+        fingerprint, decision = router.route(query)
+        current_span().set('dyrasql.fingerprint', fingerprint)
+        if decision:
+            inc('routing_decisions_total', decision['cluster'])
+            current_span().set('dyrasql.cluster', decision['cluster'])
+            decision['cluster_url'] = get_cluster_url(decision['cluster'])
+            decision['cluster_external_url'] = get_cluster_external_url(decision['cluster'])
+            return decision
 
         logger.info("route_analysis phase=explain_io")
         io_analysis = query_analyzer.analyze_query_io(query)
@@ -248,16 +279,21 @@ async def route_query(request_data: RouteRequest):
         complexity = query_analyzer.analyze_complexity(query)
         logger.debug("route_analysis complexity=%s", complexity)
 
-        decision = decision_engine.decide(
-            query=query,
-            fingerprint=fingerprint,
-            metadata=metadata,
-            complexity=complexity,
-            history_manager=history_manager
-        )
+        with timer('routing_stage_seconds', 'decide'):
+            decision = decision_engine.decide(
+                query=query,
+                fingerprint=fingerprint,
+                metadata=metadata,
+                complexity=complexity,
+                history_manager=history_manager
+            )
 
         logger.info("route_response cluster=%s score=%.3f fingerprint=%s", decision['cluster'], decision['score'], fingerprint[:16])
-        history_manager.save_decision(fingerprint, decision)
+        with timer('routing_stage_seconds', 'metadata'):
+            decision['tables'] = snapshot_tracker.sizes(metadata.keys())
+        router.save(fingerprint, decision)
+        inc('routing_decisions_total', decision['cluster'])
+        current_span().set('dyrasql.cluster', decision['cluster'])
 
         return {
             'fingerprint': fingerprint,
@@ -281,7 +317,7 @@ async def route_query(request_data: RouteRequest):
 async def save_metrics(request_data: MetricsRequest):
     """Saves post-execution metrics."""
     try:
-        data = request_data.dict()
+        data = {**(request_data.metrics or {}), 'fingerprint': request_data.fingerprint}
         history_manager.save_metrics(data)
         logger.info("metrics_saved fingerprint=%s", data.get('fingerprint', '')[:16])
         return {'status': 'success', 'message': 'Metrics saved successfully'}
@@ -290,11 +326,124 @@ async def save_metrics(request_data: MetricsRequest):
         raise HTTPException(status_code=500, detail={'error': 'Failed to save metrics', 'message': str(e)})
 
 
+@app.post('/api/v1/metrics/batch')
+async def save_metrics_batch_endpoint(request_data: MetricsBatchRequest):
+    """Saves a batch of post-execution metrics (flat records, as captured by the gateway proxy)."""
+    try:
+        saved = await asyncio.to_thread(history_manager.save_metrics_batch, request_data.items)
+        logger.info("metrics_batch_saved records=%s fingerprints=%s", len(request_data.items), saved)
+        return {'status': 'success', 'records': len(request_data.items), 'fingerprints': saved}
+    except Exception as e:
+        logger.exception("save_metrics_batch error=%s", str(e))
+        raise HTTPException(status_code=500, detail={'error': 'Failed to save metrics', 'message': str(e)})
+
+
+@app.post('/api/v1/escalations')
+async def save_escalation(request_data: EscalationRequest):
+    """Records a query escalated to a bigger tier; the fingerprint's cached decision now points there."""
+    try:
+        await asyncio.to_thread(record_escalation, request_data.fingerprint, request_data.from_cluster,
+                                request_data.to_cluster, request_data.reason)
+        return {'status': 'success', 'fingerprint': request_data.fingerprint, 'cluster': request_data.to_cluster}
+    except Exception as e:
+        logger.exception("save_escalation error=%s", str(e))
+        raise HTTPException(status_code=500, detail={'error': 'Failed to record escalation', 'message': str(e)})
+
+
+@app.get('/api/v1/clusters')
+async def list_clusters():
+    """Current cluster registry snapshot (tiers, score bands, weights)."""
+    return cluster_registry.current().to_dict()
+
+
+@app.post('/api/v1/clusters/reload')
+async def reload_clusters():
+    """Reloads the cluster registry file (same as SIGHUP). Invalid files keep the current config."""
+    reloaded = cluster_registry.reload()
+    return {'reloaded': reloaded, **cluster_registry.current().to_dict()}
+
+
+@app.get('/api/v1/admission')
+async def admission_stats():
+    """Admission control state per cluster: active slots, queue depth, wait times."""
+    return admission_controller.snapshot()
+
+
+@app.get('/api/v1/query-map')
+async def query_map_stats():
+    """Query ID to cluster map: entries, memory, hits/misses and evictions."""
+    return await query_cluster_map.snapshot()
+
+
+@app.get('/api/v1/workers')
+async def workers_stats():
+    """Server workers: per-worker summary plus counters and latency histograms merged across them."""
+    return await worker_stats.aggregate()
+
+
+@app.post('/api/v1/catalog-cache/invalidate')
+async def invalidate_catalog_cache():
+    """Drops the catalog snapshots of every worker (reloaded on the next discovery statement)."""
+    dropped = catalog_cache.invalidate()
+    logger.info("catalog_cache_invalidated reason=api snapshots=%s", dropped)
+    return {'invalidated': dropped}
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus metrics (text format) of all workers: routing stages, clients, decisions, traffic."""
+    return Response(content=render_metrics(await worker_stats.aggregate()), media_type='text/plain; version=0.0.4')
+
+
+@app.get('/api/v1/admin/profile')
+async def admin_profile(request: Request, seconds: float = 10, interval_ms: float = 10, mode: str = 'cpu'):
+    """Sampling profile of this worker as collapsed stacks (mode cpu: loop thread; tasks: await chains)."""
+    authorize_admin(request)
+    profile = await cpu_profile(seconds, interval_ms, mode)
+    return Response(content=profile['collapsed'], media_type='text/plain', headers={
+        'X-DyraSQL-Profile-Samples': str(profile['samples']), 'X-DyraSQL-Worker-Pid': str(os.getpid())})
+
+
+@app.post('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_start(request: Request, frames: int = 1):
+    """Starts tracemalloc in this worker (allocations are slower until it is stopped)."""
+    authorize_admin(request)
+    return tracemalloc_start(frames)
+
+
+@app.get('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_snapshot(request: Request, group: str = 'lineno', limit: int = 20):
+    """Top allocation sites of this worker and the diff to its previous snapshot."""
+    authorize_admin(request)
+    return await memory_snapshot(group, limit)
+
+
+@app.delete('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_stop(request: Request):
+    """Stops tracemalloc and drops the kept snapshot."""
+    authorize_admin(request)
+    return tracemalloc_stop()
+
+
+@app.get('/api/v1/admin/structures')
+async def admin_structures(request: Request, types: int = 0):
+    """Approximate deep sizes of this worker's in-memory components, GC state and RSS."""
+    authorize_admin(request)
+    return await structure_sizes(types)
+
+
+@app.get('/api/v1/admin/event-loop')
+async def admin_event_loop(request: Request):
+    """Event loop lag histogram of this worker (all workers: event_loop_lag_seconds in /metrics)."""
+    authorize_admin(request)
+    return event_loop_stats()
+
+
 @app.get('/v1/info')
 async def trino_info():
-    """Trino /v1/info endpoint (required for JDBC). Proxies to default ECS cluster."""
+    """Trino /v1/info endpoint (required for JDBC). Proxies to the default cluster."""
     try:
-        cluster_url = get_cluster_url('ecs')
+        cluster_url = get_cluster_url(get_default_cluster())
         async with httpx.AsyncClient(timeout=5) as client:
             response = await client.get(
                 f"{cluster_url}/v1/info",
@@ -332,6 +481,12 @@ async def trino_statement(request: Request):
     Trino /v1/statement endpoint. Executes queries with intelligent routing;
     DyraSQL Core selects the target cluster and proxies the request.
     """
+    admission = None
+    fingerprint = None
+    runtime = None
+    routed = None
+    cache_hit = None
+    stages = begin_diagnostics(request.headers)
     try:
         body = await request.body()
         query = body.decode('utf-8')
@@ -342,22 +497,34 @@ async def trino_statement(request: Request):
             logger.warning("statement_request empty_query user=%s", user)
             raise HTTPException(status_code=400, detail={'error': 'SQL query is required'})
 
+        # Keepalive / validation probes: answered here, no query on the cluster
+        probe = respond_probe(query, str(request.base_url))
+        if probe is not None:
+            logger.info("statement_routing reason=probe answered=local user=%s", user)
+            return Response(content=probe, status_code=200, headers={'Content-Type': 'application/json'})
+        # IDE discovery (SHOW ..., DESCRIBE) answered from the user's catalog snapshot when exact
+        discovery = catalog_cache.answer(query, request.headers, str(request.base_url))
+        if discovery is not None:
+            logger.info("statement_routing reason=catalog_cache answered=local user=%s", user)
+            return Response(content=discovery, status_code=200, headers={'Content-Type': 'application/json'})
+        catalog_cache.observe(query)
+
         query_normalized = query.strip().upper().rstrip(';').strip()
-        is_keepalive = (
-            query_normalized in ['SELECT 1', 'SELECT 1 AS KEEPALIVE', 'SELECT 1 AS 1'] or
-            query_normalized.startswith("SELECT 'KEEP ALIVE'") or
-            query_normalized.startswith("SELECT 'KEEPALIVE'")
-        )
+        # Probes not answered above (responses off, or not only literals) stay on the default tier
+        is_keepalive = is_probe(query)
 
         if is_keepalive:
-            cluster_name = 'ecs'
-            logger.info("statement_routing reason=keepalive cluster=ecs")
+            cluster_name = get_default_cluster()
+            logger.info("statement_routing reason=keepalive cluster=%s", cluster_name)
         else:
             fingerprint = query_analyzer.generate_fingerprint(query)
-            cached_decision = history_manager.get_cached_decision(fingerprint)
+            cached_decision = router.cached(fingerprint, 'statement')
+            cache_hit = bool(cached_decision)
 
             if cached_decision:
+                routed = cached_decision
                 cluster_name = cached_decision['cluster']
+                runtime = expected_runtime(cached_decision)
                 score = cached_decision.get('score', 0.0)
                 factors = cached_decision.get('factors', {})
                 logger.info("statement_routing cached=true cluster=%s score=%.3f fingerprint=%s volume=%.2f complexity=%.2f historical=%.2f",
@@ -373,14 +540,15 @@ async def trino_statement(request: Request):
                 is_catalog_query = query_analyzer.is_catalog_or_metadata_query(query)
 
                 if is_metadata_query or is_catalog_query:
-                    cluster_name = 'ecs'
+                    cluster_name = get_default_cluster()
                     kind = "catalog" if is_catalog_query else "metadata"
-                    logger.info("statement_routing reason=%s cluster=ecs fingerprint=%s", kind, fingerprint[:16])
-                    history_manager.save_decision(fingerprint, {
+                    logger.info("statement_routing reason=%s cluster=%s fingerprint=%s", kind, cluster_name, fingerprint[:16])
+                    routed = {
                         'cluster': cluster_name,
                         'score': 0.0,
                         'factors': {'volume': 0, 'complexity': 0, 'historical': 0}
-                    })
+                    }
+                    router.save(fingerprint, routed)
                 else:
                     logger.info("statement_analysis phase=explain_io cluster=ecs")
                     io_analysis = query_analyzer.analyze_query_io(query)
@@ -395,19 +563,33 @@ async def trino_statement(request: Request):
                                 'io_analysis': table_io
                             }
                     complexity = query_analyzer.analyze_complexity(query)
-                    decision = decision_engine.decide(
-                        query=query,
-                        fingerprint=fingerprint,
-                        metadata=metadata,
-                        complexity=complexity,
-                        history_manager=history_manager
-                    )
+                    with timer('routing_stage_seconds', 'decide'):
+                        decision = decision_engine.decide(
+                            query=query,
+                            fingerprint=fingerprint,
+                            metadata=metadata,
+                            complexity=complexity,
+                            history_manager=history_manager
+                        )
+                    routed = decision
                     cluster_name = decision['cluster']
                     score = decision['score']
                     factors = decision.get('factors', {})
                     logger.info("statement_routing computed cluster=%s score=%.3f fingerprint=%s volume=%.2f complexity=%.2f historical=%.2f",
                         cluster_name, score, fingerprint[:16], factors.get('volume', 0), factors.get('complexity', 0), factors.get('historical', 0))
-                    history_manager.save_decision(fingerprint, decision)
+                    with timer('routing_stage_seconds', 'metadata'):
+                        decision['tables'] = snapshot_tracker.sizes(metadata.keys())
+                    router.save(fingerprint, decision)
+
+        if not is_keepalive:
+            admission = await admission_controller.acquire(cluster_name)
+            if admission.spilled:
+                logger.info("statement_spilled from=%s to=%s", cluster_name, admission.cluster)
+            cluster_name = admission.cluster
+        inc('routing_decisions_total', cluster_name)
+        server_span = current_span()
+        server_span.set('dyrasql.cluster', cluster_name)
+        server_span.set('dyrasql.fingerprint', fingerprint)
 
         cluster_url = get_cluster_url(cluster_name)
         logger.info("statement_execute cluster=%s url=%s bypass=%s", cluster_name, cluster_url, BYPASS_MODE)
@@ -421,26 +603,38 @@ async def trino_statement(request: Request):
         for header in ['X-Trino-Catalog', 'X-Trino-Schema', 'X-Trino-Source', 'X-Trino-Client-Info']:
             if header in request.headers:
                 headers[header] = request.headers[header]
+        # Spooled protocol: segments are fetched by the client, not relayed in the pages
+        data_encoding = negotiate_spooling(request.headers.get(SPOOLING_HEADER))
+        if data_encoding:
+            headers[SPOOLING_HEADER] = data_encoding
 
         timeout = 5 if is_keepalive else DATA_TIMEOUT
+        mark_diagnostics(stages, 'routing')
         async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(
-                f"{cluster_url}/v1/statement",
-                content=query,
-                headers=headers
-            )
+            with timer('trino_request_seconds', 'submit'):
+                response = await client.post(
+                    f"{cluster_url}/v1/statement",
+                    content=query,
+                    headers={**headers, **trace_headers()}
+                )
 
             logger.info("statement_response cluster=%s status=%s", cluster_name, response.status_code)
-            response_content = response.content.decode('utf-8')
 
+            # Rewrite URLs based on mode; the same pass finds the query ID
+            response_content, query_id = rewrite_page(response.content, cluster_name)
+            server_span.set('trino.query_id', query_id)
+            inc('proxied_pages_total', cluster_name)
+            inc('proxied_bytes_total', cluster_name, len(response_content))
             # Map query ID to cluster for subsequent requests
-            extract_query_id_and_map_cluster(response_content, cluster_name)
-
-            # Rewrite URLs based on mode
-            if BYPASS_MODE:
-                response_content = rewrite_urls_for_bypass(response_content, cluster_name)
-            else:
-                response_content = rewrite_urls_for_proxy(response_content)
+            await map_query_cluster(query_id, cluster_name)
+            if admission is not None:
+                admission_controller.bind(admission, query_id)
+            if not BYPASS_MODE:
+                metrics_collector.register(query_id, fingerprint, cluster_name)
+                escalation_tracker.register(query_id, EscalationContext(query, headers, cluster_name, fingerprint, runtime))
+            scanner = scan_page(response.content)
+            if scanner.terminal:
+                finish_query(query_id, scanner)
 
             response_headers = {}
             for key, value in response.headers.items():
@@ -449,45 +643,163 @@ async def trino_statement(request: Request):
 
             content_type = response.headers.get('Content-Type', 'application/json')
             response_headers['Content-Type'] = content_type
+            if stages is not None:
+                response_headers.update(diagnostic_headers(stages, cluster_name, fingerprint, routed, cache_hit))
 
             return Response(
-                content=response_content.encode('utf-8'),
+                content=response_content,
                 status_code=response.status_code,
                 headers=response_headers,
                 media_type=content_type
             )
 
+    except AdmissionRejected as e:
+        # Trino clients retry the statement submission on 503
+        return JSONResponse(
+            content={'error': 'Cluster at capacity', 'cluster': e.cluster, 'reason': e.reason},
+            status_code=503,
+            headers={'Retry-After': str(e.retry_after)}
+        )
     except httpx.TimeoutException:
+        admission_controller.release(admission)
         logger.warning("statement_execute timeout")
         raise HTTPException(status_code=504, detail={'error': 'Query execution timeout'})
     except HTTPException:
         raise
     except Exception as e:
+        admission_controller.release(admission)
         logger.exception("statement_execute error=%s", str(e))
         raise HTTPException(status_code=500, detail={'error': 'Query execution failed', 'message': str(e)})
 
 
-async def stream_response(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+async def stream_response(response: httpx.Response, query_id: Optional[str] = None,
+                          rewriter: Optional[PageRewriter] = None,
+                          client: Optional[httpx.AsyncClient] = None,
+                          cluster_name: Optional[str] = None) -> AsyncGenerator[bytes, None]:
     """
     Stream response chunks from cluster to client.
     Minimal memory footprint for large responses.
+    Statement pages are scanned on the fly for the terminal page and its final stats, and
+    their top-level URIs are rewritten by `rewriter`. Closes the upstream response (and client).
+    Statement pages are counted per cluster (`cluster_name`) once fully sent.
     """
-    async for chunk in response.aiter_bytes(chunk_size=8192):
-        yield chunk
+    scanner = PageScanner() if query_id else None
+    encoding = content_encoding(response.headers)
+    # Compressed pages: decoded for the scanner/rewriter; re-encoded only when rewritten
+    decoder = Decoder(encoding) if encoding and (scanner is not None or rewriter is not None) else None
+    encoder = Encoder(encoding) if encoding and rewriter is not None else None
+    if encoding:
+        compression_counters['recompressed' if encoder is not None else 'passthrough'] += 1
+    sent = 0
+    try:
+        async for raw in response.aiter_raw(chunk_size=8192):
+            chunk = decoder.decompress(raw) if decoder is not None else raw
+            if scanner is not None:
+                scanner.feed(chunk)
+            if rewriter is None:
+                sent += len(raw)
+                yield raw
+                continue
+            chunk = rewriter.feed(chunk)
+            if encoder is not None:
+                chunk = encoder.compress(chunk)
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        if rewriter is not None:
+            tail = rewriter.close()
+            if encoder is not None:
+                tail = encoder.compress(tail) + encoder.flush()
+            if tail:
+                sent += len(tail)
+                yield tail
+        if scanner is not None and scanner.terminal:
+            finish_query(query_id, scanner)
+        if query_id and cluster_name:
+            inc('proxied_pages_total', cluster_name)
+            inc('proxied_bytes_total', cluster_name, sent)
+    finally:
+        await response.aclose()
+        if client is not None:
+            await client.aclose()
+
+
+def get_query_id_from_path(path: str) -> Optional[str]:
+    """Trino query ID embedded in statement/query paths, if any."""
+    query_id_match = re.search(r'/(\d{8}_\d{6}_\d{5}_[^/]+)/', path)
+    return query_id_match.group(1) if query_id_match else None
 
 
-def get_cluster_for_path(path: str) -> str:
+async def get_cluster_for_path(path: str) -> str:
     """Determine which cluster handles this path based on query ID."""
-    query_id_match = re.search(r'/(\d{8}_\d{6}_\d{5}_[^/]+)/', path)
-    if query_id_match:
-        query_id = query_id_match.group(1)
-        if query_id in query_cluster_map:
-            cluster_name = query_cluster_map[query_id]
+    query_id = get_query_id_from_path(path)
+    if query_id:
+        cluster_name = await query_cluster_map.get(query_id)
+        if cluster_name:
             logger.debug("path_cluster_resolved path=%s cluster=%s query_id=%s", path[:60], cluster_name, query_id)
             return cluster_name
         else:
-            logger.debug("path_cluster_unknown query_id=%s fallback=ecs", query_id)
-    return 'ecs'
+            logger.debug("path_cluster_unknown query_id=%s fallback=%s", query_id, get_default_cluster())
+    return get_default_cluster()
+
+
+async def escalate_query(query_id: str, reason: str) -> Optional[Response]:
+    """
+    Resubmits a failed/runaway SELECT on the next tier and returns that submission's page in place of
+    the current one, so the client just follows the new nextUri. None when there is no bigger tier.
+    """
+    context = escalation_tracker.forget(query_id)
+    config = cluster_registry.current()
+    next_tier = config.next_tier(context.cluster) if context else None
+    if next_tier is None:
+        return None
+
+    try:
+        admission = await admission_controller.acquire(next_tier.name, config)
+    except AdmissionRejected as e:
+        escalation_tracker.counters['failed'] += 1
+        logger.warning("escalation_failed query_id=%s from=%s reason=%s error=admission_%s", query_id, context.cluster, reason, e.reason)
+        return None
+
+    cluster_name = admission.cluster
+    try:
+        async with httpx.AsyncClient(timeout=DATA_TIMEOUT) as client:
+            response = await client.post(f"{get_cluster_url(cluster_name)}/v1/statement", content=context.query, headers=context.headers)
+            if reason == 'runaway':
+                # Original query is still running: cancel it once the new one is accepted
+                await client.delete(
+                    f"{get_cluster_url(context.cluster)}/v1/query/{query_id}",
+                    headers={'X-Trino-User': context.headers.get('X-Trino-User', 'admin')}
+                )
+                finish_query(query_id, None)
+    except Exception as e:
+        admission_controller.release(admission)
+        escalation_tracker.counters['failed'] += 1
+        logger.warning("escalation_failed query_id=%s from=%s to=%s reason=%s error=%s", query_id, context.cluster, cluster_name, reason, str(e))
+        return None
+
+    response_content, new_query_id = url_rewriters.proxy(cluster_name).rewrite(response.content)
+    await map_query_cluster(new_query_id, cluster_name)
+    admission_controller.bind(admission, new_query_id)
+    metrics_collector.register(new_query_id, context.fingerprint, cluster_name)
+    escalation_tracker.register(new_query_id, EscalationContext(
+        context.query, context.headers, cluster_name, context.fingerprint, hops=context.hops + 1))
+    escalation_tracker.counters['escalated'] += 1
+    logger.info("query_escalated query_id=%s new_query_id=%s from=%s to=%s reason=%s",
+                query_id, new_query_id, context.cluster, cluster_name, reason)
+
+    if context.fingerprint and new_query_id:
+        try:
+            await asyncio.to_thread(record_escalation, context.fingerprint, context.cluster, cluster_name, reason)
+        except Exception as e:
+            logger.warning("escalation_record_failed fingerprint=%s error=%s", context.fingerprint[:16], str(e))
+
+    return Response(
+        content=response_content,
+        status_code=response.status_code,
+        headers={'Content-Type': response.headers.get('Content-Type', 'application/json')},
+        media_type=response.headers.get('Content-Type', 'application/json')
+    )
 
 
 @app.api_route('/{path:path}', methods=['GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'])
@@ -497,59 +809,115 @@ async def proxy_other(path: str, request: Request):
     Uses streaming for large responses to minimize memory usage.
     """
     try:
-        cluster_name = get_cluster_for_path(path)
+        # Rewritten URLs carry their cluster (/c/<token>/...); older ones are looked up by query ID
+        token_cluster, path = routing_tokens.resolve(path, cluster_registry.current())
+        cluster_name = token_cluster or await get_cluster_for_path(path)
         cluster_url = get_cluster_url(cluster_name)
         target_url = f"{cluster_url}/{path}"
+        query_id = get_query_id_from_path(path) if path.startswith('v1/statement/') else None
+        current_span().set('trino.query_id', query_id)
+        current_span().set('dyrasql.cluster', cluster_name)
         logger.debug("proxy_request method=%s path=%s cluster=%s", request.method, path[:60], cluster_name)
 
         headers = {}
         for key, value in request.headers.items():
             if key.lower() not in ['host', 'content-length', 'connection']:
                 headers[key] = value
-        headers['Accept-Encoding'] = 'identity'
+        if SPOOLING_HEADER.lower() in headers:
+            data_encoding = negotiate_spooling(headers.pop(SPOOLING_HEADER.lower()))
+            if data_encoding:
+                headers[SPOOLING_HEADER] = data_encoding
+        # GET pages may come compressed in a codec this client reads (relayed or re-encoded below)
+        headers['Accept-Encoding'] = negotiate(request.headers.get('accept-encoding')) if request.method == 'GET' else 'identity'
 
         body = await request.body() if request.method in ['POST', 'PUT'] else None
 
         # Use streaming for GET requests (data fetching)
         if request.method == 'GET':
-            async with httpx.AsyncClient(timeout=DATA_TIMEOUT) as client:
-                async with client.stream('GET', target_url, headers=headers, params=dict(request.query_params)) as response:
-                    response_headers = {}
-                    for key, value in response.headers.items():
-                        if key.lower() not in ['content-encoding', 'transfer-encoding', 'connection', 'content-length']:
-                            response_headers[key] = value
-
-                    content_type = response.headers.get('Content-Type', 'application/json')
-                    response_headers['Content-Type'] = content_type
-
-                    # Check if we need URL rewriting (for JSON responses with nextUri)
-                    if 'application/json' in content_type:
-                        # Buffer small JSON responses for URL rewriting
-                        content_length = response.headers.get('content-length')
-                        if content_length and int(content_length) < STREAMING_THRESHOLD:
-                            content = b''
-                            async for chunk in response.aiter_bytes():
-                                content += chunk
-
-                            text_content = content.decode('utf-8')
-                            if BYPASS_MODE:
-                                text_content = rewrite_urls_for_bypass(text_content, cluster_name)
-                            else:
-                                text_content = rewrite_urls_for_proxy(text_content)
-
-                            return Response(
-                                content=text_content.encode('utf-8'),
-                                status_code=response.status_code,
-                                headers=response_headers,
-                            )
-
-                    # For large responses or non-JSON, stream directly
-                    return StreamingResponse(
-                        stream_response(response),
-                        status_code=response.status_code,
-                        headers=response_headers,
-                        media_type=content_type
+            # The upstream stream must outlive this handler when the page is streamed to the client
+            client = httpx.AsyncClient(timeout=DATA_TIMEOUT)
+            try:
+                with timer('trino_request_seconds', 'poll'):
+                    response = await client.send(
+                        client.build_request('GET', target_url, headers={**headers, **trace_headers()},
+                                             params=dict(request.query_params)),
+                        stream=True
                     )
+            except BaseException:
+                await client.aclose()
+                raise
+            streaming = False
+            try:
+                response_headers = {}
+                for key, value in response.headers.items():
+                    if key.lower() not in ['content-encoding', 'transfer-encoding', 'connection', 'content-length']:
+                        response_headers[key] = value
+
+                content_type = response.headers.get('Content-Type', 'application/json')
+                response_headers['Content-Type'] = content_type
+                encoding = content_encoding(response.headers)
+                if encoding:
+                    response_headers['Content-Encoding'] = encoding
+
+                # Check if we need URL rewriting (for JSON responses with nextUri)
+                if 'application/json' in content_type:
+                    # Buffer small JSON responses for URL rewriting (threshold applies to the wire size)
+                    content_length = response.headers.get('content-length')
+                    if content_length and int(content_length) < STREAMING_THRESHOLD:
+                        raw = b''.join([chunk async for chunk in response.aiter_raw()])
+                        content = decode(raw, encoding)
+
+                        if response.status_code >= 400:
+                            finish_query(query_id, None)
+                        elif query_id:
+                            scanner = scan_page(content)
+                            if scanner.terminal:
+                                finish_query(query_id, scanner)
+                            else:
+                                admission_controller.touch(query_id)
+
+                        if response.status_code == 200 and escalation_tracker.tracking(query_id):
+                            reason = escalation_tracker.check(query_id, json.loads(content), cluster_registry.current().tier(cluster_name))
+                            if reason:
+                                escalated = await escalate_query(query_id, reason)
+                                if escalated is not None:
+                                    return escalated
+
+                        page = rewrite_page(content, cluster_name)[0]
+                        if encoding:
+                            # Pages without cluster URLs go out exactly as the cluster compressed them
+                            if page is content:
+                                compression_counters['passthrough'] += 1
+                                page = raw
+                            else:
+                                compression_counters['recompressed'] += 1
+                                page = encode(page, encoding)
+                        if query_id:
+                            inc('proxied_pages_total', cluster_name)
+                            inc('proxied_bytes_total', cluster_name, len(page))
+                        return Response(
+                            content=page,
+                            status_code=response.status_code,
+                            headers=response_headers,
+                        )
+
+                admission_controller.touch(query_id)
+                # Large pages carry rows: the query can no longer be escalated
+                escalation_tracker.forget(query_id)
+                # For large responses or non-JSON, stream directly (JSON pages get their head URIs rewritten)
+                rewrite_head = 'application/json' in content_type and not page_url_rewriter(cluster_name).identity
+                rewriter = PageRewriter(page_rewrite_function(cluster_name)) if rewrite_head else None
+                streaming = True
+                return StreamingResponse(
+                    stream_response(response, query_id, rewriter, client, cluster_name),
+                    status_code=response.status_code,
+                    headers=response_headers,
+                    media_type=content_type
+                )
+            finally:
+                if not streaming:
+                    await response.aclose()
+                    await client.aclose()
         else:
             # For non-GET requests, use regular async client
             async with httpx.AsyncClient(timeout=DATA_TIMEOUT) as client:
@@ -559,6 +927,8 @@ async def proxy_other(path: str, request: Request):
                     response = await client.put(target_url, content=body, headers=headers)
                 elif request.method == 'DELETE':
                     response = await client.delete(target_url, headers=headers)
+                    if '/partialCancel/' not in path:
+                        finish_query(query_id, None)
                 elif request.method == 'HEAD':
                     response = await client.head(target_url, headers=headers)
                 elif request.method == 'OPTIONS':
@@ -566,12 +936,7 @@ async def proxy_other(path: str, request: Request):
                 else:
                     raise HTTPException(status_code=405, detail={'error': 'Method not allowed'})
 
-                response_content = response.content.decode('utf-8')
-
-                if BYPASS_MODE:
-                    response_content = rewrite_urls_for_bypass(response_content, cluster_name)
-                else:
-                    response_content = rewrite_urls_for_proxy(response_content)
+                response_content = rewrite_page(response.content, cluster_name)[0]
 
                 response_headers = {}
                 for key, value in response.headers.items():
@@ -582,7 +947,7 @@ async def proxy_other(path: str, request: Request):
                 response_headers['Content-Type'] = content_type
 
                 return Response(
-                    content=response_content.encode('utf-8'),
+                    content=response_content,
                     status_code=response.status_code,
                     headers=response_headers,
                     media_type=content_type
@@ -598,20 +963,52 @@ async def proxy_other(path: str, request: Request):
         raise HTTPException(status_code=500, detail={'error': 'Proxy request failed', 'message': str(e)})
 
 
+# Trino query states after which the coordinator no longer runs the query
+TERMINAL_QUERY_STATES = ('FINISHED', 'FAILED')
+
+
+async def query_finished(cluster_name: str, query_id: str) -> bool:
+    """Admission reconcile probe: True once the coordinator reports the query done (or forgotten)."""
+    async with httpx.AsyncClient(timeout=5) as client:
+        response = await client.get(
+            f"{get_cluster_url(cluster_name)}/v1/query/{query_id}",
+            params={'pruned': 'true'},
+            headers={'X-Trino-User': 'dyrasql', 'Accept-Encoding': 'identity'}
+        )
+    if response.status_code in (404, 410):
+        return True
+    if response.status_code != 200:
+        return False
+    return response.json().get('state') in TERMINAL_QUERY_STATES
+
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event."""
     logger.info("dyrasql_core starting version=1.1.0 bypass_mode=%s streaming_threshold=%s",
                 BYPASS_MODE, STREAMING_THRESHOLD)
+    cluster_registry.start_watching(asyncio.get_running_loop())
+    admission_controller.start(query_finished)
+    metrics_collector.start()
+    query_cluster_map.start()
+    catalog_cache.start()
+    await worker_stats.start()
+    start_profiling()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event."""
     logger.info("dyrasql_core shutting down")
+    await metrics_collector.stop()
+    await worker_stats.stop()
+    await stop_profiling()
+    await catalog_cache.stop()
+    shutdown_tracing()
+    shutdown_logging()
 
 
 if __name__ == '__main__':
-    import uvicorn
     port = int(os.getenv('PORT', 5000))
-    uvicorn.run(app, host='0.0.0.0', port=port)
+    # DYRASQL_WORKERS > 1: supervisor with that many SO_REUSEPORT workers
+    serve(app, port)
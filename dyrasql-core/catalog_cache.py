@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Catalog Cache - per-user snapshot of catalogs, schemas, tables and columns that answers IDE
+discovery statements (SHOW CATALOGS/SCHEMAS/TABLES/COLUMNS, DESCRIBE) in the proxy.
+Trino filters metadata by user, so each snapshot is loaded as the user who asks, from the
+default tier's information_schema: the same tables Trino rewrites these statements into, so
+names, order and types match the cluster's answer. A user's first discovery statement,
+anything the snapshot cannot answer exactly (unknown catalog/schema/table, LIKE ... ESCAPE,
+roles or extra credentials) and catalogs that failed to load fall through to the cluster.
+Snapshots are reloaded in the background every DYRASQL_CATALOG_CACHE_SECONDS and served for
+at most twice that; DDL through the proxy (and POST /api/v1/catalog-cache/invalidate) drops them
+in every worker: the invalidating worker appends a byte to a generation file in
+DYRASQL_WORKER_STATS_DIR, and each worker compares its size before serving a snapshot.
+Statements without X-Trino-User are not answered.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from probes import column, finished_page
+
+logger = logging.getLogger(__name__)
+
+
+ENABLED = os.getenv('DYRASQL_CATALOG_CACHE', 'true').lower() == 'true'
+
+_IDENT = r'(?:"(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_@$]*)'
+_QUALIFIED = rf'{_IDENT}(?:\s*\.\s*{_IDENT}){{0,2}}'
+_LIKE = r"(?:\s+LIKE\s+'(?P<like>(?:[^']|'')*)')?"
+_FLAGS = re.IGNORECASE | re.DOTALL
+
+SHOW_CATALOGS = re.compile(r'SHOW\s+CATALOGS' + _LIKE, _FLAGS)
+SHOW_SCHEMAS = re.compile(rf'SHOW\s+SCHEMAS(?:\s+(?:FROM|IN)\s+(?P<name>{_IDENT}))?' + _LIKE, _FLAGS)
+SHOW_TABLES = re.compile(rf'SHOW\s+TABLES(?:\s+(?:FROM|IN)\s+(?P<name>{_QUALIFIED}))?' + _LIKE, _FLAGS)
+SHOW_COLUMNS = re.compile(rf'(?:SHOW\s+COLUMNS\s+(?:FROM|IN)|DESCRIBE|DESC)\s+(?P<name>{_QUALIFIED})', _FLAGS)
+_NAME_PART = re.compile(_IDENT)
+
+# Statements that change what discovery returns
+DDL = re.compile(r'\s*(?:CREATE|DROP|ALTER|COMMENT|GRANT|REVOKE|DENY)\b', re.IGNORECASE)
+
+# Identities the snapshot (keyed by user) does not capture
+IDENTITY_HEADERS = ('X-Trino-Role', 'X-Trino-Extra-Credential', 'X-Trino-Set-Authorization')
+
+
+def _names(qualified: str) -> List[str]:
+    """Trino folds identifiers to lower case, quoted or not."""
+    return [
+        (part[1:-1].replace('""', '"') if part.startswith('"') else part).lower()
+        for part in _NAME_PART.findall(qualified)
+    ]
+
+
+def _like(pattern: Optional[str]):
+    """Full-match regex for a LIKE pattern (no ESCAPE); None = no filter."""
+    if pattern is None:
+        return None
+    pattern = pattern.replace("''", "'")
+    return re.compile(''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern), re.DOTALL)
+
+
+class CatalogSnapshot:
+    """One user's view: catalog -> schemas, tables and columns (None when not loaded)."""
+
+    __slots__ = ('loaded_at', 'catalogs', 'schemas', 'tables', 'columns')
+
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+        self.catalogs: List[str] = []
+        self.schemas: Dict[str, List[str]] = {}
+        self.tables: Dict[Tuple[str, str], List[str]] = {}
+        self.columns: Dict[Tuple[str, str, str], List[List[Any]]] = {}
+
+
+class CatalogCache:
+    """Discovery answers from per-user snapshots loaded off the request path."""
+
+    def __init__(self, cluster_registry):
+        self.cluster_registry = cluster_registry
+        self.refresh_seconds = float(os.getenv('DYRASQL_CATALOG_CACHE_SECONDS', '300'))
+        self.max_users = int(os.getenv('DYRASQL_CATALOG_CACHE_USERS', '100'))
+        self.max_columns = int(os.getenv('DYRASQL_CATALOG_CACHE_MAX_COLUMNS', '200000'))
+        self._snapshots: 'OrderedDict[str, CatalogSnapshot]' = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._generation = 0
+        # Shared with the other workers; its size is the invalidation count
+        self._generation_path: Optional[str] = None
+        self._shared_generation = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self.counters = {'hits': 0, 'misses': 0, 'loads': 0, 'load_failures': 0, 'invalidations': 0}
+
+    def start(self) -> None:
+        stats_dir = os.getenv('DYRASQL_WORKER_STATS_DIR')
+        if stats_dir:
+            self._generation_path = os.path.join(stats_dir, 'catalog-cache.generation')
+            self._shared_generation = self._read_shared_generation()
+        self._client = httpx.AsyncClient(timeout=float(os.getenv('DYRASQL_CATALOG_CACHE_TIMEOUT', '60')))
+
+    async def stop(self) -> None:
+        for task in list(self._loading.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    def answer(self, query: str, headers, base_url: str) -> Optional[bytes]:
+        """FINISHED page for a discovery statement the snapshot answers exactly; None otherwise."""
+        if not ENABLED or self._client is None:
+            return None
+        statement = query.strip().rstrip(';').strip()
+        matches = [(kind, pattern.fullmatch(statement)) for kind, pattern in (
+            ('catalogs', SHOW_CATALOGS), ('schemas', SHOW_SCHEMAS), ('tables', SHOW_TABLES), ('columns', SHOW_COLUMNS))]
+        kind, match = next(((k, m) for k, m in matches if m), (None, None))
+        user = headers.get('X-Trino-User')
+        if match is None or not user or any(headers.get(h) for h in IDENTITY_HEADERS):
+            return None
+        self._follow_invalidations()
+        snapshot = self._snapshots.get(user)
+        age = time.monotonic() - snapshot.loaded_at if snapshot is not None else None
+        if age is None or age >= self.refresh_seconds:
+            self._schedule(user)
+        if age is None or age >= 2 * self.refresh_seconds:
+            self.counters['misses'] += 1
+            return None
+        self._snapshots.move_to_end(user)
+        result = getattr(self, '_' + kind)(snapshot, match, headers)
+        if result is None:
+            self.counters['misses'] += 1
+            return None
+        self.counters['hits'] += 1
+        names, rows = result
+        return finished_page(base_url, [column(name, 'varchar') for name in names], rows)
+
+    def observe(self, query: str) -> None:
+        """Drops every snapshot when a statement may change what discovery returns."""
+        if (self._snapshots or self._generation_path) and DDL.match(query):
+            logger.info("catalog_cache_invalidated reason=ddl statement=%s", query.strip()[:40].replace('\n', ' '))
+            self.invalidate()
+
+    def invalidate(self) -> int:
+        """Drops this worker's snapshots and tells the other workers to drop theirs."""
+        if self._generation_path:
+            try:
+                with open(self._generation_path, 'ab') as f:
+                    f.write(b'.')
+                self._shared_generation = self._read_shared_generation()
+            except OSError as e:
+                logger.warning("catalog_cache_broadcast_failed error=%s", str(e))
+        return self._drop()
+
+    def _drop(self) -> int:
+        dropped = len(self._snapshots)
+        self._snapshots.clear()
+        self._generation += 1
+        self.counters['invalidations'] += 1
+        return dropped
+
+    def _read_shared_generation(self) -> int:
+        try:
+            return os.stat(self._generation_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _follow_invalidations(self) -> None:
+        """Drops the snapshots when another worker invalidated since the last check."""
+        if self._generation_path:
+            generation = self._read_shared_generation()
+            if generation != self._shared_generation:
+                self._shared_generation = generation
+                dropped = self._drop()
+                logger.debug("catalog_cache_invalidated reason=worker snapshots=%s", dropped)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'users': len(self._snapshots), 'loading': len(self._loading), **self.counters}
+
+    # Answers: (column names, rows), as Trino's rewrite of the statement returns them
+
+    def _catalogs(self, snapshot, match, headers):
+        like = _like(match.group('like'))
+        return ['Catalog'], [[c] for c in sorted(snapshot.catalogs) if like is None or like.fullmatch(c)]
+
+    def _schemas(self, snapshot, match, headers):
+        catalog = _names(match.group('name'))[0] if match.group('name') else (headers.get('X-Trino-Catalog') or '').lower()
+        schemas = snapshot.schemas.get(catalog)
+        if schemas is None:
+            return None
+        like = _like(match.group('like'))
+        return ['Schema'], [[s] for s in sorted(schemas) if like is None or like.fullmatch(s)]
+
+    def _tables(self, snapshot, match, headers):
+        names = _names(match.group('name')) if match.group('name') else [(headers.get('X-Trino-Schema') or '').lower()]
+        if len(names) > 2:
+            return None
+        if len(names) == 1:
+            names.insert(0, (headers.get('X-Trino-Catalog') or '').lower())
+        tables = snapshot.tables.get(tuple(names))
+        if tables is None:
+            return None
+        like = _like(match.group('like'))
+        return ['Table'], [[t] for t in sorted(tables) if like is None or like.fullmatch(t)]
+
+    def _columns(self, snapshot, match, headers):
+        names = _names(match.group('name'))
+        if len(names) < 3:
+            names[:0] = [(headers.get('X-Trino-Catalog') or '').lower(),
+                         (headers.get('X-Trino-Schema') or '').lower()][:3 - len(names)]
+        columns = snapshot.columns.get(tuple(names))
+        if columns is None:
+            return None
+        return ['Column', 'Type', 'Extra', 'Comment'], columns
+
+    # Loading
+
+    def _schedule(self, user: str) -> None:
+        if user not in self._loading:
+            self._loading[user] = asyncio.get_running_loop().create_task(self._refresh(user, self._generation))
+
+    async def _refresh(self, user: str, generation: int) -> None:
+        started = time.monotonic()
+        try:
+            snapshot = await self._load(user)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counters['load_failures'] += 1
+            logger.warning("catalog_cache_load_failed user=%s error=%s", user, str(e))
+            return
+        finally:
+            self._loading.pop(user, None)
+        if generation != self._generation:
+            return
+        self.counters['loads'] += 1
+        self._snapshots[user] = snapshot
+        self._snapshots.move_to_end(user)
+        while len(self._snapshots) > self.max_users:
+            self._snapshots.popitem(last=False)
+        logger.info("catalog_cache_loaded user=%s catalogs=%s tables=%s seconds=%.2f",
+                    user, len(snapshot.schemas), sum(len(t) for t in snapshot.tables.values()), time.monotonic() - started)
+
+    async def _load(self, user: str) -> CatalogSnapshot:
+        snapshot = CatalogSnapshot()
+        snapshot.catalogs = [row[0] for row in await self._query('SELECT catalog_name FROM system.metadata.catalogs', user)]
+        for catalog in snapshot.catalogs:
+            prefix = '"' + catalog.replace('"', '""') + '".information_schema'
+            try:
+                schemas = await self._query(f'SELECT schema_name FROM {prefix}.schemata', user)
+                tables = await self._query(f'SELECT table_schema, table_name FROM {prefix}.tables', user)
+                columns = await self._query(
+                    f'SELECT table_schema, table_name, column_name, data_type, extra_info, comment '
+                    f'FROM {prefix}.columns ORDER BY table_schema, table_name, ordinal_position', user)
+            except Exception as e:
+                # Statements on this catalog keep going to the cluster
+                logger.warning("catalog_cache_catalog_skipped user=%s catalog=%s error=%s", user, catalog, str(e))
+                continue
+            snapshot.schemas[catalog] = [row[0] for row in schemas]
+            for schema in snapshot.schemas[catalog]:
+                snapshot.tables[(catalog, schema)] = []
+            for schema, table in tables:
+                snapshot.tables.setdefault((catalog, schema), []).append(table)
+            if len(columns) > self.max_columns:
+                logger.info("catalog_cache_columns_skipped user=%s catalog=%s columns=%s", user, catalog, len(columns))
+                continue
+            for schema, table, name, data_type, extra, comment in columns:
+                snapshot.columns.setdefault((catalog, schema, table), []).append([name, data_type, extra, comment])
+        return snapshot
+
+    async def _query(self, sql: str, user: str) -> List[List[Any]]:
+        """Runs a statement on the default tier and returns all its rows."""
+        config = self.cluster_registry.current()
+        headers = {'X-Trino-User': user, 'X-Trino-Source': 'dyrasql-catalog-cache'}
+        response = await self._client.post(f"{config.tier(config.default_tier).url}/v1/statement", content=sql, headers=headers)
+        rows: List[List[Any]] = []
+        while True:
+            response.raise_for_status()
+            page = response.json()
+            if page.get('error'):
+                raise RuntimeError(page['error'].get('message', 'query failed'))
+            rows.extend(page.get('data') or [])
+            if not page.get('nextUri'):
+                return rows
+            response = await self._client.get(page['nextUri'], headers=headers)
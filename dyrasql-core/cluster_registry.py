@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cluster Registry - N-tier cluster definitions shared by dyrasql-core and trino-gateway-proxy.
+Each tier has a score band, internal/external URL and capacity metadata; routing weights live
+alongside. Loaded from DYRASQL_CLUSTER_REGISTRY (YAML) and swapped atomically on file change
+or SIGHUP. Without a file, the legacy TRINO_*_URL / DYRASQL_* env vars define three tiers.
+"""
+
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+# ${VAR} / ${VAR:-default} references in the registry file are expanded from the environment
+ENV_REFERENCE = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)(?::-([^}]*))?\}')
+
+WEIGHT_KEYS = ('volume', 'complexity', 'historical')
+
+
+class Tier:
+    """One cluster tier: receives scores up to max_score (None = unbounded, last tier only)."""
+
+    def __init__(self, name: str, url: str, external_url: Optional[str] = None,
+                 max_score: Optional[float] = None, inclusive: bool = False,
+                 capacity: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.external_url = (external_url or url).rstrip('/')
+        self.max_score = max_score
+        self.inclusive = inclusive
+        self.capacity = dict(capacity or {})
+
+    def accepts(self, score: float) -> bool:
+        if self.max_score is None:
+            return True
+        return score <= self.max_score if self.inclusive else score < self.max_score
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'url': self.url,
+            'external_url': self.external_url,
+            'max_score': self.max_score,
+            'inclusive': self.inclusive,
+            'capacity': self.capacity,
+        }
+
+
+class RoutingConfig:
+    """Immutable snapshot of tiers and weights. Readers take one snapshot per request."""
+
+    def __init__(self, tiers: List[Tier], weights: Dict[str, float], default_tier: Optional[str] = None,
+                 source: str = 'env', retired: Optional[Dict[str, Tier]] = None):
+        if not tiers:
+            raise ValueError("cluster registry has no tiers")
+        names = [t.name for t in tiers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate tier names: {names}")
+        for tier in tiers[:-1]:
+            if tier.max_score is None:
+                raise ValueError(f"tier {tier.name} needs max_score (only the last tier is unbounded)")
+        bounds = [t.max_score for t in tiers[:-1]]
+        if bounds != sorted(bounds):
+            raise ValueError(f"tiers must be ordered by ascending max_score: {bounds}")
+        missing = [k for k in WEIGHT_KEYS if k not in weights]
+        if missing:
+            raise ValueError(f"missing weights: {missing}")
+
+        self.tiers = tuple(tiers)
+        self.weights = {k: float(weights[k]) for k in WEIGHT_KEYS}
+        self.default_tier = default_tier or tiers[0].name
+        if self.default_tier not in names:
+            raise ValueError(f"default_tier {self.default_tier} is not a tier")
+        self.source = source
+        self.loaded_at = time.time()
+        self._by_name = {t.name: t for t in tiers}
+        # Tiers removed by a reload stay resolvable so in-flight queries finish on them
+        self.retired = {name: tier for name, tier in (retired or {}).items() if name not in self._by_name}
+
+        total_weight = sum(self.weights.values())
+        if abs(total_weight - 1.0) > 0.1:
+            logger.warning("cluster_registry weights sum=%.2f (expected 1.0)", total_weight)
+
+    @property
+    def names(self) -> List[str]:
+        return [t.name for t in self.tiers]
+
+    def tier(self, name: Optional[str]) -> Tier:
+        """Tier by name (active or retired); unknown names resolve to the default tier."""
+        tier = self._by_name.get(name) or self.retired.get(name)
+        return tier or self._by_name[self.default_tier]
+
+    def has_tier(self, name: Optional[str]) -> bool:
+        return name in self._by_name or name in self.retired
+
+    def select(self, score: float) -> Tier:
+        for tier in self.tiers:
+            if tier.accepts(score):
+                return tier
+        return self.tiers[-1]
+
+    def next_tier(self, name: str) -> Optional[Tier]:
+        """The next bigger tier, or None for the last one."""
+        names = self.names
+        if name not in names:
+            return None
+        index = names.index(name) + 1
+        return self.tiers[index] if index < len(self.tiers) else None
+
+    def all_tiers(self) -> List[Tier]:
+        """Active and retired tiers (for URL rewriting of in-flight queries)."""
+        return list(self.tiers) + list(self.retired.values())
+
+    def with_overrides(self, weights: Optional[Dict[str, float]] = None,
+                       max_scores: Optional[Dict[str, float]] = None) -> 'RoutingConfig':
+        """Copy with other weights / band bounds (replay sweeps)."""
+        tiers = [
+            Tier(t.name, t.url, t.external_url,
+                 (max_scores or {}).get(t.name, t.max_score), t.inclusive, t.capacity)
+            for t in self.tiers
+        ]
+        merged = dict(self.weights)
+        merged.update(weights or {})
+        return RoutingConfig(tiers, merged, self.default_tier, source=self.source)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'source': self.source,
+            'loaded_at': self.loaded_at,
+            'default_tier': self.default_tier,
+            'weights': self.weights,
+            'tiers': [t.to_dict() for t in self.tiers],
+            'retired': sorted(self.retired),
+        }
+
+
+def _env_weights() -> Dict[str, float]:
+    return {
+        'volume': float(os.getenv('DYRASQL_WEIGHT_VOLUME', '0.5')),
+        'complexity': float(os.getenv('DYRASQL_WEIGHT_COMPLEXITY', '0.3')),
+        'historical': float(os.getenv('DYRASQL_WEIGHT_HISTORICAL', '0.2')),
+    }
+
+
+def config_from_env() -> RoutingConfig:
+    """Legacy three-tier layout: score < ECS threshold, <= EMR Standard threshold, above."""
+    tiers = [
+        Tier('ecs',
+             os.getenv('TRINO_ECS_URL', 'http://trino-ecs:8080'),
+             os.getenv('TRINO_ECS_EXTERNAL_URL', 'http://localhost:8081'),
+             max_score=float(os.getenv('DYRASQL_ECS_THRESHOLD', '0.3'))),
+        Tier('emr-standard',
+             os.getenv('TRINO_EMR_STANDARD_URL', 'http://trino-emr-standard:8080'),
+             os.getenv('TRINO_EMR_STANDARD_EXTERNAL_URL', 'http://localhost:8082'),
+             max_score=float(os.getenv('DYRASQL_EMR_STANDARD_THRESHOLD', '0.7')), inclusive=True),
+        Tier('emr-optimized',
+             os.getenv('TRINO_EMR_OPTIMIZED_URL', 'http://trino-emr-optimized:8080'),
+             os.getenv('TRINO_EMR_OPTIMIZED_EXTERNAL_URL', 'http://localhost:8083')),
+    ]
+    return RoutingConfig(tiers, _env_weights(), 'ecs', source='env')
+
+
+def config_from_file(path: str, retired: Optional[Dict[str, Tier]] = None) -> RoutingConfig:
+    """Parses a registry YAML file. Weights not present in the file come from env."""
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = f.read()
+    raw = ENV_REFERENCE.sub(lambda m: os.getenv(m.group(1), m.group(2) or ''), raw)
+    data = yaml.safe_load(raw) or {}
+
+    tiers = []
+    for entry in data.get('tiers') or []:
+        if not entry.get('name') or not entry.get('url'):
+            raise ValueError(f"tier entries need name and url: {entry}")
+        max_score = entry.get('max_score')
+        tiers.append(Tier(
+            str(entry['name']),
+            str(entry['url']),
+            entry.get('external_url'),
+            float(max_score) if max_score is not None else None,
+            bool(entry.get('inclusive', False)),
+            entry.get('capacity'),
+        ))
+
+    weights = _env_weights()
+    weights.update({k: float(v) for k, v in (data.get('weights') or {}).items() if k in WEIGHT_KEYS})
+    return RoutingConfig(tiers, weights, data.get('default_tier'), source=path, retired=retired)
+
+
+class ClusterRegistry:
+    """Holds the current RoutingConfig and replaces it atomically on reload."""
+
+    def __init__(self, path: Optional[str] = None, config: Optional[RoutingConfig] = None):
+        self.path = path if path is not None else os.getenv('DYRASQL_CLUSTER_REGISTRY')
+        self.poll_interval = float(os.getenv('DYRASQL_REGISTRY_POLL_SECONDS', '5'))
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._mtime = None
+        # mtime of a file that failed to load: polling waits for the next change instead of retrying
+        self._failed_mtime = None
+
+        if config is not None:
+            # Fixed snapshot (replay/benchmarks): never reloads
+            self.path = None
+            self._config = config
+        elif self.path:
+            self._mtime = self._file_mtime()
+            self._config = config_from_file(self.path)
+        else:
+            self._config = config_from_env()
+
+        logger.info("cluster_registry loaded source=%s tiers=%s weights=%s",
+                    self._config.source, ','.join(self._config.names), self._config.weights)
+
+    def current(self) -> RoutingConfig:
+        """Current snapshot; a plain attribute read, never blocks on reloads."""
+        return self._config
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """Re-reads the registry file. An invalid file keeps the current config."""
+        if not self.path:
+            return False
+        with self._reload_lock:
+            previous = self._config
+            retired = dict(previous.retired)
+            retired.update({t.name: t for t in previous.tiers})
+            try:
+                mtime = self._file_mtime()
+                config = config_from_file(self.path, retired=retired)
+            except Exception as e:
+                logger.error("cluster_registry reload_failed path=%s error=%s", self.path, str(e))
+                self._failed_mtime = mtime
+                return False
+            self._mtime = mtime
+            self._failed_mtime = None
+            self._config = config
+            logger.info("cluster_registry reloaded tiers=%s retired=%s weights=%s",
+                        ','.join(config.names), ','.join(sorted(config.retired)) or '-', config.weights)
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._mtime and mtime != self._failed_mtime:
+                self.reload()
+
+    def start_watching(self, loop=None):
+        """Polls the file for changes (daemon thread) and reloads on SIGHUP when a loop is given."""
+        if not self.path:
+            return
+        if self._watcher is None and self.poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name='cluster-registry-watch', daemon=True)
+            self._watcher.start()
+        if loop is not None and hasattr(signal, 'SIGHUP'):
+            try:
+                loop.add_signal_handler(signal.SIGHUP, self.reload)
+            except (NotImplementedError, RuntimeError, ValueError) as e:
+                logger.warning("cluster_registry sighup_unavailable error=%s", str(e))
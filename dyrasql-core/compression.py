@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compression - content-encoding negotiation and streaming codecs for relayed Trino pages.
+The upstream Accept-Encoding is the client's own list restricted to the codecs the proxy can
+decode (gzip; zstd when the `zstandard` package is installed), so the cluster compresses only
+what this client reads. Responses that need no rewrite are relayed as the cluster sent them
+(a decoder on the side feeds the page scanner); pages whose URLs are rewritten are decoded,
+rewritten and re-encoded chunk by chunk in the same codec.
+"""
+
+import functools
+import os
+import zlib
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd is simply not offered upstream
+    zstandard = None
+
+
+ENABLED = os.getenv('DYRASQL_COMPRESSION', 'true').lower() == 'true'
+GZIP_LEVEL = int(os.getenv('DYRASQL_COMPRESSION_GZIP_LEVEL', '1'))
+ZSTD_LEVEL = int(os.getenv('DYRASQL_COMPRESSION_ZSTD_LEVEL', '3'))
+
+# Preferred first when the client weighs them equally
+CODECS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+# Relayed responses by how their body was handled (compressed upstream responses only)
+counters: Dict[str, int] = {'passthrough': 0, 'recompressed': 0}
+
+
+@functools.lru_cache(maxsize=256)
+def negotiate(accept_encoding: Optional[str]) -> str:
+    """Accept-Encoding for the upstream request: the client's supported codecs by its q order."""
+    if not ENABLED or not accept_encoding:
+        return 'identity'
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        for codec in (CODECS if name == '*' else (name,)):
+            if codec in CODECS and codec not in weights:
+                weights[codec] = q
+    accepted = sorted((codec for codec, q in weights.items() if q > 0), key=lambda c: (-weights[c], CODECS.index(c)))
+    return ', '.join(accepted) or 'identity'
+
+
+def content_encoding(headers) -> str:
+    """Codec of an upstream body ('' when not encoded)."""
+    encoding = headers.get('content-encoding', '').strip().lower()
+    return '' if encoding in ('', 'identity') else encoding
+
+
+class Decoder:
+    """Streaming decoder; gzip may come as several members."""
+
+    __slots__ = ('encoding', '_obj')
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._obj = self._new()
+
+    def _new(self):
+        if self.encoding == 'gzip':
+            return zlib.decompressobj(zlib.MAX_WBITS | 16)
+        if self.encoding == 'zstd' and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompressobj()
+        raise ValueError(f"unsupported content-encoding {self.encoding}")
+
+    def decompress(self, data: bytes) -> bytes:
+        out = self._obj.decompress(data)
+        if self.encoding == 'gzip':
+            while self._obj.eof and self._obj.unused_data:
+                rest = self._obj.unused_data
+                self._obj = self._new()
+                out += self._obj.decompress(rest)
+        return out
+
+
+class Encoder:
+    """Streaming encoder: compress() every chunk, then flush() once."""
+
+    __slots__ = ('encoding', '_obj')
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        elif encoding == 'zstd' and zstandard is not None:
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"unsupported content-encoding {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) if data else b''
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+def decode(data: bytes, encoding: str) -> bytes:
+    return Decoder(encoding).decompress(data) if encoding else data
+
+
+def encode(data: bytes, encoding: str) -> bytes:
+    if not encoding:
+        return data
+    encoder = Encoder(encoding)
+    return encoder.compress(data) + encoder.flush()
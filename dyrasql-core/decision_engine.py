@@ -5,41 +5,49 @@
 """
 Decision Engine - Implements the routing decision algorithm.
 Score: S = w1×fv + w2×fc + w3×fh (volume, complexity, historical).
+Weights and tier score bands come from the cluster registry, read per decision.
 """
 
-import math
 import logging
-import os
+
+import numpy as np
+
+from cluster_registry import ClusterRegistry
 
 logger = logging.getLogger(__name__)
 
 
-class DecisionEngine:
-    """Computes routing score and selects the target cluster."""
+# Volume factor constants (fv): file size estimate and normalization limits
+AVG_FILE_SIZE_MB = 50
+MAX_FILES = 10000
+MAX_SIZE_GB = 1000
+MIN_SIZE_GB = 0.001
+OPTIMIZATION_FACTOR = 0.1
+LOG_MAX_FILES = float(np.log(MAX_FILES))
+LOG_MAX_SIZE_GB = float(np.log(MAX_SIZE_GB))
+VOLUME_SCALE = 1 - OPTIMIZATION_FACTOR
 
-    
-    def __init__(self):
+# Complexity factor normalization limit (Lc)
+COMPLEXITY_LIMIT = 2.0
 
-                                                                            
-        self.w1 = float(os.getenv('DYRASQL_WEIGHT_VOLUME', '0.5'))                        
+# Complexity columns accepted by decide_batch(), same keys as analyze_complexity()
+COMPLEXITY_KEYS = ('joins', 'aggregations', 'subqueries', 'partitioned_filters', 'non_partitioned_filters')
 
-        self.w2 = float(os.getenv('DYRASQL_WEIGHT_COMPLEXITY', '0.3'))                              
 
-        self.w3 = float(os.getenv('DYRASQL_WEIGHT_HISTORICAL', '0.2'))                           
+class DecisionEngine:
+    """Computes routing score and selects the target cluster."""
 
-        
-        self.ecs_threshold = float(os.getenv('DYRASQL_ECS_THRESHOLD', '0.3'))
+    
+    def __init__(self, registry=None):
+        """registry: ClusterRegistry (weights + tier bands); defaults to DYRASQL_CLUSTER_REGISTRY/env."""
 
-        self.emr_standard_threshold = float(os.getenv('DYRASQL_EMR_STANDARD_THRESHOLD', '0.7'))
+        self.registry = registry if registry is not None else ClusterRegistry()
 
         
-        total_weight = self.w1 + self.w2 + self.w3
+        config = self.registry.current()
 
-        if abs(total_weight - 1.0) > 0.1:
-            logger.warning("decision_engine weights sum=%.2f (expected 1.0)", total_weight)
-
-        logger.info("decision_engine configured w1=%.2f w2=%.2f w3=%.2f ecs_threshold=%.2f emr_standard_threshold=%.2f",
-            self.w1, self.w2, self.w3, self.ecs_threshold, self.emr_standard_threshold)
+        logger.info("decision_engine configured weights=%s tiers=%s",
+            config.weights, ','.join(f"{t.name}<{'=' if t.inclusive else ''}{t.max_score}" for t in config.tiers))
 
     
     def decide(self, query, fingerprint, metadata, complexity, history_manager):
@@ -55,10 +63,14 @@ class DecisionEngine:
         fh = history_manager.get_historical_factor(fingerprint, query)
 
         
-        score = self.w1 * fv + self.w2 * fc + self.w3 * fh
+        config = self.registry.current()
+
+        weights = config.weights
+
+        score = weights['volume'] * fv + weights['complexity'] * fc + weights['historical'] * fh
 
         
-        cluster = self._select_cluster(score)
+        cluster = config.select(score).name
 
         
         decision = {
@@ -103,9 +115,7 @@ class DecisionEngine:
         total_size_gb = total_size_bytes / (1024**3)
 
         
-        avg_file_size_mb = 50
-
-        estimated_files = max(1, int((total_size_gb * 1024) / avg_file_size_mb))
+        estimated_files = max(1, int((total_size_gb * 1024) / AVG_FILE_SIZE_MB))
 
         
         effective_files = estimated_files
@@ -113,38 +123,23 @@ class DecisionEngine:
         effective_size_gb = total_size_gb
 
         
-        max_files = 10000
-
-        max_size_gb = 1000                          
+        if effective_size_gb < MIN_SIZE_GB:
 
-        
-        optimization_factor = 0.1                                                
+            effective_size_gb = MIN_SIZE_GB
 
         
-        if effective_files < 1:
+        # np.log (not math.log) so decide_batch() reproduces this bit-for-bit, band edges included
+        log_files = float(np.log(effective_files))
 
-            effective_files = 1
-
-        if effective_size_gb < 0.001:
-
-            effective_size_gb = 0.001
+        log_size = float(np.log(effective_size_gb))
 
         
-        log_files = math.log(effective_files)
-
-        log_size = math.log(effective_size_gb)
+        normalized_files = min(1.0, log_files / LOG_MAX_FILES)
 
-        log_max_files = math.log(max_files)
-
-        log_max_size = math.log(max_size_gb)
+        normalized_size = min(1.0, log_size / LOG_MAX_SIZE_GB)
 
         
-        normalized_files = min(1.0, log_files / log_max_files)
-
-        normalized_size = min(1.0, log_size / log_max_size)
-
-        
-        fv = (normalized_files * 0.3 + normalized_size * 0.7) * (1 - optimization_factor)
+        fv = (normalized_files * 0.3 + normalized_size * 0.7) * VOLUME_SCALE
 
         
         fv = max(0, min(1, fv))
@@ -169,9 +164,6 @@ class DecisionEngine:
         non_partitioned_filters = complexity.get('non_partitioned_filters', 0)
 
         
-        complexity_limit = 2.0
-
-        
         fc = (
 
             joins * 0.2 +
@@ -184,7 +176,7 @@ class DecisionEngine:
 
             non_partitioned_filters * 0.1
 
-        ) / complexity_limit
+        ) / COMPLEXITY_LIMIT
 
         
         fc = max(0, min(1, fc))
@@ -196,17 +188,88 @@ class DecisionEngine:
 
     
     def _select_cluster(self, score):
-        """Selects cluster by score: < 0.3 ECS, 0.3–0.7 EMR Standard, > 0.7 EMR Optimized."""
+        """Selects the first registry tier whose score band contains the score (default: < 0.3 ECS, 0.3–0.7 EMR Standard, > 0.7 EMR Optimized)."""
+
+        return self.registry.current().select(score).name
+
 
-        if score < self.ecs_threshold:
+    def decide_batch(self, total_size_bytes, complexity, historical=None, config=None):
+        """
+        Vectorized decide() over columnar inputs, for replay/simulation of many rows at once.
+        total_size_bytes: per-row EXPLAIN size (NaN = no metadata, fv 0.5 as in decide()).
+        complexity: dict of COMPLEXITY_KEYS -> per-row counts. historical: per-row fh (default 0.5).
+        config: RoutingConfig to score against (default: current registry snapshot).
+        Returns the same shape as decide() with arrays; results match the scalar path exactly.
+        """
+        config = config if config is not None else self.registry.current()
 
-            return 'ecs'
+        size_bytes = np.asarray(total_size_bytes, dtype=np.float64)
 
-        elif score <= self.emr_standard_threshold:
+        fv = self._calculate_volume_factor_batch(size_bytes)
 
-            return 'emr-standard'
+        fc = self._calculate_complexity_factor_batch(complexity, size_bytes.shape)
 
+        if historical is None:
+            fh = np.full(size_bytes.shape, 0.5)
         else:
+            fh = np.broadcast_to(np.asarray(historical, dtype=np.float64), size_bytes.shape)
+
+        weights = config.weights
+        score = weights['volume'] * fv + weights['complexity'] * fc + weights['historical'] * fh
+
+        cluster_index = self._select_cluster_batch(score, config)
+
+        return {
+            'cluster': np.asarray(config.names)[cluster_index],
+            'cluster_index': cluster_index,
+            'score': score,
+            'factors': {
+                'volume': fv,
+                'complexity': fc,
+                'historical': fh
+            }
+        }
+
+
+    def _calculate_volume_factor_batch(self, size_bytes):
+        """Array version of _calculate_volume_factor(); NaN rows (no metadata) get 0.5."""
+        no_metadata = np.isnan(size_bytes)
+        size_gb = np.where(no_metadata, 0.0, size_bytes) / (1024**3)
 
-            return 'emr-optimized'
+        files = np.maximum(1, ((size_gb * 1024) / AVG_FILE_SIZE_MB).astype(np.int64))
+        log_files = np.log(files.astype(np.float64))
+        log_size = np.log(np.maximum(size_gb, MIN_SIZE_GB))
 
+        normalized_files = np.minimum(1.0, log_files / LOG_MAX_FILES)
+        normalized_size = np.minimum(1.0, log_size / LOG_MAX_SIZE_GB)
+
+        fv = (normalized_files * 0.3 + normalized_size * 0.7) * VOLUME_SCALE
+        fv = np.clip(fv, 0, 1)
+        return np.where(no_metadata, 0.5, fv)
+
+
+    def _calculate_complexity_factor_batch(self, complexity, shape):
+        """Array version of _calculate_complexity_factor(); missing columns count as 0."""
+        def column(key):
+            return np.broadcast_to(np.asarray(complexity.get(key, 0), dtype=np.float64), shape)
+
+        fc = (
+            column('joins') * 0.2 +
+            column('aggregations') * 0.15 +
+            column('subqueries') * 0.25 +
+            column('partitioned_filters') * 0.02 +
+            column('non_partitioned_filters') * 0.1
+        ) / COMPLEXITY_LIMIT
+
+        return np.clip(fc, 0, 1)
+
+
+    def _select_cluster_batch(self, score, config):
+        """Array version of _select_cluster(); returns indexes into config.tiers."""
+        cluster_index = np.full(score.shape, len(config.tiers) - 1, dtype=np.int16)
+        # Assign from the biggest bounded tier down so lower bands win, as in RoutingConfig.select()
+        for index in range(len(config.tiers) - 2, -1, -1):
+            tier = config.tiers[index]
+            in_band = score <= tier.max_score if tier.inclusive else score < tier.max_score
+            cluster_index[in_band] = index
+        return cluster_index
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Diagnostics - routing breakdown headers on the first /v1/statement response of both proxies.
+`Server-Timing` lists the stages timed by `telemetry` for this statement (routing.*,
+dynamodb.*, trino.submit...) plus `routing` (statement received -> submitted to Trino) and
+`total` (-> response built); `X-DyraSQL-*` carry the cluster, cache result, score and factors,
+so client-side engineers can tell routing overhead from Trino time without our logs.
+DYRASQL_DIAGNOSTIC_HEADERS: `false` (default), `request` (only when the client sends
+`X-DyraSQL-Diagnostics: true`) or `true` (every statement). When off, timers pay one module
+constant check and statements nothing else.
+"""
+
+import contextvars
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+MODE = os.getenv('DYRASQL_DIAGNOSTIC_HEADERS', 'false').lower()
+ENABLED = MODE in ('true', 'request')
+REQUEST_HEADER = 'X-DyraSQL-Diagnostics'
+
+# Stage durations (seconds) of the statement being handled; None outside one
+_stages: contextvars.ContextVar = contextvars.ContextVar('dyrasql_stages', default=None)
+
+
+def begin(request_headers) -> Optional[Dict[str, float]]:
+    """Starts collecting stage durations for this statement when its response should carry them."""
+    if not ENABLED:
+        return None
+    if MODE == 'request' and request_headers.get(REQUEST_HEADER, '').lower() not in ('1', 'true'):
+        return None
+    stages = {'started': time.perf_counter()}
+    # Each request runs in its own task, so the value ends with it
+    _stages.set(stages)
+    return stages
+
+
+def record(name: str, seconds: float) -> None:
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def mark(stages: Optional[Dict[str, float]], name: str) -> None:
+    """Time since the statement was received, as stage `name` (e.g. `routing` before the submit)."""
+    if stages is not None:
+        stages[name] = time.perf_counter() - stages['started']
+
+
+def headers(stages: Dict[str, float], cluster: str, fingerprint: Optional[str],
+            decision: Optional[Dict[str, Any]], cached: Optional[bool]) -> Dict[str, str]:
+    """Server-Timing and X-DyraSQL-* headers; `decision` is None for statements routed without one."""
+    mark(stages, 'total')
+    timings = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in stages.items() if name != 'started']
+    result = {'Server-Timing': ', '.join(timings), 'X-DyraSQL-Cluster': cluster}
+    if cached is not None:
+        result['X-DyraSQL-Cache'] = 'hit' if cached else 'miss'
+    if fingerprint:
+        result['X-DyraSQL-Fingerprint'] = fingerprint[:16]
+    if decision:
+        if decision.get('cluster') and decision['cluster'] != cluster:
+            # Spilled by admission control
+            result['X-DyraSQL-Decided-Cluster'] = decision['cluster']
+        if decision.get('score') is not None:
+            result['X-DyraSQL-Score'] = f"{decision['score']:.3f}"
+        factors = decision.get('factors') or {}
+        if factors:
+            result['X-DyraSQL-Factors'] = ', '.join(f'{name}={value:.3f}' for name, value in factors.items()
+                                                    if isinstance(value, (int, float)))
+    return result
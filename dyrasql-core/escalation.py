@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Escalation - moves mis-routed SELECTs to the next tier before any row reaches the client.
+A query is escalated when one of its pages reports a resource error (memory/time limits) or
+it runs far past its expected runtime, as long as no page with data was relayed yet. The proxy
+cancels it, resubmits the same SQL on the next tier and returns that submission's page instead.
+Only works when pages go through the proxy (BYPASS_MODE=false).
+"""
+
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Trino error names that mean "this cluster is too small", not "this query is wrong"
+ESCALATION_ERRORS = frozenset({
+    'EXCEEDED_LOCAL_MEMORY_LIMIT',
+    'EXCEEDED_GLOBAL_MEMORY_LIMIT',
+    'EXCEEDED_TIME_LIMIT',
+    'EXCEEDED_CPU_LIMIT',
+    'EXCEEDED_SCAN_LIMIT',
+    'EXCEEDED_SPILL_LIMIT',
+    'CLUSTER_OUT_OF_MEMORY',
+})
+
+LEADING_COMMENTS = re.compile(r'^\s*(?:(?:--[^\n]*\n|/\*.*?\*/)\s*)*', re.DOTALL)
+WRITE_KEYWORDS = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE|GRANT|REVOKE|CALL|EXECUTE)\b', re.IGNORECASE)
+
+
+def is_idempotent_select(query: str) -> bool:
+    """Plain SELECT / WITH ... SELECT: safe to run again on another cluster."""
+    body = LEADING_COMMENTS.sub('', query, count=1).lstrip('(').lstrip()
+    head = body[:6].upper()
+    if not (head.startswith('SELECT') or head.startswith('WITH')):
+        return False
+    return WRITE_KEYWORDS.search(body) is None
+
+
+class EscalationContext:
+    """What is needed to resubmit a query elsewhere."""
+
+    __slots__ = ('query', 'headers', 'cluster', 'fingerprint', 'expected_runtime', 'hops', 'registered_at')
+
+    def __init__(self, query: str, headers: Dict[str, str], cluster: str, fingerprint: Optional[str],
+                 expected_runtime: Optional[float] = None, hops: int = 0):
+        self.query = query
+        self.headers = headers
+        self.cluster = cluster
+        self.fingerprint = fingerprint
+        self.expected_runtime = expected_runtime
+        self.hops = hops
+        self.registered_at = time.time()
+
+
+class EscalationTracker:
+    """query id -> EscalationContext, for queries that may still be escalated (no rows relayed yet)."""
+
+    def __init__(self):
+        self.enabled = os.getenv('DYRASQL_ESCALATION_ENABLED', 'true').lower() == 'true'
+        self.max_hops = int(os.getenv('DYRASQL_ESCALATION_MAX_HOPS', '2'))
+        self.runtime_factor = float(os.getenv('DYRASQL_ESCALATION_RUNTIME_FACTOR', '5'))
+        self.min_runtime = float(os.getenv('DYRASQL_ESCALATION_MIN_SECONDS', '30'))
+        self.context_ttl = float(os.getenv('DYRASQL_METRICS_CONTEXT_TTL_SECONDS', '3600'))
+        self._contexts: Dict[str, EscalationContext] = {}
+        self.counters = {'escalated': 0, 'failed': 0}
+
+    def register(self, query_id: Optional[str], context: EscalationContext) -> None:
+        if not self.enabled or not query_id or context.hops >= self.max_hops:
+            return
+        if not is_idempotent_select(context.query):
+            return
+        self._contexts[query_id] = context
+        if len(self._contexts) % 1000 == 0:
+            self._expire()
+
+    def tracking(self, query_id: Optional[str]) -> bool:
+        return bool(query_id) and query_id in self._contexts
+
+    def forget(self, query_id: Optional[str]) -> Optional[EscalationContext]:
+        return self._contexts.pop(query_id, None) if query_id else None
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.context_ttl
+        for query_id in [q for q, c in self._contexts.items() if c.registered_at < cutoff]:
+            del self._contexts[query_id]
+
+    def runtime_budget(self, context: EscalationContext, tier) -> Optional[float]:
+        """Seconds after which a query without rows counts as runaway on this tier (None = no limit)."""
+        if context.expected_runtime:
+            return max(self.min_runtime, self.runtime_factor * context.expected_runtime)
+        max_runtime = tier.capacity.get('max_runtime_seconds')
+        return float(max_runtime) if max_runtime else None
+
+    def check(self, query_id: str, page: Dict[str, Any], tier) -> Optional[str]:
+        """Escalation reason for this page, or None. Stops tracking once rows or a final state show up;
+        a query with a reason stays tracked until escalate (forget) takes its context."""
+        context = self._contexts.get(query_id)
+        if context is None:
+            return None
+        if page.get('data'):
+            # Rows are on their way to the client: too late to move the query
+            self.forget(query_id)
+            return None
+
+        error = page.get('error') or {}
+        if error:
+            if error.get('errorName') in ESCALATION_ERRORS:
+                return error['errorName']
+            self.forget(query_id)
+            return None
+        if 'nextUri' not in page:
+            self.forget(query_id)
+            return None
+
+        budget = self.runtime_budget(context, tier)
+        elapsed = (page.get('stats') or {}).get('elapsedTimeMillis', 0) / 1000.0
+        if budget is not None and elapsed > budget:
+            return 'runaway'
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'enabled': self.enabled, 'tracked': len(self._contexts), **self.counters}
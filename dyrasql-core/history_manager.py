@@ -4,6 +4,10 @@
 
 """
 History Manager - Manages routing decision cache and history in DynamoDB.
+Decision TTLs adapt to stability: each re-analysis that lands on the same cluster doubles
+the TTL (from DYRASQL_CACHE_TTL_MIN_HOURS up to DYRASQL_CACHE_TTL_MAX_HOURS); a different
+cluster resets it. The decision's expiry is derived from `decided_at` and `stable_streak`;
+the table's `ttl` attribute only garbage-collects items past the longest decision TTL.
 """
 
 import os
@@ -11,11 +15,40 @@ import boto3
 import json
 import time
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
 
+from telemetry import timed
+
 logger = logging.getLogger(__name__)
 
 
+# Optional metrics attributes written next to execution_time/cost/success (proxy-captured stats).
+# The executed cluster is kept apart from `cluster`, which holds the cached routing decision.
+OPTIONAL_METRICS_FIELDS = {
+    'cluster': 'executed_cluster',
+    'query_id': 'query_id',
+    'state': 'query_state',
+    'error_name': 'error_name',
+    'cpu_time': 'cpu_time',
+    'queued_time': 'queued_time',
+    'processed_bytes': 'processed_bytes',
+    'processed_rows': 'processed_rows',
+    'peak_memory_bytes': 'peak_memory_bytes',
+}
+
+
+# Hours an item outlives the longest decision TTL before DynamoDB deletes it (`ttl` attribute)
+ITEM_TTL_MARGIN_HOURS = 24
+
+
+def _dynamodb_value(value):
+    """DynamoDB numbers must be Decimal (boto3 rejects float)."""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return value
+
+
 class HistoryManager:
     """Manages decision cache and history in DynamoDB."""
 
@@ -28,7 +61,9 @@ class HistoryManager:
 
         self.aws_profile = os.getenv('AWS_PROFILE', 'default')
 
-        self.cache_ttl_hours = 24
+        self.cache_ttl_min_hours = float(os.getenv('DYRASQL_CACHE_TTL_MIN_HOURS', '24'))
+
+        self.cache_ttl_max_hours = float(os.getenv('DYRASQL_CACHE_TTL_MAX_HOURS', '168'))
 
         
         try:
@@ -47,8 +82,9 @@ class HistoryManager:
             self.table = None
 
     
+    @timed('dynamodb_request_seconds', 'get_cached_decision')
     def get_cached_decision(self, fingerprint):
-        """Returns cached decision for fingerprint if TTL is still valid (24h)."""
+        """Returns cached decision for fingerprint if its (adaptive) TTL is still valid."""
 
         if not self.table:
 
@@ -72,12 +108,10 @@ class HistoryManager:
             item = response['Item']
 
             
-            ttl = item.get('ttl', 0)
-
             current_time = int(time.time())
 
             
-            if ttl > current_time:
+            if self.decision_expires_at(item) > current_time:
 
                 logger.debug("cache_hit fingerprint=%s", fingerprint[:16])
 
@@ -101,7 +135,17 @@ class HistoryManager:
 
                     'factors': factors,
 
-                    'timestamp': item.get('timestamp')
+                    'timestamp': item.get('timestamp'),
+
+                    # Last captured run, if any (expected runtime for escalation)
+                    'execution_time': float(item['execution_time']) if item.get('execution_time') is not None else None,
+
+                    'executed_cluster': item.get('executed_cluster'),
+
+                    # Iceberg snapshot size per referenced table when the decision was made
+                    'tables': json.loads(item['tables']) if item.get('tables') else {},
+
+                    'stable_streak': int(item.get('stable_streak', 0))
 
                 }
 
@@ -119,8 +163,13 @@ class HistoryManager:
             return None
 
     
+    @timed('dynamodb_request_seconds', 'save_decision')
     def save_decision(self, fingerprint, decision):
-        """Saves a decision to DynamoDB with 24h TTL."""
+        """Saves a decision to DynamoDB in one conditional update; metrics and counters stay on the item.
+
+        The stability streak is incremented by the write itself when the stored decision is for the
+        same cluster; only a change of cluster needs a second write, which resets it.
+        """
 
         if not self.table:
 
@@ -133,29 +182,65 @@ class HistoryManager:
 
             current_time = int(time.time())
 
-            ttl = current_time + (self.cache_ttl_hours * 3600)
+            names = {'#cluster': 'cluster', '#score': 'score', '#factors': 'factors', '#timestamp': 'timestamp',
+                     '#decided_at': 'decided_at', '#ttl': 'ttl', '#streak': 'stable_streak', '#analyses': 'analyses'}
 
-            
-            item = {
+            values = {
+
+                ':cluster': decision['cluster'],
 
-                'fingerprint': fingerprint,
+                ':score': str(decision['score']),
 
-                'cluster': decision['cluster'],
+                ':factors': json.dumps(decision.get('factors', {})),
 
-                'score': str(decision['score']),
+                ':timestamp': datetime.utcnow().isoformat(),
 
-                'factors': json.dumps(decision.get('factors', {})),
+                ':decided_at': current_time,
 
-                'timestamp': datetime.utcnow().isoformat(),
+                # Item expiry (DynamoDB TTL) is only garbage collection: past any decision TTL
+                ':ttl': current_time + int((self.cache_ttl_max_hours + ITEM_TTL_MARGIN_HOURS) * 3600),
 
-                'ttl': ttl
+                ':zero': 0,
+
+                ':one': 1
 
             }
 
-            
-            self.table.put_item(Item=item)
+            update_expression = ("SET #cluster = :cluster, #score = :score, #factors = :factors, #timestamp = :timestamp, "
+                                 "#decided_at = :decided_at, #ttl = :ttl, #analyses = if_not_exists(#analyses, :zero) + :one")
+            removed = []
 
-            logger.debug("decision_saved fingerprint=%s", fingerprint[:16])
+            # Snapshot sizes and escalation describe this decision only
+            for key in ('tables', 'escalated_from', 'escalation_reason'):
+                names[f'#{key}'] = key
+                if decision.get(key):
+                    update_expression += f", #{key} = :{key}"
+                    values[f':{key}'] = json.dumps(decision[key]) if key == 'tables' else decision[key]
+                else:
+                    removed.append(f'#{key}')
+
+            remove_expression = (" REMOVE " + ", ".join(removed)) if removed else ""
+
+            try:
+
+                self.table.update_item(
+                    Key={'fingerprint': fingerprint},
+                    UpdateExpression=update_expression + ", #streak = if_not_exists(#streak, :minus_one) + :one" + remove_expression,
+                    ConditionExpression="attribute_not_exists(#cluster) OR #cluster = :cluster",
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues={**values, ':minus_one': -1}
+                )
+
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+
+                self.table.update_item(
+                    Key={'fingerprint': fingerprint},
+                    UpdateExpression=update_expression + ", #streak = :zero" + remove_expression,
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values
+                )
+
+            logger.debug("decision_saved fingerprint=%s cluster=%s", fingerprint[:16], decision['cluster'])
 
             
         except Exception as e:
@@ -163,6 +248,36 @@ class HistoryManager:
             logger.error("save_decision error=%s", str(e))
 
     
+    def decision_ttl_hours(self, stable_streak):
+        """min TTL doubled for every consecutive re-analysis that produced the same cluster, capped at max."""
+        return min(self.cache_ttl_max_hours, self.cache_ttl_min_hours * (2 ** min(stable_streak, 32)))
+
+    def decision_expires_at(self, item):
+        """Expiry of the cached decision in an item (0 once invalidated or never decided)."""
+        decided_at = int(item.get('decided_at', 0))
+        if not decided_at:
+            return 0
+        return decided_at + int(self.decision_ttl_hours(int(item.get('stable_streak', 0))) * 3600)
+
+    @timed('dynamodb_request_seconds', 'invalidate_decision')
+    def invalidate_decision(self, fingerprint):
+        """Expires a cached decision now, keeping its stability and metrics for the next save."""
+        if not self.table:
+            return
+        try:
+            self.table.update_item(
+                Key={'fingerprint': fingerprint},
+                UpdateExpression="REMOVE decided_at",
+                ConditionExpression="attribute_exists(fingerprint)"
+            )
+            logger.debug("decision_invalidated fingerprint=%s", fingerprint[:16])
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+        except Exception as e:
+            logger.error("invalidate_decision error=%s", str(e))
+
+    
+    @timed('dynamodb_request_seconds', 'save_metrics')
     def save_metrics(self, metrics_data):
         """Saves post-execution metrics to DynamoDB."""
 
@@ -182,9 +297,9 @@ class HistoryManager:
 
             expression_values = {
 
-                ':et': metrics_data.get('execution_time', 0),
+                ':et': _dynamodb_value(metrics_data.get('execution_time', 0)),
 
-                ':c': metrics_data.get('cost', 0),
+                ':c': _dynamodb_value(metrics_data.get('cost', 0)),
 
                 ':s': metrics_data.get('success', True),
 
@@ -192,6 +307,11 @@ class HistoryManager:
 
             }
 
+            for field, attribute in OPTIONAL_METRICS_FIELDS.items():
+                if metrics_data.get(field) is not None:
+                    update_expression += f", {attribute} = :{attribute}"
+                    expression_values[f":{attribute}"] = _dynamodb_value(metrics_data[field])
+
             
             self.table.update_item(
 
@@ -211,7 +331,23 @@ class HistoryManager:
 
             logger.error("save_metrics error=%s", str(e))
 
+    def save_metrics_batch(self, records):
+        """Saves a batch of post-execution metrics; one update per fingerprint (latest record wins)."""
+        if not self.table:
+            logger.warning("save_metrics_batch skipped dynamodb_unavailable records=%s", len(records))
+            return 0
+
+        latest = {}
+        for record in records:
+            if record.get('fingerprint'):
+                latest[record['fingerprint']] = record
+        for record in latest.values():
+            self.save_metrics(record)
+        logger.debug("metrics_batch_saved records=%s fingerprints=%s", len(records), len(latest))
+        return len(latest)
+
     
+    @timed('dynamodb_request_seconds', 'get_historical_factor')
     def get_historical_factor(self, fingerprint, query):
         """Computes historical factor from similar queries. Returns value in [0, 1]."""
 
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Log pipeline - root logging of both services without log I/O on the request path.
+Records are filtered on the caller's thread (per-event sampling below WARNING, per-event rate
+limits on DEBUG/INFO, and on WARNING only for events listed in DYRASQL_LOG_RATE_LIMITS; the event
+is the first word of the message, e.g. `route_request`), their
+message is rendered and they are queued; a background thread formats them and writes the console
+and the rotating log file. A full queue drops the record (counted) rather than block the event loop.
+Output is one JSON object per line by default (DYRASQL_LOG_FORMAT=text for the former layout),
+with the `key=%s` arguments of the message as fields, the trace id of a sampled request, and
+`suppressed` on the first record of an event let through after sampling or a rate limit held
+some back. The pipeline is restarted in each forked worker.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Optional
+
+import tracing
+
+
+FORMAT = os.getenv('DYRASQL_LOG_FORMAT', 'json').lower()  # json | text
+# Records waiting for the writer thread; beyond this new records are dropped
+QUEUE_SIZE = int(os.getenv('DYRASQL_LOG_QUEUE_SIZE', '10000'))
+# DEBUG/INFO records per second each event may log (0: unlimited); DYRASQL_LOG_RATE_LIMITS overrides
+# per event and is the only limit applied to WARNING
+RATE_LIMIT = float(os.getenv('DYRASQL_LOG_RATE_LIMIT', '50'))
+MAX_BYTES = int(os.getenv('DYRASQL_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+BACKUP_COUNT = int(os.getenv('DYRASQL_LOG_BACKUP_COUNT', '5'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_EVENT = re.compile(r'[a-z][a-z0-9_]*')
+_PLACEHOLDER = re.compile(r'(?:(\w+)=)?%[-#0 +]*(?:\*|\d+)?(?:\.\d+)?[a-zA-Z%]')
+# Argument values kept as they are; anything else is rendered when the record is queued
+PLAIN = (str, int, float, bool, type(None))
+# JSON keys the message's own pairs may not overwrite
+RESERVED = frozenset(('ts', 'level', 'service', 'logger', 'pid', 'event', 'msg', 'trace_id', 'suppressed', 'exc'))
+
+# One writer per counter: `written` is only updated by the writer thread (or by shutdown() when
+# there is none); the others only by emit(), which runs under the handler's lock
+counters: Dict[str, int] = {'queued': 0, 'written': 0, 'dropped': 0, 'sampled_out': 0, 'rate_limited': 0}
+
+_service = 'dyrasql'
+_handler: Optional['_QueueHandler'] = None
+_writer: Optional[threading.Thread] = None
+_lock = threading.Lock()
+# Message template -> ((field, argument index), ...)
+_templates: Dict[str, tuple] = {}
+
+
+def _rates(name: str) -> Dict[str, float]:
+    """`event=value,event=value` from the environment."""
+    rates = {}
+    for item in os.getenv(name, '').split(','):
+        event, _, value = item.partition('=')
+        if event.strip() and value.strip():
+            rates[event.strip()] = float(value)
+    return rates
+
+
+# Fraction of an event's records below WARNING that are kept, e.g. `proxy_request=0.01`
+SAMPLE_RATES = _rates('DYRASQL_LOG_SAMPLE')
+RATE_LIMITS = _rates('DYRASQL_LOG_RATE_LIMITS')
+
+
+def event_of(record: logging.LogRecord) -> str:
+    """First word of the message template (the repo's `event key=%s ...` convention), else the logger."""
+    msg = record.msg if isinstance(record.msg, str) else ''
+    event = msg.split(' ', 1)[0]
+    return event if _EVENT.fullmatch(event) else record.name
+
+
+def fields_of(record: logging.LogRecord) -> Dict[str, Any]:
+    """`key=%s` placeholders of the template paired with their arguments."""
+    args = record.args
+    if not args or not isinstance(args, tuple) or not isinstance(record.msg, str):
+        return {}
+    layout = _templates.get(record.msg)
+    if layout is None:
+        placeholders = [m.group(1) for m in _PLACEHOLDER.finditer(record.msg) if not m.group(0).endswith('%%')]
+        layout = tuple((key, i) for i, key in enumerate(placeholders) if key)
+        if len(_templates) < 4096:
+            _templates[record.msg] = layout
+    return {key: args[i] if isinstance(args[i], PLAIN) else str(args[i])
+            for key, i in layout if i < len(args) and key not in RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; the `key=%s` arguments of the message become fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry: Dict[str, Any] = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'service': _service,
+            'logger': record.name,
+            'pid': record.process,
+            'event': getattr(record, 'event', None) or event_of(record),
+            'msg': message,
+        }
+        for key, value in getattr(record, 'fields', {}).items():
+            entry.setdefault(key, value)
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            entry['trace_id'] = trace_id
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.Handler):
+    """Samples, rate-limits and enqueues; the writer thread does the formatting and I/O."""
+
+    def __init__(self, handlers):
+        super().__init__()
+        self.handlers = handlers
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        # event -> [tokens, last refill]
+        self._buckets: Dict[str, list] = {}
+        # event -> records held back since the last one written
+        self._suppressed: Dict[str, int] = {}
+        self._exc_formatter = logging.Formatter()
+
+    def _allow(self, record: logging.LogRecord, event: str) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = SAMPLE_RATES.get(event)
+            if rate is not None and random.random() >= rate:
+                counters['sampled_out'] += 1
+                return False
+        if record.levelno < logging.ERROR:
+            limit = RATE_LIMITS.get(event, RATE_LIMIT if record.levelno < logging.WARNING else 0)
+            if limit > 0:
+                now = time.monotonic()
+                bucket = self._buckets.get(event)
+                if bucket is None:
+                    bucket = self._buckets[event] = [limit, now]
+                bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+                bucket[1] = now
+                if bucket[0] < 1.0:
+                    counters['rate_limited'] += 1
+                    return False
+                bucket[0] -= 1.0
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            event = event_of(record)
+            if not self._allow(record, event):
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return
+            # Rendered here: arguments may change once the caller moves on; tracebacks hold frames
+            record.message = record.getMessage()
+            if FORMAT == 'json':
+                record.fields = fields_of(record)
+            record.msg, record.args = record.message, None
+            if record.exc_info:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+                record.exc_info = None
+            record.event = event
+            record.suppressed = self._suppressed.pop(event, 0)
+            span = tracing.current()
+            record.trace_id = getattr(span, 'trace_id', None)
+            if counters['queued'] - counters['written'] >= QUEUE_SIZE:
+                counters['dropped'] += 1
+                return
+            self.queue.put(record)
+            counters['queued'] += 1
+            _ensure_writer()
+        except Exception:
+            self.handleError(record)
+
+    def write(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        counters['written'] += 1
+
+    def drain(self, first=None) -> None:
+        """Writes every queued record, then flushes and releases the shutdown() calls waiting."""
+        flushed = []
+        item = first
+        while True:
+            if isinstance(item, threading.Event):
+                flushed.append(item)
+            elif item is not None:
+                self.write(item)
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for handler in self.handlers:
+            handler.flush()
+        for event in flushed:
+            event.set()
+
+
+def _write_loop(handler: _QueueHandler) -> None:
+    while True:
+        handler.drain(handler.queue.get())
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None and _handler is not None:
+                _writer = threading.Thread(target=_write_loop, args=(_handler,), name='log-writer', daemon=True)
+                _writer.start()
+
+
+def _after_fork() -> None:
+    """The writer thread and the queue's locks do not survive fork: each worker gets its own."""
+    global _writer
+    _writer = None
+    if _handler is not None:
+        _handler.queue = queue.SimpleQueue()
+        counters['written'] = counters['queued']
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def configure(service: str, log_file: str, level: str = 'INFO') -> None:
+    """Root logger of the process: stdout and `log_file` (rotated) through the queue."""
+    global _service, _handler
+    _service = service
+    formatter = JsonFormatter() if FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    file_handler = RotatingFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = _QueueHandler([console, file_handler])
+    root.addHandler(_handler)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Writes what is still queued (the writer thread is a daemon)."""
+    if _handler is None:
+        return
+    with _lock:
+        if _writer is None:
+            _handler.drain()
+            return
+    flushed = threading.Event()
+    _handler.queue.put(flushed)
+    flushed.wait(timeout)
+
+
+def snapshot() -> Dict[str, Any]:
+    return {'format': FORMAT, 'pending': counters['queued'] - counters['written'], **counters}
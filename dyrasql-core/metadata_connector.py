@@ -8,6 +8,8 @@ Metadata Connector - Connects to Apache Iceberg tables and extracts metadata.
 
 import os
 import boto3
+import gzip
+import json
 import logging
 from pyiceberg.catalog import load_catalog
 
@@ -33,9 +35,14 @@ class MetadataConnector:
 
         self.s3_client = session.client('s3', region_name=self.aws_region)
 
+        self.glue_client = session.client('glue', region_name=self.aws_region)
+
         
         self.catalog = None
 
+        # metadata_location -> parsed snapshot, so unchanged tables cost one Glue call
+        self._snapshots = {}
+
                                                                                  
     def get_metadata(self, table_name):
         """Extracts metadata for an Iceberg table. Returns file_count, total_size, record_count, partition_info, column_stats."""
@@ -217,3 +224,49 @@ class MetadataConnector:
 
             return {}
 
+    def get_snapshot(self, table_name):
+        """
+        Current Iceberg snapshot of a table registered in Glue: snapshot_id, total_size (bytes),
+        total_records, metadata_location. Table names may be catalog.schema.table (Trino) or schema.table.
+        """
+        parts = table_name.split('.')
+        if len(parts) < 2:
+            return None
+        database, table = parts[-2], parts[-1]
+
+        try:
+            response = self.glue_client.get_table(DatabaseName=database, Name=table)
+            location = response['Table'].get('Parameters', {}).get('metadata_location')
+            if not location:
+                return None
+
+            cached = self._snapshots.get(table_name)
+            if cached and cached['metadata_location'] == location:
+                return cached
+
+            bucket, key = location.split('://', 1)[1].split('/', 1)
+            body = self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+            if key.endswith('.gz'):
+                body = gzip.decompress(body)
+            metadata = json.loads(body)
+
+            snapshot_id = metadata.get('current-snapshot-id')
+            summary = {}
+            for snapshot in metadata.get('snapshots', []):
+                if snapshot.get('snapshot-id') == snapshot_id:
+                    summary = snapshot.get('summary', {})
+                    break
+
+            result = {
+                'snapshot_id': snapshot_id,
+                'total_size': int(summary.get('total-files-size', 0)),
+                'total_records': int(summary.get('total-records', 0)),
+                'metadata_location': location
+            }
+            self._snapshots[table_name] = result
+            logger.debug("snapshot_loaded table=%s snapshot_id=%s size=%s", table_name, snapshot_id, result['total_size'])
+            return result
+
+        except Exception as e:
+            logger.warning("get_snapshot error table=%s error=%s", table_name, str(e))
+            return None
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Page Rewriter - rewrites the top-level URIs of statement pages that are streamed, not buffered.
+Trino writes id/infoUri/partialCancelUri/nextUri before columns/data/stats, so only the page
+head needs rewriting: it is held until the first of those keys shows up (or HEAD_BYTES) and
+rewritten with the same function used for buffered pages; the rest of the page passes through
+chunk by chunk untouched, so memory stays bounded whatever the page size.
+Spooled pages carry more URIs after the head (segment `uri`/`ackUri`): once `"segments":`
+shows up, the rest is rewritten up to the last quote of every chunk, holding only the bytes
+after it (long quote-less runs are inline segment data, never URIs, and pass through).
+"""
+
+from typing import Callable
+
+
+# Keys that follow the top-level URIs in a statement page
+HEAD_END_MARKERS = (b'"columns":', b'"data":', b'"stats":')
+SEGMENTS_MARKER = b'"segments":'
+
+
+class PageRewriter:
+    """Incremental rewrite of one JSON page: feed() upstream chunks, send what it returns, then close()."""
+
+    # The URIs are within the first few hundred bytes; pages without any marker are cut here
+    HEAD_BYTES = 8192
+
+    # Held after the last quote of a segments chunk; longer runs are string data, not URIs
+    CARRY_BYTES = 65536
+
+    __slots__ = ('rewrite', '_head', '_searched', '_done', '_tail', '_segments', '_carry')
+
+    def __init__(self, rewrite: Callable[[bytes], bytes]):
+        self.rewrite = rewrite
+        self._head = b''
+        self._searched = 0
+        self._done = False
+        self._tail = b''
+        self._segments = False
+        self._carry = b''
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._segments:
+            return self._feed_segments(chunk)
+        if self._done:
+            return self._find_segments(chunk)
+        self._head += chunk
+        start = max(0, self._searched - max(len(m) for m in HEAD_END_MARKERS))
+        positions = [p for p in (self._head.find(m, start) for m in HEAD_END_MARKERS) if p >= 0]
+        self._searched = len(self._head)
+        if positions:
+            return self._flush(min(positions))
+        if len(self._head) >= self.HEAD_BYTES:
+            # Cut between two keys so no URI is split across the rewritten/raw boundary
+            cut = self._head.rfind(b',"')
+            return self._flush(cut if cut > 0 else len(self._head))
+        return b''
+
+    def close(self) -> bytes:
+        """Whatever is still held (pages smaller than the head)."""
+        if self._segments:
+            carry, self._carry = self._carry, b''
+            return self.rewrite(carry)
+        if self._done:
+            return b''
+        return self._flush(len(self._head))
+
+    def _flush(self, split: int) -> bytes:
+        head, tail = self._head[:split], self._head[split:]
+        self._head = b''
+        self._done = True
+        return self.rewrite(head) + self._find_segments(tail)
+
+    def _find_segments(self, chunk: bytes) -> bytes:
+        """Pass the body through until the segments list starts (spooled pages only)."""
+        data = self._tail + chunk
+        index = data.find(SEGMENTS_MARKER)
+        if index < 0:
+            self._tail = data[-(len(SEGMENTS_MARKER) - 1):]
+            return chunk
+        # The marker ends within this chunk: what precedes its end was not rewritable
+        split = index + len(SEGMENTS_MARKER) - len(self._tail)
+        self._tail = b''
+        self._segments = True
+        return chunk[:split] + self._feed_segments(chunk[split:])
+
+    def _feed_segments(self, chunk: bytes) -> bytes:
+        data = self._carry + chunk
+        # A URI match never spans a quote, so everything before the last one is complete
+        cut = data.rfind(b'"')
+        if cut < 0:
+            if len(data) > self.CARRY_BYTES:
+                self._carry = b''
+                return data
+            self._carry = data
+            return b''
+        out = self.rewrite(data[:cut])
+        self._carry = data[cut:]
+        if len(self._carry) > self.CARRY_BYTES:
+            out += self._carry
+            self._carry = b''
+        return out
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Probes - local answers for keepalive and connection-validation queries.
+JDBC IDEs and pool validators send `SELECT 1` / `SELECT 'keep alive'` constantly; each one
+forwarded costs a full query lifecycle on the default cluster. Statements matching one of
+DYRASQL_PROBE_PATTERNS (full match, case-insensitive, trailing `;` ignored) whose select list
+holds only literals are answered by the proxy itself with a single FINISHED Trino page (id,
+columns, data, stats, no nextUri), typed the way Trino types the literals. Anything else
+matching a pattern (expressions, FROM...) is still forwarded.
+"""
+
+import json
+import os
+import re
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+ENABLED = os.getenv('DYRASQL_PROBE_RESPONSES', 'true').lower() == 'true'
+DEFAULT_PATTERNS = (
+    r"SELECT\s+1(\s+AS\s+\w+)?",
+    r"SELECT\s+'KEEP\s?ALIVE'(\s+AS\s+\w+)?",
+)
+PATTERNS = tuple(
+    re.compile(pattern.strip(), re.IGNORECASE | re.DOTALL)
+    for pattern in (os.getenv('DYRASQL_PROBE_PATTERNS') or ';'.join(DEFAULT_PATTERNS)).split(';')
+    if pattern.strip()
+)
+
+# One select-list item: literal, optional `AS alias`, then `,` or the end
+_ITEM = re.compile(
+    r"""\s*(?:(?P<int>-?\d+)|'(?P<str>(?:[^']|'')*)'|(?P<bool>TRUE|FALSE)|(?P<null>NULL))"""
+    r"""(?:\s+AS\s+(?:"(?P<quoted>(?:[^"]|"")+)"|(?P<alias>[A-Za-z_][A-Za-z0-9_]*)))?\s*(?P<end>,|$)""",
+    re.IGNORECASE | re.DOTALL,
+)
+_SELECT = re.compile(r'\s*SELECT\s+', re.IGNORECASE)
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+# Unbounded varchar, as Trino signs it
+VARCHAR_MAX = 2 ** 31 - 1
+
+# Statements answered locally
+counters: Dict[str, int] = {'answered': 0}
+
+
+def column(name: str, raw_type: str, *arguments: int) -> Dict[str, Any]:
+    """Trino column descriptor (name, type, typeSignature)."""
+    display = f"{raw_type}({', '.join(str(a) for a in arguments)})" if arguments else raw_type
+    if raw_type == 'varchar' and not arguments:
+        arguments = (VARCHAR_MAX,)
+    return {
+        'name': name,
+        'type': display,
+        'typeSignature': {'rawType': raw_type, 'arguments': [{'kind': 'LONG', 'value': a} for a in arguments]},
+    }
+
+
+def evaluate(query: str) -> Optional[Tuple[List[Dict[str, Any]], List[Any]]]:
+    """(columns, row) of a literal-only SELECT; None for anything else."""
+    match = _SELECT.match(query)
+    if not match:
+        return None
+    columns, row = [], []
+    position = match.end()
+    while True:
+        item = _ITEM.match(query, position)
+        if not item:
+            return None
+        if item.group('int') is not None:
+            value = int(item.group('int'))
+            if not -2 ** 63 <= value < 2 ** 63:
+                return None
+            descriptor = ('integer' if INT_MIN <= value <= INT_MAX else 'bigint',)
+        elif item.group('str') is not None:
+            value = item.group('str').replace("''", "'")
+            descriptor = ('varchar', len(value))
+        elif item.group('bool') is not None:
+            value = item.group('bool').upper() == 'TRUE'
+            descriptor = ('boolean',)
+        else:
+            value = None
+            descriptor = ('unknown',)
+        if item.group('quoted') is not None:
+            name = item.group('quoted').replace('""', '"')
+        elif item.group('alias') is not None:
+            name = item.group('alias').lower()
+        else:
+            name = f'_col{len(columns)}'
+        columns.append(column(name, *descriptor))
+        row.append(value)
+        position = item.end()
+        if item.group('end') != ',':
+            return columns, row
+
+
+def _query_id() -> str:
+    """Trino-shaped query id (yyyyMMdd_HHmmss_index_coordinator), unique per response."""
+    return f"{time.strftime('%Y%m%d_%H%M%S', time.gmtime())}_{secrets.randbelow(100000):05d}_{secrets.token_hex(3)[:5]}"
+
+
+def finished_page(base_url: str, columns: List[Dict[str, Any]], rows: List[List[Any]]) -> bytes:
+    """Single FINISHED Trino page with the whole result (no nextUri)."""
+    query_id = _query_id()
+    page = {
+        'id': query_id,
+        'infoUri': f"{base_url.rstrip('/')}/ui/query.html?{query_id}",
+        'columns': columns,
+    }
+    if rows:
+        page['data'] = rows
+    page['stats'] = {
+        'state': 'FINISHED', 'queued': False, 'scheduled': True, 'progressPercentage': 100.0,
+        'runningPercentage': 0.0, 'nodes': 0, 'totalSplits': 0, 'queuedSplits': 0, 'runningSplits': 0,
+        'completedSplits': 0, 'cpuTimeMillis': 0, 'wallTimeMillis': 0, 'queuedTimeMillis': 0,
+        'elapsedTimeMillis': 0, 'processedRows': 0, 'processedBytes': 0, 'physicalInputBytes': 0,
+        'peakMemoryBytes': 0, 'spilledBytes': 0,
+    }
+    page['warnings'] = []
+    return json.dumps(page).encode('utf-8')
+
+
+def matches(query: str) -> bool:
+    """Whether the statement is a probe (one of PATTERNS); those not answered locally are pinned to the default tier."""
+    statement = query.strip().rstrip(';').strip()
+    return any(pattern.fullmatch(statement) for pattern in PATTERNS)
+
+
+def respond(query: str, base_url: str) -> Optional[bytes]:
+    """FINISHED page for a recognized probe; None when the statement must go to a cluster."""
+    if not ENABLED or not matches(query):
+        return None
+    result = evaluate(query.strip().rstrip(';').strip())
+    if result is None:
+        return None
+    counters['answered'] += 1
+    columns, row = result
+    return finished_page(base_url, columns, [row])
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Profiling - on-demand diagnostics of a live worker behind the /api/v1/admin endpoints.
+Disabled (404) unless DYRASQL_ADMIN_TOKEN is set; requests then need `Authorization: Bearer
+<token>`, and one profile or snapshot runs at a time per worker (409 otherwise). Everything
+answers for the worker that took the request (its pid is in the response).
+  - CPU profile: a thread samples the event loop thread's stack for N seconds and returns
+    collapsed stacks (flamegraph.pl, speedscope). Samples start at the running task's coroutine
+    (under `[task]`), time in select is `[idle]`; mode `tasks` samples instead the await
+    chain of every pending task, i.e. where requests are waiting
+  - tracemalloc: started and stopped explicitly (it slows allocations while on); each snapshot
+    reports the top allocation sites and the diff to the previous one
+  - structures: approximate deep size of the registered components (query map, caches, ...),
+    counting containers and this service's own objects, not third-party clients they hold
+  - event loop lag: always measured (DYRASQL_LOOP_LAG_INTERVAL_MS) into the telemetry histogram
+    `event_loop_lag_seconds`, so it is in /metrics and merged across workers
+Heavy work (snapshot statistics) runs in a thread and walks yield to the loop, so none of it
+stalls requests for long.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import gc
+import hmac
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+
+from telemetry import observe
+from workers import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+ADMIN_TOKEN = os.getenv('DYRASQL_ADMIN_TOKEN', '')
+MAX_SECONDS = float(os.getenv('DYRASQL_PROFILE_MAX_SECONDS', '60'))
+LAG_INTERVAL = float(os.getenv('DYRASQL_LOOP_LAG_INTERVAL_MS', '100')) / 1000.0
+# Objects visited per structure before its size is reported as truncated
+MAX_OBJECTS = int(os.getenv('DYRASQL_ADMIN_SIZE_MAX_OBJECTS', '200000'))
+
+MODES = ('cpu', 'tasks')
+# Modules whose objects the size walk descends into (besides builtin containers)
+OWN_MODULES = frozenset(['__main__'] + [name[:-3] for name in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+                                        if name.endswith('.py')])
+CONTAINERS = (dict, list, tuple, set, frozenset, collections.deque)
+
+_busy = asyncio.Lock()
+_structures: Dict[str, Any] = {}
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_lag = Histogram()
+_lag_max = 0.0
+_loop_thread: Optional[int] = None
+_monitor: Optional[asyncio.Task] = None
+# Code object -> frame label of the collapsed stacks
+_labels: Dict[Any, str] = {}
+
+
+def authorize(request: Request) -> None:
+    """404 while admin endpoints are disabled, 403 without the admin token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail='Not Found')
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail={'error': 'admin token required'})
+
+
+def busy() -> HTTPException:
+    return HTTPException(status_code=409, detail={'error': 'another profile is running in this worker', 'pid': os.getpid()})
+
+
+def track(name: str, component: Any) -> None:
+    """Registers a component reported by `structures()`."""
+    _structures[name] = component
+
+
+# --- CPU profile ---
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        name = getattr(code, 'co_qualname', code.co_name)
+        label = _labels[code] = f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ',')
+    return label
+
+
+def _loop_stack(frame, loop) -> List[str]:
+    """Root-first labels of the loop thread's stack, starting at the running task's coroutine."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    leaf = frames[0].f_code if frames else None
+    if leaf is not None and leaf.co_name == 'select' and leaf.co_filename.endswith('selectors.py'):
+        return ['[idle]']
+    task = asyncio.current_task(loop)
+    if task is not None:
+        coro = task.get_coro()
+        root = getattr(coro, 'cr_frame', None)
+        for i, candidate in enumerate(frames):
+            if candidate is root:
+                return ['[task]'] + [_label(f.f_code) for f in reversed(frames[:i + 1])]
+    return ['[loop]'] + [_label(f.f_code) for f in reversed(frames)]
+
+
+def _await_chain(task) -> List[str]:
+    """Root-first labels of where a pending task waits: its coroutines down to the awaited future."""
+    coro = task.get_coro()
+    stack = ['[task]']
+    for _ in range(256):
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        stack.append(_label(frame.f_code))
+        awaited = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+        if awaited is None:
+            break
+        if isinstance(awaited, asyncio.Task):
+            stack.append(f'[await task] {getattr(awaited.get_coro(), "__qualname__", "?")}')
+            break
+        if not hasattr(awaited, 'cr_frame') and not hasattr(awaited, 'gi_frame'):
+            # A future (or its iterator): the task waits for I/O, a timer or another callback
+            stack.append('[future]')
+            break
+        coro = awaited
+    return stack
+
+
+class _Sampler(threading.Thread):
+    """Counts collapsed stacks of the loop thread (or of the loop's tasks) every interval."""
+
+    def __init__(self, loop, mode: str, interval: float):
+        super().__init__(name='profiler', daemon=True)
+        self.loop = loop
+        self.mode = mode
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.done = threading.Event()
+
+    def sample(self) -> None:
+        if self.mode == 'cpu':
+            frame = sys._current_frames().get(_loop_thread)
+            stacks = [_loop_stack(frame, self.loop)] if frame is not None else []
+        else:
+            # all_tasks() must run on the loop's thread; a loop busy for the whole interval skips the tick
+            future = concurrent.futures.Future()
+            self.loop.call_soon_threadsafe(lambda: future.done() or future.set_result(asyncio.all_tasks(self.loop)))
+            try:
+                tasks = future.result(timeout=self.interval)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                return
+            stacks = [_await_chain(task) for task in tasks if not task.done()]
+        for stack in stacks:
+            key = ';'.join(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def run(self) -> None:
+        while not self.done.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug("profile_sample_failed error=%s", str(e))
+
+
+async def cpu_profile(seconds: float, interval_ms: float, mode: str) -> Dict[str, Any]:
+    """Samples for `seconds` (capped at DYRASQL_PROFILE_MAX_SECONDS); collapsed stacks, hottest first."""
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail={'error': f'mode must be one of {", ".join(MODES)}'})
+    if _busy.locked():
+        raise busy()
+    seconds = max(0.1, min(seconds, MAX_SECONDS))
+    async with _busy:
+        sampler = _Sampler(asyncio.get_running_loop(), mode, max(1.0, interval_ms) / 1000.0)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.done.set()
+            await asyncio.to_thread(sampler.join)
+        logger.info("admin_profile mode=%s seconds=%s samples=%s stacks=%s", mode, seconds, sampler.samples, len(sampler.stacks))
+        collapsed = '\n'.join(f'{stack} {count}' for stack, count in
+                              sorted(sampler.stacks.items(), key=lambda item: -item[1]))
+        return {'collapsed': collapsed + '\n' if collapsed else '', 'samples': sampler.samples,
+                'seconds': round(time.perf_counter() - started, 3)}
+
+
+# --- tracemalloc ---
+
+def tracemalloc_start(frames: int) -> Dict[str, Any]:
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 25)))
+        _last_snapshot = None
+        logger.warning("admin_tracemalloc started frames=%s", tracemalloc.get_traceback_limit())
+    return tracemalloc_status()
+
+
+def tracemalloc_stop() -> Dict[str, Any]:
+    global _last_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.warning("admin_tracemalloc stopped")
+    _last_snapshot = None
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> Dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory()
+    return {'pid': os.getpid(), 'tracing': tracemalloc.is_tracing(), 'frames': tracemalloc.get_traceback_limit(),
+            'traced_bytes': current, 'peak_bytes': peak, 'overhead_bytes': tracemalloc.get_tracemalloc_memory()}
+
+
+def _where(trace_or_stat) -> str:
+    frame = trace_or_stat.traceback[0]
+    return f'{frame.filename}:{frame.lineno}'
+
+
+def _statistics(previous: Optional[tracemalloc.Snapshot], group: str, limit: int) -> Dict[str, Any]:
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+    top = []
+    for stat in snapshot.statistics(group)[:limit]:
+        entry = {'where': _where(stat), 'size_bytes': stat.size, 'count': stat.count}
+        if group == 'traceback':
+            entry['traceback'] = [str(frame) for frame in stat.traceback]
+        top.append(entry)
+    diff = None
+    if previous is not None:
+        diff = [{'where': _where(s), 'size_diff_bytes': s.size_diff, 'size_bytes': s.size, 'count_diff': s.count_diff}
+                for s in snapshot.compare_to(previous, group)[:limit]]
+    return {'snapshot': snapshot, 'top': top, 'diff': diff}
+
+
+async def memory_snapshot(group: str, limit: int) -> Dict[str, Any]:
+    """Top allocation sites now, and the change since the previous snapshot of this worker."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail={'error': 'tracemalloc is not running (POST /api/v1/admin/tracemalloc)'})
+    if group not in ('lineno', 'filename', 'traceback'):
+        raise HTTPException(status_code=400, detail={'error': 'group must be lineno, filename or traceback'})
+    if _busy.locked():
+        raise busy()
+    async with _busy:
+        result = await asyncio.to_thread(_statistics, _last_snapshot, group, max(1, min(limit, 500)))
+        _last_snapshot = result.pop('snapshot')
+    return {**tracemalloc_status(), **result}
+
+
+# --- structures ---
+
+def _children(obj) -> List[Any]:
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        return [k for k, _ in items] + [v for _, v in items]
+    if isinstance(obj, CONTAINERS):
+        return list(obj)
+    children = []
+    state = getattr(obj, '__dict__', None)
+    if isinstance(state, dict):
+        children.append(state)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get('__slots__', ()):
+            if isinstance(slot, str) and slot not in ('__dict__', '__weakref__'):
+                value = getattr(obj, slot, None)
+                if value is not None:
+                    children.append(value)
+    return children
+
+
+def _descend(obj) -> bool:
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return False
+    if isinstance(obj, CONTAINERS):
+        return True
+    return type(obj).__module__ in OWN_MODULES and not isinstance(obj, type)
+
+
+async def deep_size(root: Any) -> Dict[str, Any]:
+    """sys.getsizeof over what `root` reaches (each object once), yielding to the loop as it goes."""
+    seen = set()
+    pending = [root]
+    size = objects = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        objects += 1
+        if objects >= MAX_OBJECTS:
+            return {'bytes': size, 'objects': objects, 'truncated': True}
+        if _descend(obj):
+            pending.extend(_children(obj))
+        if objects % 5000 == 0:
+            await asyncio.sleep(0)
+    return {'bytes': size, 'objects': objects, 'truncated': False}
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def structures(types: int = 0) -> Dict[str, Any]:
+    """Deep size of each registered component, GC counters and, with `types`, the most common object types."""
+    if _busy.locked():
+        raise busy()
+    async with _busy:
+        report: Dict[str, Any] = {'pid': os.getpid(), 'rss_bytes': _rss_bytes(), 'structures': {}}
+        for name, component in list(_structures.items()):
+            entry = await deep_size(component)
+            try:
+                entry['entries'] = len(component)
+            except TypeError:
+                pass
+            report['structures'][name] = entry
+        report['gc'] = {'counts': gc.get_count(), 'generations': gc.get_stats(), 'garbage': len(gc.garbage)}
+        if types:
+            counts = collections.Counter(type(o).__name__ for o in gc.get_objects())
+            report['types'] = dict(counts.most_common(max(1, min(types, 200))))
+        return report
+
+
+# --- event loop lag ---
+
+async def _measure_lag() -> None:
+    global _lag_max
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        lag = max(0.0, loop.time() - expected)
+        _lag.observe(lag)
+        _lag_max = max(_lag_max, lag)
+        observe('event_loop_lag_seconds', 'main', lag)
+
+
+def start() -> None:
+    """Records the loop thread (for the CPU profile) and starts the lag monitor; call from the loop."""
+    global _loop_thread, _monitor
+    _loop_thread = threading.get_ident()
+    if _monitor is None and LAG_INTERVAL > 0:
+        _monitor = asyncio.get_running_loop().create_task(_measure_lag())
+
+
+async def stop() -> None:
+    global _monitor
+    if _monitor is not None:
+        _monitor.cancel()
+        _monitor = None
+
+
+def event_loop() -> Dict[str, Any]:
+    return {'pid': os.getpid(), 'interval_seconds': LAG_INTERVAL, 'max_seconds': round(_lag_max, 6),
+            'tasks': len(asyncio.all_tasks()), 'lag': _lag.to_dict()}
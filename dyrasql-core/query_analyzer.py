@@ -10,8 +10,6 @@ using Trino EXPLAIN (TYPE IO).
 
 import re
 
-import hashlib
-
 import logging
 
 import json
@@ -23,9 +21,16 @@ import requests
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+from routing import fingerprint, is_catalog_query
+from telemetry import timed, timer
+from tracing import current as current_span, headers as trace_headers
+
 
 logger = logging.getLogger(__name__)
 
+# Words that make a WHERE count as a partition filter in analyze_complexity
+PARTITION_WORDS = ('date', 'data', 'timestamp', 'year', 'month', 'day')
+
 
 class QueryAnalyzer:
     """Analyzes SQL queries and extracts metadata using Trino EXPLAIN (TYPE IO)."""
@@ -52,31 +57,12 @@ class QueryAnalyzer:
         Detects catalog/metadata queries (e.g. JDBC IDE catalog discovery).
         Such queries should be routed to ECS. Matches system.jdbc.* and information_schema.
         """
-        if not query or not query.strip():
-            return False
-        q = query.strip().lower()
-        return (
-            'system.jdbc' in q or
-            'information_schema' in q
-        )
+        return is_catalog_query(query)
 
     
     def generate_fingerprint(self, query):
         """Generates a unique fingerprint for the SQL query (normalized, then hashed)."""
-
-                                                                             
-        normalized = re.sub(r'\s+', ' ', query.strip().lower())
-
-        
-        normalized = re.sub(r"'[^']*'", "'?'", normalized)
-
-        normalized = re.sub(r'\d+', '?', normalized)
-
-        
-        fingerprint = hashlib.sha256(normalized.encode()).hexdigest()
-
-        
-        return fingerprint
+        return fingerprint(query)
 
     
     def _normalize_query_with_catalog(self, query: str) -> str:
@@ -187,6 +173,7 @@ class QueryAnalyzer:
             logger.exception("save_explain error=%s", str(e))
 
     
+    @timed('trino_request_seconds', 'explain')
     def _execute_trino_query(self, query: str) -> Optional[Dict[str, Any]]:
         """Executes a query against Trino via REST API and returns the full result."""
 
@@ -201,7 +188,9 @@ class QueryAnalyzer:
 
                     "Content-Type": "text/plain",
 
-                    "X-Trino-User": self.trino_user
+                    "X-Trino-User": self.trino_user,
+
+                    **trace_headers()
 
                 },
 
@@ -225,6 +214,7 @@ class QueryAnalyzer:
 
             
             result = response.json()
+            current_span().set('trino.query_id', result.get('id'))
 
             
             if 'error' in result:
@@ -252,15 +242,16 @@ class QueryAnalyzer:
             
             while next_uri:
 
-                next_response = requests.get(
+                with timer('trino_request_seconds', 'explain_poll'):
+                    next_response = requests.get(
 
-                    next_uri,
+                        next_uri,
 
-                    headers={"X-Trino-User": self.trino_user},
+                        headers={"X-Trino-User": self.trino_user, **trace_headers()},
 
-                    timeout=60                                                  
+                        timeout=60
 
-                )
+                    )
 
                 
                 if next_response.status_code != 200:
@@ -525,6 +516,7 @@ class QueryAnalyzer:
         logger.warning("explain_io all_strategies_failed using_syntax_only")
         return None
 
+    @timed('routing_stage_seconds', 'explain_io')
     def _try_explain_io(self, original_query: str, normalized_query: str) -> Optional[Dict[str, Any]]:
         """Attempts EXPLAIN (TYPE IO) and returns parsed result or None."""
         explain_query = f"EXPLAIN (TYPE IO) {normalized_query}"
@@ -630,6 +622,7 @@ class QueryAnalyzer:
 
         return None
 
+    @timed('routing_stage_seconds', 'explain_distributed')
     def _try_explain_distributed(self, original_query: str, normalized_query: str) -> Optional[Dict[str, Any]]:
         """
         Attempts EXPLAIN (TYPE DISTRIBUTED) to extract table information from views.
@@ -886,7 +879,9 @@ class QueryAnalyzer:
 
         query_lower = query.lower()
 
-        where_match = re.search(r'\bwhere\s+(.+?)(?:\s+group\s+by|\s+order\s+by|\s+limit|$)', query_lower, re.IGNORECASE | re.DOTALL)
+        # Only whether a WHERE with something after it exists matters (the clause is cut below);
+        # matching up to GROUP BY/ORDER BY/LIMIT here was quadratic in long whitespace runs
+        where_match = re.search(r'\bwhere\s.', query_lower, re.DOTALL)
 
         
         if where_match:
@@ -971,7 +966,13 @@ class QueryAnalyzer:
         subqueries = len(re.findall(r'\(select\s+', query_lower))
 
         
-        partitioned_filters = len(re.findall(r'where.*(date|data|timestamp|year|month|day)', query_lower))
+        # Lines with a WHERE followed on the same line by a date-like word: what
+        # re.findall(r'where.*(date|...)') counted, without its rescan of the line per WHERE
+        partitioned_filters = 0
+        for line in query_lower.split('\n'):
+            where_pos = line.find('where')
+            if where_pos != -1 and any(line.find(word, where_pos + 5) != -1 for word in PARTITION_WORDS):
+                partitioned_filters += 1
 
         
         where_clauses = len(re.findall(r'\bwhere\b', query_lower))
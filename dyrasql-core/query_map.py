@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Query Map - query id -> cluster, used to route nextUri polls, DELETEs and other per-query paths.
+Entries live DYRASQL_QUERY_MAP_TTL_SECONDS since their last use, at most
+DYRASQL_QUERY_MAP_MAX_ENTRIES per process (least recently used evicted first), and are dropped
+as soon as the query reaches its terminal page or is cancelled. With a shared backend (a SQLite
+file for workers on one host, Redis or a Redis-compatible server for several replicas) lookups
+that miss the local map go to the backend, so any worker can route any query.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+BACKENDS = ('memory', 'sqlite', 'redis')
+
+
+class SqliteBackend:
+    """Shared table in a local SQLite file (WAL); calls run in a worker thread."""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        # A connection must not cross a fork: each worker process opens its own
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._pid = os.getpid()
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS query_cluster ('
+            'query_id TEXT PRIMARY KEY, cluster TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS query_cluster_expires ON query_cluster (expires_at)')
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            return self._conn.execute(sql, params)
+
+    async def get(self, query_id: str) -> Optional[str]:
+        row = await asyncio.to_thread(
+            lambda: self._execute(
+                'SELECT cluster FROM query_cluster WHERE query_id = ? AND expires_at > ?', (query_id, time.time())
+            ).fetchone()
+        )
+        return row[0] if row else None
+
+    async def set(self, query_id: str, cluster: str) -> None:
+        await asyncio.to_thread(
+            self._execute, 'INSERT OR REPLACE INTO query_cluster VALUES (?, ?, ?)', (query_id, cluster, time.time() + self.ttl)
+        )
+
+    async def delete(self, query_id: str) -> None:
+        await asyncio.to_thread(self._execute, 'DELETE FROM query_cluster WHERE query_id = ?', (query_id,))
+
+    async def purge(self) -> int:
+        cursor = await asyncio.to_thread(self._execute, 'DELETE FROM query_cluster WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(lambda: self._execute('SELECT COUNT(*) FROM query_cluster').fetchone()[0])
+
+
+class RedisBackend:
+    """Keys with native expiry in Redis (or any server speaking its protocol). Needs the `redis` package."""
+
+    name = 'redis'
+    PREFIX = 'dyrasql:query:'
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio as redis_asyncio
+        self.url = url
+        self.ttl = ttl
+        self._client = redis_asyncio.from_url(url, socket_timeout=2)
+
+    async def get(self, query_id: str) -> Optional[str]:
+        value = await self._client.get(self.PREFIX + query_id)
+        return value.decode('utf-8') if value else None
+
+    async def set(self, query_id: str, cluster: str) -> None:
+        await self._client.set(self.PREFIX + query_id, cluster, ex=max(1, int(self.ttl)))
+
+    async def delete(self, query_id: str) -> None:
+        await self._client.delete(self.PREFIX + query_id)
+
+    async def purge(self) -> int:
+        # Redis expires the keys itself
+        return 0
+
+    async def count(self) -> Optional[int]:
+        return None
+
+
+def backend_from_env(ttl: float):
+    """Backend named by DYRASQL_QUERY_MAP_BACKEND (None for memory)."""
+    name = os.getenv('DYRASQL_QUERY_MAP_BACKEND', 'memory').lower()
+    url = os.getenv('DYRASQL_QUERY_MAP_URL', '')
+    if name not in BACKENDS:
+        logger.warning("query_map invalid_backend backend=%s fallback=memory", name)
+        return None
+    try:
+        if name == 'sqlite':
+            return SqliteBackend(url or '/tmp/dyrasql-query-map.db', ttl)
+        if name == 'redis':
+            return RedisBackend(url or 'redis://localhost:6379/0', ttl)
+    except Exception as e:
+        logger.error("query_map backend_unavailable backend=%s error=%s fallback=memory", name, str(e))
+    return None
+
+
+class QueryClusterMap:
+    """Bounded, TTL'd query id -> cluster map with an optional shared backend. Runs on the event loop."""
+
+    def __init__(self, backend=None):
+        self.max_entries = int(os.getenv('DYRASQL_QUERY_MAP_MAX_ENTRIES', '100000'))
+        self.ttl = float(os.getenv('DYRASQL_QUERY_MAP_TTL_SECONDS', '21600'))
+        self.backend = backend if backend is not None else backend_from_env(self.ttl)
+        # Least recently used first; using an entry moves it to the end, so expiry order matches too
+        self._entries: 'collections.OrderedDict[str, tuple]' = collections.OrderedDict()
+        self._pending = set()
+        self._sweeper = None
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'backend_hits': 0,
+            'completed': 0,
+            'evicted': 0,
+            'expired': 0,
+            'backend_errors': 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, query_id: str, cluster: str) -> None:
+        self._entries[query_id] = (cluster, time.monotonic() + self.ttl)
+        self._entries.move_to_end(query_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evicted'] += 1
+
+    async def set(self, query_id: Optional[str], cluster: str) -> None:
+        """Maps a submitted query; written through to the backend before the client can poll it."""
+        if not query_id:
+            return
+        self._store(query_id, cluster)
+        if self.backend is not None:
+            try:
+                await self.backend.set(query_id, cluster)
+            except Exception as e:
+                self.counters['backend_errors'] += 1
+                logger.warning("query_map backend_set_failed query_id=%s error=%s", query_id, str(e))
+
+    async def get(self, query_id: Optional[str]) -> Optional[str]:
+        if not query_id:
+            return None
+        entry = self._entries.get(query_id)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self.counters['hits'] += 1
+                self._store(query_id, entry[0])
+                return entry[0]
+            del self._entries[query_id]
+            self.counters['expired'] += 1
+        if self.backend is not None:
+            try:
+                cluster = await self.backend.get(query_id)
+            except Exception as e:
+                self.counters['backend_errors'] += 1
+                logger.warning("query_map backend_get_failed query_id=%s error=%s", query_id, str(e))
+                cluster = None
+            if cluster:
+                self.counters['backend_hits'] += 1
+                self._store(query_id, cluster)
+                return cluster
+        self.counters['misses'] += 1
+        return None
+
+    def discard(self, query_id: Optional[str]) -> None:
+        """Query finished, failed or was cancelled: no more requests will need its cluster."""
+        if not query_id:
+            return
+        if self._entries.pop(query_id, None) is not None:
+            self.counters['completed'] += 1
+        if self.backend is not None:
+            task = asyncio.get_running_loop().create_task(self._backend_delete(query_id))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _backend_delete(self, query_id: str) -> None:
+        try:
+            await self.backend.delete(query_id)
+        except Exception as e:
+            self.counters['backend_errors'] += 1
+            logger.debug("query_map backend_delete_failed query_id=%s error=%s", query_id, str(e))
+
+    def expire(self) -> int:
+        now = time.monotonic()
+        expired = 0
+        while self._entries:
+            query_id, (cluster, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[query_id]
+            expired += 1
+        self.counters['expired'] += expired
+        return expired
+
+    async def _sweep(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                expired = self.expire()
+                purged = await self.backend.purge() if self.backend is not None else 0
+                if expired or purged:
+                    logger.debug("query_map_swept expired=%s purged=%s entries=%s", expired, purged, len(self._entries))
+            except Exception as e:
+                logger.warning("query_map_sweep error=%s", str(e))
+
+    def start(self, interval: float = 60.0):
+        """Starts the periodic expiry sweep on the running loop."""
+        if self.backend is None:
+            # Workers forked from an already imported app get their shared backend here
+            self.backend = backend_from_env(self.ttl)
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep(interval))
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the local map (container, keys and entry tuples)."""
+        return sys.getsizeof(self._entries) + sum(
+            sys.getsizeof(query_id) + sys.getsizeof(entry) + sys.getsizeof(entry[1])
+            for query_id, entry in self._entries.items()
+        )
+
+    async def snapshot(self) -> Dict[str, Any]:
+        backend_entries = None
+        if self.backend is not None:
+            try:
+                backend_entries = await self.backend.count()
+            except Exception:
+                backend_entries = None
+        return {
+            'backend': self.backend.name if self.backend is not None else 'memory',
+            'entries': len(self._entries),
+            'backend_entries': backend_entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'memory_bytes': self.memory_bytes(),
+            **self.counters,
+        }
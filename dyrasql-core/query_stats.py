@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Query Stats - post-execution metrics captured from the Trino protocol pages the proxy relays.
+The terminal page (no nextUri) carries the final `stats` (state, elapsed/cpu time, processed
+bytes) and `error`. PageScanner finds them while the page streams through, keeping only the
+bytes from the last `"stats":` marker; MetricsCollector maps query id -> fingerprint/cluster
+and hands the records to a sink in batches.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+STATS_MARKER = b'"stats":'
+ERROR_MARKER = '"error":'
+NEXT_URI_MARKER = b'"nextUri"'
+
+# Trino writes id/infoUri/nextUri/columns/data/stats/error in this order, so the stats object is
+# at the tail of the page; larger captures (huge rootStage trees) are dropped.
+MAX_STATS_BYTES = 256 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class PageScanner:
+    """Incremental scan of one statement page: terminal flag (page head) and final stats (tail)."""
+
+    # nextUri precedes columns/data, so it is always within the first bytes of the page
+    HEAD_BYTES = 4096
+
+    __slots__ = ('_terminal', '_head', '_carry', '_capture')
+
+    def __init__(self):
+        self._terminal = None
+        self._head = b''
+        self._carry = b''
+        self._capture = None
+
+    @property
+    def terminal(self) -> bool:
+        """True when the page has no nextUri (read once the page is complete)."""
+        if self._terminal is None:
+            self._decide()
+        return self._terminal
+
+    def _decide(self) -> None:
+        head, self._head = self._head, b''
+        self._terminal = NEXT_URI_MARKER not in head
+        if self._terminal:
+            self._scan(head)
+
+    def feed(self, chunk: bytes) -> None:
+        if self._terminal is None:
+            self._head += chunk
+            if len(self._head) >= self.HEAD_BYTES:
+                self._decide()
+        elif self._terminal:
+            self._scan(chunk)
+
+    def _scan(self, chunk: bytes) -> None:
+        data = self._carry + chunk
+        index = data.rfind(STATS_MARKER)
+        if index >= 0:
+            self._capture = bytearray(data[index + len(STATS_MARKER):])
+        elif self._capture is not None:
+            self._capture += chunk
+            if len(self._capture) > MAX_STATS_BYTES:
+                self._capture = None
+        self._carry = data[-(len(STATS_MARKER) - 1):]
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """{'stats': {...}, 'error': {...} | None} for a terminal page, None otherwise."""
+        if not self.terminal or self._capture is None:
+            return None
+        try:
+            text = self._capture.decode('utf-8')
+            stats, end = _decoder.raw_decode(text.lstrip())
+        except (UnicodeDecodeError, ValueError):
+            return None
+        error = None
+        offset = len(text) - len(text.lstrip())
+        error_index = text.find(ERROR_MARKER, offset + end)
+        if error_index >= 0:
+            try:
+                error, _ = _decoder.raw_decode(text[error_index + len(ERROR_MARKER):].lstrip())
+            except ValueError:
+                error = None
+        return {'stats': stats if isinstance(stats, dict) else {}, 'error': error if isinstance(error, dict) else None}
+
+
+def scan_page(content: bytes) -> PageScanner:
+    """PageScanner over a fully buffered page."""
+    scanner = PageScanner()
+    scanner.feed(content)
+    return scanner
+
+
+def metrics_record(context: Dict[str, Any], page: Dict[str, Any]) -> Dict[str, Any]:
+    """Terminal page stats -> history metrics record (times in seconds, like /api/v1/metrics)."""
+    stats = page['stats']
+    error = page.get('error') or {}
+    state = stats.get('state')
+    return {
+        'fingerprint': context['fingerprint'],
+        'cluster': context['cluster'],
+        'query_id': context['query_id'],
+        'state': state,
+        'success': state == 'FINISHED' and not error,
+        'execution_time': stats.get('elapsedTimeMillis', 0) / 1000.0,
+        'cpu_time': stats.get('cpuTimeMillis', 0) / 1000.0,
+        'queued_time': stats.get('queuedTimeMillis', 0) / 1000.0,
+        'processed_bytes': stats.get('processedBytes', 0),
+        'processed_rows': stats.get('processedRows', 0),
+        'peak_memory_bytes': stats.get('peakMemoryBytes', 0),
+        'error_name': error.get('errorName'),
+    }
+
+
+class MetricsCollector:
+    """Maps in-flight query ids to fingerprint/cluster and batches terminal-page metrics to a sink."""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        self.sink = sink
+        self.batch_size = int(os.getenv('DYRASQL_METRICS_BATCH_SIZE', '50'))
+        self.flush_seconds = float(os.getenv('DYRASQL_METRICS_FLUSH_SECONDS', '5'))
+        self.max_pending = int(os.getenv('DYRASQL_METRICS_MAX_PENDING', '5000'))
+        self.context_ttl = float(os.getenv('DYRASQL_METRICS_CONTEXT_TTL_SECONDS', '3600'))
+        self._contexts: Dict[str, Dict[str, Any]] = {}
+        self._pending = collections.deque()
+        self._wakeup = None
+        self._flusher = None
+        self.counters = {'captured': 0, 'flushed': 0, 'dropped': 0, 'flush_errors': 0, 'expired_contexts': 0}
+
+    def register(self, query_id: Optional[str], fingerprint: Optional[str], cluster: str) -> None:
+        """Remembers which fingerprint/cluster a submitted query belongs to."""
+        if query_id and fingerprint:
+            self._contexts[query_id] = {
+                'query_id': query_id,
+                'fingerprint': fingerprint,
+                'cluster': cluster,
+                'registered_at': time.time(),
+            }
+
+    def context(self, query_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self._contexts.get(query_id) if query_id else None
+
+    def complete(self, query_id: Optional[str], scanner: Optional[PageScanner]) -> Optional[Dict[str, Any]]:
+        """Terminal page seen: queues its metrics record (if stats were found) and forgets the query."""
+        context = self._contexts.pop(query_id, None) if query_id else None
+        if context is None or scanner is None:
+            return None
+        page = scanner.result()
+        if page is None or not page['stats']:
+            return None
+        record = metrics_record(context, page)
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.counters['dropped'] += 1
+        self._pending.append(record)
+        self.counters['captured'] += 1
+        logger.debug("query_metrics_captured query_id=%s cluster=%s state=%s elapsed=%.3fs",
+                     query_id, record['cluster'], record['state'], record['execution_time'])
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return record
+
+    def _expire_contexts(self) -> None:
+        # Queries abandoned without a terminal page (bypass mode, client gone)
+        cutoff = time.time() - self.context_ttl
+        stale = [qid for qid, ctx in self._contexts.items() if ctx['registered_at'] < cutoff]
+        for qid in stale:
+            del self._contexts[qid]
+        self.counters['expired_contexts'] += len(stale)
+
+    async def flush(self) -> int:
+        flushed = 0
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await self.sink(batch)
+                flushed += len(batch)
+            except Exception as e:
+                self.counters['flush_errors'] += 1
+                self.counters['dropped'] += len(batch)
+                logger.warning("query_metrics_flush_failed records=%s error=%s", len(batch), str(e))
+        self.counters['flushed'] += flushed
+        if flushed:
+            logger.info("query_metrics_flushed records=%s", flushed)
+        return flushed
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._expire_contexts()
+            await self.flush()
+
+    def start(self):
+        """Starts the periodic flusher on the running loop."""
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Flushes what is pending (shutdown)."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._contexts),
+            'pending': len(self._pending),
+            **self.counters,
+        }
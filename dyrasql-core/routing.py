@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Routing - the routing decision as an importable library, shared by dyrasql-core and the
+gateway proxy (embedded mode). Covers everything that needs no EXPLAIN: query fingerprint,
+decision cache (an in-process L1 in front of the history table, when one is given) and the
+catalog-query shortcut. Cache misses that need EXPLAIN are left to the caller: dyrasql-core
+runs EXPLAIN (TYPE IO) and the decision engine, the proxy asks the remote core.
+Kept free of boto3/requests/numpy so the proxy can import it without the core's dependencies.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from telemetry import inc, timer
+
+logger = logging.getLogger(__name__)
+
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'[^']*'")
+_NUMBER = re.compile(r'\d+')
+
+
+def fingerprint(query: str) -> str:
+    """Unique fingerprint of a SQL query (normalized, then hashed)."""
+    with timer('routing_stage_seconds', 'fingerprint'):
+        return _fingerprint(query)
+
+
+def _fingerprint(query: str) -> str:
+    normalized = _WHITESPACE.sub(' ', query.strip().lower())
+    normalized = _STRING_LITERAL.sub("'?'", normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def is_catalog_query(query: str) -> bool:
+    """
+    Catalog/metadata queries (e.g. JDBC IDE catalog discovery) go to the default tier.
+    Matches system.jdbc.* and information_schema.
+    """
+    if not query or not query.strip():
+        return False
+    q = query.strip().lower()
+    return 'system.jdbc' in q or 'information_schema' in q
+
+
+def expected_runtime(decision: Dict[str, Any]) -> Optional[float]:
+    """Runtime of the last captured run of a cached decision, if it ran on the decided cluster."""
+    if 'expected_runtime' in decision:
+        return decision['expected_runtime']
+    if decision.get('executed_cluster') == decision.get('cluster'):
+        return decision.get('execution_time')
+    return None
+
+
+class DecisionCache:
+    """In-process L1: fingerprint -> decision, LRU-bounded, each entry kept for `ttl` seconds."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('DYRASQL_L1_CACHE_SIZE', '10000'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('DYRASQL_L1_CACHE_TTL_SECONDS', '30'))
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.counters['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry[1]
+
+    def put(self, key: str, decision: Dict[str, Any]) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, decision)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl_seconds': self.ttl, **self.counters}
+
+
+class Router:
+    """Decisions that need no EXPLAIN; `route()` returns None when the caller must analyze the query."""
+
+    def __init__(self, cluster_registry, history_manager=None, snapshot_tracker=None,
+                 cache: Optional[DecisionCache] = None):
+        self.cluster_registry = cluster_registry
+        self.history_manager = history_manager
+        self.snapshot_tracker = snapshot_tracker
+        self.cache = cache
+
+    def cached(self, key: str, event: str = 'route') -> Optional[Dict[str, Any]]:
+        """Cached decision of a fingerprint (L1, then the history table), dropped when no longer valid."""
+        with timer('routing_stage_seconds', 'cache_lookup'):
+            decision, result = self._cached(key, event)
+        inc('decision_cache_total', result)
+        return decision
+
+    def _cached(self, key: str, event: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """(decision, lookup result: hit, miss or stale)."""
+        decision = self.cache.get(key) if self.cache is not None else None
+        from_l1 = decision is not None
+        if decision is None and self.history_manager is not None:
+            decision = self.history_manager.get_cached_decision(key)
+        if not decision:
+            return None, 'miss'
+        if decision['cluster'] not in self.cluster_registry.current().names:
+            logger.info("%s_cache_ignored fingerprint=%s cluster=%s reason=tier_not_in_registry", event, key[:16], decision['cluster'])
+            self.invalidate(key, shared=False)
+            return None, 'stale'
+        if self.snapshot_tracker is not None:
+            table = self.snapshot_tracker.changed(decision.get('tables'))
+            if table:
+                logger.info("%s_cache_invalidated fingerprint=%s cluster=%s reason=snapshot_size table=%s", event, key[:16], decision['cluster'], table)
+                self.invalidate(key)
+                return None, 'stale'
+        if not from_l1 and self.cache is not None:
+            self.cache.put(key, decision)
+        return decision, 'hit'
+
+    def save(self, key: str, decision: Dict[str, Any]) -> None:
+        """New or corrected decision: L1 and the history table."""
+        with timer('routing_stage_seconds', 'persist'):
+            if self.cache is not None:
+                self.cache.put(key, decision)
+            if self.history_manager is not None:
+                self.history_manager.save_decision(key, decision)
+
+    def invalidate(self, key: str, shared: bool = True) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(key)
+        if shared and self.history_manager is not None:
+            self.history_manager.invalidate_decision(key)
+
+    def route(self, query: str, event: str = 'route') -> Tuple[str, Optional[Dict[str, Any]]]:
+        """(fingerprint, decision) for cache hits and catalog queries; (fingerprint, None) when EXPLAIN is needed."""
+        key = fingerprint(query)
+        decision = self.cached(key, event)
+        if decision:
+            logger.info("%s_response cached=true fingerprint=%s cluster=%s", event, key[:16], decision['cluster'])
+            return key, self.response(key, decision, cached=True)
+        if is_catalog_query(query):
+            cluster = self.cluster_registry.current().default_tier
+            logger.info("%s_response catalog_query=true cluster=%s fingerprint=%s", event, cluster, key[:16])
+            decision = {'cluster': cluster, 'score': 0.0, 'factors': {'volume': 0, 'complexity': 0, 'historical': 0}}
+            self.save(key, decision)
+            return key, self.response(key, decision, cached=False)
+        return key, None
+
+    @staticmethod
+    def response(key: str, decision: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+        """Decision in the shape returned by /api/v1/route (without the cluster URLs)."""
+        return {
+            'fingerprint': key,
+            'cluster': decision['cluster'],
+            'score': decision.get('score'),
+            'factors': decision.get('factors', {}),
+            'cached': cached,
+            'expected_runtime': expected_runtime(decision) if cached else None,
+        }
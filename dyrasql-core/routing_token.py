@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Routing Token - the cluster of a query, carried in the URLs the proxy hands out.
+In proxy mode cluster URLs are rewritten to <proxy>/c/<token>/v1/statement/..., where the token
+is the cluster name plus a truncated HMAC-SHA256 of it. Any replica holding the same
+DYRASQL_ROUTING_TOKEN_SECRET can route the next poll without shared state; a token that does not
+verify (tampered, other secret) is ignored and the path falls back to the query map.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+PATH_PREFIX = 'c/'
+# Placeholder secrets shipped in old compose files; anyone could forge tokens with them
+PLACEHOLDER_SECRETS = frozenset(('change-me', 'changeme'))
+MAC_BYTES = 8
+
+# Token names are used verbatim in the path
+TOKEN_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class RoutingTokens:
+    """Signs and verifies cluster tokens."""
+
+    def __init__(self, secret: Optional[str] = None):
+        self.enabled = os.getenv('DYRASQL_ROUTING_TOKENS', 'true').lower() == 'true'
+        secret = secret or os.getenv('DYRASQL_ROUTING_TOKEN_SECRET', '')
+        if secret in PLACEHOLDER_SECRETS and self.enabled:
+            # Never sign with a published secret; behave as if it were not set
+            logger.error("routing_tokens secret_is_placeholder tokens_valid=this_process_only")
+            secret = secrets.token_hex(32)
+        elif not secret and self.enabled:
+            # Tokens still work within this process; other replicas fall back to their query map
+            logger.warning("routing_tokens secret_not_set tokens_valid=this_process_only")
+            secret = secrets.token_hex(32)
+        self._key = secret.encode('utf-8')
+        self.counters = {'resolved': 0, 'invalid': 0}
+
+    def _mac(self, name: str) -> str:
+        digest = hmac.new(self._key, name.encode('utf-8'), hashlib.sha256).digest()[:MAC_BYTES]
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+    def encode(self, cluster_name: str) -> str:
+        return f"{cluster_name}.{self._mac(cluster_name)}"
+
+    def decode(self, token: str) -> Optional[str]:
+        """Cluster name of a valid token, None otherwise."""
+        name, _, mac = token.rpartition('.')
+        if not name or not TOKEN_NAME.match(name) or not hmac.compare_digest(mac, self._mac(name)):
+            return None
+        return name
+
+    def prefix(self, cluster_name: str) -> str:
+        """Path prefix that routes to `cluster_name` ('' when tokens are off or the name is unusable)."""
+        if not self.enabled or not TOKEN_NAME.match(cluster_name):
+            return ''
+        return '/' + PATH_PREFIX + self.encode(cluster_name)
+
+    def resolve(self, path: str, config) -> Tuple[Optional[str], str]:
+        """(cluster from the path's token or None, path without the token prefix)."""
+        if not path.startswith(PATH_PREFIX):
+            return None, path
+        token, _, rest = path[len(PATH_PREFIX):].partition('/')
+        cluster_name = self.decode(token)
+        if cluster_name is None or not config.has_tier(cluster_name):
+            self.counters['invalid'] += 1
+            logger.warning("routing_token_invalid token=%s", token[:40])
+            return None, rest
+        self.counters['resolved'] += 1
+        return cluster_name, rest
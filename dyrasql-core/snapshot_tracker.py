@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Snapshot Tracker - current Iceberg snapshot size of the tables behind cached decisions.
+Cache misses record each table's size with the decision; cache hits compare against the
+tracked size and drop the decision when a table grew or shrank by DYRASQL_SNAPSHOT_SIZE_CHANGE_FACTOR.
+Hits never wait on the catalog: stale entries are refreshed in the background.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotTracker:
+    """table name -> (checked_at, total_size) with stale-while-revalidate refreshes."""
+
+    def __init__(self, connector):
+        self.connector = connector
+        self.check_seconds = float(os.getenv('DYRASQL_SNAPSHOT_CHECK_SECONDS', '60'))
+        self.change_factor = float(os.getenv('DYRASQL_SNAPSHOT_SIZE_CHANGE_FACTOR', '2.0'))
+        self.enabled = self.change_factor > 1.0
+        self._sizes: Dict[str, tuple] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='snapshot-check')
+
+    def _load(self, table: str) -> Optional[int]:
+        snapshot = self.connector.get_snapshot(table)
+        size = snapshot['total_size'] if snapshot and snapshot.get('total_size') else None
+        with self._lock:
+            self._sizes[table] = (time.time(), size)
+            self._refreshing.discard(table)
+        return size
+
+    def _stale(self, entry) -> bool:
+        return entry is None or time.time() - entry[0] >= self.check_seconds
+
+    def sizes(self, tables: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Current sizes, loading stale ones inline (cache misses already pay for EXPLAIN)."""
+        if not self.enabled:
+            return {}
+        result = {}
+        for table in tables:
+            entry = self._sizes.get(table)
+            result[table] = self._load(table) if self._stale(entry) else entry[1]
+        return result
+
+    def _peek(self, table: str) -> Optional[int]:
+        entry = self._sizes.get(table)
+        if self._stale(entry):
+            with self._lock:
+                schedule = table not in self._refreshing
+                self._refreshing.add(table)
+            if schedule:
+                self._executor.submit(self._load, table)
+        return entry[1] if entry else None
+
+    def changed(self, recorded: Optional[Dict[str, Optional[int]]]) -> Optional[str]:
+        """First table whose size moved by change_factor since `recorded`, or None."""
+        if not self.enabled or not recorded:
+            return None
+        for table, size in recorded.items():
+            if not size:
+                continue
+            current = self._peek(table)
+            if not current:
+                continue
+            ratio = current / float(size)
+            if ratio >= self.change_factor or ratio <= 1.0 / self.change_factor:
+                logger.info("snapshot_size_changed table=%s recorded=%s current=%s ratio=%.2f", table, size, current, ratio)
+                return table
+        return None
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Spooling - Trino's spooled client protocol through the proxies.
+A client that sends X-Trino-Query-Data-Encoding (json+zstd, json+lz4, json) gets pages whose
+`data` is {"encoding": ..., "segments": [...]}: inline segments carry their rows base64-encoded,
+spooled segments a `uri` to download and an `ackUri` to call once downloaded. Storage URIs
+(retrieval mode STORAGE, or the coordinator's redirect to storage) are left alone, so result
+bytes go from object storage to the client without crossing the coordinator or the proxy.
+Coordinator URIs (/v1/spooled/download|ack/...) are rewritten like nextUri, so downloads, acks
+and deletes reach the cluster that spooled the segment. Worker URIs (WORKER_PROXY) are not known
+to the registry and must be reachable by the clients as they are.
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+HEADER = 'X-Trino-Query-Data-Encoding'
+
+ENABLED = os.getenv('DYRASQL_SPOOLING', 'true').lower() == 'true'
+ENCODINGS = tuple(
+    encoding.strip().lower()
+    for encoding in os.getenv('DYRASQL_SPOOLING_ENCODINGS', 'json+zstd,json+lz4,json').split(',')
+    if encoding.strip()
+)
+
+# Statements submitted with a spooled encoding, and requests for one left inline
+counters: Dict[str, int] = {'negotiated': 0, 'inline': 0}
+
+
+def negotiate(requested: Optional[str]) -> Optional[str]:
+    """Encodings to request from the cluster (client order, allowed ones only); None = inline `data`."""
+    if not requested:
+        return None
+    accepted = [e.strip() for e in requested.split(',') if e.strip().lower() in ENCODINGS] if ENABLED else []
+    if not accepted:
+        counters['inline'] += 1
+        logger.debug("spooling_inline requested=%s", requested[:80])
+        return None
+    counters['negotiated'] += 1
+    return ', '.join(accepted)
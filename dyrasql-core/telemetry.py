@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Telemetry - Prometheus metrics of both services (GET /metrics).
+Routing stages, DynamoDB and Trino client calls are timed into the fixed-bucket histograms of
+`workers` (and are spans of sampled traces, see `tracing`); decisions, decision-cache lookups
+and relayed pages/bytes are plain counters. Recording is a perf_counter pair, a bisect and a
+dict update, with no lock: the event loop is the only writer apart from the few history writes
+done in a thread, where a rare lost increment is acceptable. Every worker publishes its values with its other stats, so /metrics renders the
+totals of all workers, plus request latency and in-flight queries from the admission snapshot.
+"""
+
+import functools
+import time
+from typing import Any, Dict, List, Tuple
+
+import diagnostics
+import tracing
+from workers import BUCKETS, Histogram
+
+
+# Metric -> its label
+HISTOGRAMS = {
+    'routing_stage_seconds': 'stage',
+    'dynamodb_request_seconds': 'operation',
+    'trino_request_seconds': 'operation',
+    'event_loop_lag_seconds': 'loop',
+}
+COUNTERS = {
+    'routing_decisions_total': 'cluster',
+    'decision_cache_total': 'result',
+    'proxied_pages_total': 'cluster',
+    'proxied_bytes_total': 'cluster',
+}
+HELP = {
+    'request_duration_seconds': 'Time to response start per request kind (submit, poll, other)',
+    'routing_stage_seconds': 'Duration of each routing stage',
+    'dynamodb_request_seconds': 'Duration of history table operations',
+    'trino_request_seconds': 'Duration of Trino client calls',
+    'event_loop_lag_seconds': 'Delay of the event loop in running a due timer (see profiling)',
+    'routing_decisions_total': 'Routing decisions per decided cluster',
+    'decision_cache_total': 'Decision cache lookups by result (hit, miss, stale)',
+    'decision_cache_hit_ratio': 'Decision cache hits over lookups',
+    'proxied_pages_total': 'Statement pages relayed per cluster',
+    'proxied_bytes_total': 'Statement page bytes relayed per cluster (as sent to the client)',
+    'inflight_queries': 'Queries holding an admission slot per cluster',
+    'workers': 'Server worker processes',
+}
+PREFIX = 'dyrasql_'
+# Histogram -> span name prefix and kind of the spans its timers open
+SPANS = {
+    'routing_stage_seconds': ('routing', tracing.INTERNAL),
+    'dynamodb_request_seconds': ('dynamodb', tracing.CLIENT),
+    'trino_request_seconds': ('trino', tracing.CLIENT),
+}
+
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_counters: Dict[str, Dict[str, float]] = {name: {} for name in COUNTERS}
+
+
+def observe(metric: str, label: str, seconds: float) -> None:
+    histogram = _histograms.get((metric, label))
+    if histogram is None:
+        histogram = _histograms[(metric, label)] = Histogram()
+    histogram.observe(seconds)
+
+
+def inc(metric: str, label: str, value: float = 1) -> None:
+    counter = _counters[metric]
+    counter[label] = counter.get(label, 0) + value
+
+
+class timer:
+    """
+    `with timer('routing_stage_seconds', 'decide'):` records the block's duration, and is a
+    tracing span (e.g. `routing.decide`) when the request is sampled and a Server-Timing entry
+    when it asked for diagnostics.
+    """
+
+    __slots__ = ('metric', 'label', 'started', 'span')
+
+    def __init__(self, metric: str, label: str):
+        self.metric = metric
+        self.label = label
+
+    def __enter__(self):
+        prefix, kind = SPANS[self.metric]
+        self.span = tracing.span(f'{prefix}.{self.label}', kind).__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        observe(self.metric, self.label, elapsed)
+        if diagnostics.ENABLED:
+            diagnostics.record(f'{SPANS[self.metric][0]}.{self.label}', elapsed)
+        self.span.__exit__(*exc)
+        return False
+
+
+def timed(metric: str, label: str):
+    """Decorator form of `timer` for plain functions and methods."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(metric, label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[str, Any]:
+    """This worker's values (histogram counts are summed element-wise across workers)."""
+    histograms: Dict[str, Dict[str, Any]] = {}
+    for (metric, label), histogram in list(_histograms.items()):
+        histograms.setdefault(metric, {})[label] = {
+            'counts': list(histogram.counts), 'count': histogram.count, 'sum': histogram.sum,
+        }
+    return {'histograms': histograms, 'counters': {metric: dict(values) for metric, values in _counters.items()}}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _header(lines: List[str], name: str, kind: str) -> None:
+    lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+def _histogram(lines: List[str], name: str, label: str, value: str, data: Dict[str, Any]) -> None:
+    labels = f'{label}="{_escape(value)}"'
+    cumulative = 0
+    for bound, count in zip(BUCKETS, data['counts']):
+        cumulative += count
+        lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{PREFIX}{name}_bucket{{{labels},le="+Inf"}} {data["count"]}')
+    lines.append(f'{PREFIX}{name}_sum{{{labels}}} {_number(data["sum"])}')
+    lines.append(f'{PREFIX}{name}_count{{{labels}}} {data["count"]}')
+
+
+def render(aggregate: Dict[str, Any]) -> str:
+    """Prometheus text exposition (0.0.4) of WorkerStats.aggregate()."""
+    lines: List[str] = []
+    totals = aggregate.get('totals', {})
+    values = totals.get('telemetry', {})
+
+    _header(lines, 'request_duration_seconds', 'histogram')
+    for kind, data in sorted(aggregate.get('histograms', {}).items()):
+        _histogram(lines, 'request_duration_seconds', 'kind', kind, data)
+
+    histograms = values.get('histograms', {})
+    for name, label in HISTOGRAMS.items():
+        _header(lines, name, 'histogram')
+        for value, data in sorted(histograms.get(name, {}).items()):
+            _histogram(lines, name, label, value, data)
+
+    counters = values.get('counters', {})
+    for name, label in COUNTERS.items():
+        _header(lines, name, 'counter')
+        for value, count in sorted(counters.get(name, {}).items()):
+            lines.append(f'{PREFIX}{name}{{{label}="{_escape(value)}"}} {_number(count)}')
+
+    cache = counters.get('decision_cache_total', {})
+    lookups = sum(cache.values())
+    _header(lines, 'decision_cache_hit_ratio', 'gauge')
+    lines.append(f"{PREFIX}decision_cache_hit_ratio {_number(cache.get('hit', 0) / lookups if lookups else 0.0)}")
+
+    _header(lines, 'inflight_queries', 'gauge')
+    for cluster, state in sorted(totals.get('admission', {}).get('clusters', {}).items()):
+        lines.append(f'{PREFIX}inflight_queries{{cluster="{_escape(cluster)}"}} {state.get("active", 0)}')
+
+    _header(lines, 'workers', 'gauge')
+    lines.append(f"{PREFIX}workers {len(aggregate.get('workers', [])) or 1}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tracing - OpenTelemetry-style spans across trino-gateway-proxy, dyrasql-core, Trino and DynamoDB.
+Every request gets a server span (TracingMiddleware) that continues the caller's W3C
+`traceparent` or starts a trace sampled at DYRASQL_TRACE_SAMPLE_RATE; an incoming sampled flag
+always wins, so a trace started in the proxy is kept whole in the core. The stages timed by
+`telemetry` (routing stages, DynamoDB operations, Trino submit/poll/EXPLAIN) are child spans,
+and outbound calls carry `traceparent` (`headers()`), so the core and Trino join the trace.
+Finished spans are queued and written by a background thread in OTLP/JSON: one
+ExportTraceServiceRequest per line in DYRASQL_TRACE_FILE (readable offline, or by the
+collector's otlpjsonfile receiver) or POSTed to DYRASQL_TRACE_OTLP_ENDPOINT (OTLP/HTTP).
+Unsampled requests cost one context variable per request and nothing per stage.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+EXPORTER = os.getenv('DYRASQL_TRACE_EXPORTER', 'none').lower()  # none | file | otlp
+ENABLED = EXPORTER in ('file', 'otlp')
+SAMPLE_RATE = float(os.getenv('DYRASQL_TRACE_SAMPLE_RATE', '0.01'))
+OTLP_ENDPOINT = os.getenv('DYRASQL_TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+FLUSH_SECONDS = float(os.getenv('DYRASQL_TRACE_FLUSH_SECONDS', '2'))
+# Finished spans waiting for export; the oldest are dropped beyond this
+QUEUE_SIZE = int(os.getenv('DYRASQL_TRACE_QUEUE_SIZE', '10000'))
+
+HEADER = 'traceparent'
+_TRACEPARENT = re.compile(r'00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})')
+# Requests not worth a trace
+UNTRACED_PATHS = frozenset(('/health', '/metrics'))
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+counters: Dict[str, int] = {'sampled': 0, 'spans': 0, 'exported': 0, 'dropped': 0, 'export_failures': 0}
+
+_service = 'dyrasql'
+_current: contextvars.ContextVar = contextvars.ContextVar('dyrasql_span', default=None)
+_queue: deque = deque()
+_exporter: Optional[threading.Thread] = None
+_wake = threading.Event()
+_lock = threading.Lock()
+
+
+class _NoSpan:
+    """Stands in for a span that is not recorded."""
+
+    __slots__ = ()
+    sampled = False
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class _Unsampled(_NoSpan):
+    """Unsampled request: nothing is recorded, but outbound calls still carry its traceparent."""
+
+    __slots__ = ('traceparent', '_token')
+
+    def __init__(self, trace_id: str, parent_id: str):
+        self.traceparent = f'00-{trace_id}-{parent_id}-00'
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+
+class Span:
+    """Recorded span; current (parent of new spans) between __enter__ and __exit__."""
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error', '_token')
+    sampled = True
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def set(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None and self.error is None:
+            self.error = f'{exc_type.__name__}: {exc}'
+        _finish(self)
+        return False
+
+
+def configure(service: str) -> None:
+    """Service name of the spans this process exports (resource `service.name`)."""
+    global _service
+    _service = service
+
+
+def _parse(traceparent: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    match = _TRACEPARENT.fullmatch((traceparent or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def start(name: str, traceparent: Optional[str] = None, kind: int = SERVER, **attributes) -> Any:
+    """Entry span of a request: continues `traceparent` (its sampled flag decides) or starts a trace."""
+    if not ENABLED:
+        return NO_SPAN
+    parsed = _parse(traceparent)
+    if parsed is not None:
+        trace_id, parent_id, sampled = parsed
+    else:
+        trace_id, parent_id, sampled = secrets.token_hex(16), None, random.random() < SAMPLE_RATE
+    if not sampled:
+        return _Unsampled(trace_id, parent_id or secrets.token_hex(8))
+    counters['sampled'] += 1
+    return Span(name, kind, trace_id, parent_id, attributes)
+
+
+def span(name: str, kind: int = INTERNAL, **attributes) -> Any:
+    """Child of the current span; a no-op outside a sampled trace."""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return NO_SPAN
+    return Span(name, kind, parent.trace_id, parent.span_id, attributes)
+
+
+def current() -> Any:
+    """Innermost span (NO_SPAN when none is recorded), e.g. to `set()` attributes on it."""
+    parent = _current.get()
+    return parent if parent is not None and parent.sampled else NO_SPAN
+
+
+def headers() -> Dict[str, str]:
+    """Propagation headers for an outbound call made in the current span."""
+    parent = _current.get()
+    return {HEADER: parent.traceparent} if parent is not None else {}
+
+
+def _finish(finished: Span) -> None:
+    global _exporter
+    counters['spans'] += 1
+    if len(_queue) >= QUEUE_SIZE:
+        _queue.popleft()
+        counters['dropped'] += 1
+    _queue.append(finished)
+    if _exporter is None:
+        with _lock:
+            if _exporter is None:
+                _exporter = threading.Thread(target=_export_loop, name='trace-exporter', daemon=True)
+                _exporter.start()
+
+
+def _value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(values: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _value(value)} for key, value in values.items()]
+
+
+def _otlp(spans: List[Span]) -> Dict[str, Any]:
+    """ExportTraceServiceRequest (OTLP/JSON) of a batch of spans."""
+    encoded = []
+    for s in spans:
+        item = {
+            'traceId': s.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': s.kind,
+            'startTimeUnixNano': str(s.start),
+            'endTimeUnixNano': str(s.end),
+            'attributes': _attributes(s.attributes),
+            'status': {'code': 2, 'message': s.error} if s.error else {'code': 0},
+        }
+        if s.parent_id:
+            item['parentSpanId'] = s.parent_id
+        encoded.append(item)
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attributes({'service.name': _service, 'process.pid': os.getpid()})},
+        'scopeSpans': [{'scope': {'name': 'dyrasql.tracing'}, 'spans': encoded}],
+    }]}
+
+
+def _trace_file() -> str:
+    return os.getenv('DYRASQL_TRACE_FILE') or os.path.join(os.getenv('LOG_DIR', '/app/logs'), f'{_service}-traces.jsonl')
+
+
+def _export(spans: List[Span]) -> None:
+    body = json.dumps(_otlp(spans), separators=(',', ':')).encode('utf-8')
+    if EXPORTER == 'file':
+        # One write per batch: lines of concurrent workers do not interleave
+        fd = os.open(_trace_file(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, body + b'\n')
+        finally:
+            os.close(fd)
+    else:
+        request = urllib.request.Request(OTLP_ENDPOINT, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
+def flush() -> None:
+    """Exports every queued span (called by the exporter thread and at shutdown)."""
+    while _queue:
+        batch = []
+        while _queue and len(batch) < 512:
+            batch.append(_queue.popleft())
+        try:
+            _export(batch)
+            counters['exported'] += len(batch)
+        except Exception as e:
+            counters['export_failures'] += 1
+            counters['dropped'] += len(batch)
+            logger.warning("trace_export_failed exporter=%s spans=%s error=%s", EXPORTER, len(batch), str(e))
+
+
+def _export_loop() -> None:
+    while True:
+        _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        flush()
+
+
+def shutdown() -> None:
+    if _exporter is not None:
+        flush()
+
+
+def snapshot() -> Dict[str, Any]:
+    return {'exporter': EXPORTER, 'queued': len(_queue), **counters}
+
+
+class TracingMiddleware:
+    """ASGI middleware: server span per request, continuing the caller's traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ENABLED or scope['path'] in UNTRACED_PATHS:
+            return await self.app(scope, receive, send)
+        path, method = scope['path'], scope['method']
+        # Low-cardinality names: query ids and tokens stay in http.target
+        if 'v1/statement' not in path:
+            name = f'{method} {path}' if path.startswith('/api/') or path.startswith('/v1/info') else f'{method} /*'
+        elif method == 'POST' and path.rstrip('/').endswith('/v1/statement'):
+            name = 'POST /v1/statement'
+        else:
+            name = f'{method} /v1/statement/{{queryId}}'
+        traceparent = None
+        for key, value in scope['headers']:
+            if key == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+        with start(name, traceparent, **{'http.method': method, 'http.target': path}) as server:
+
+            async def traced_send(message):
+                if message['type'] == 'http.response.start':
+                    server.set('http.status_code', message['status'])
+                    if message['status'] >= 500 and server.sampled:
+                        server.error = f"HTTP {message['status']}"
+                await send(message)
+
+            await self.app(scope, receive, traced_send)
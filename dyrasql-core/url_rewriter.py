@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+URL Rewriter - single-pass rewrite of cluster URLs in Trino protocol pages, on bytes.
+All cluster prefixes are compiled into one alternation (longest first), matched only when
+followed by a statement (/v1/statement/...), spooled segment (/v1/spooled/...) or UI (/ui/...)
+path, like the per-cluster re.sub chain it replaces. The page's query id is the first key of the page, so it is read
+with an anchored match on the head instead of a json.loads; no decode/encode round trip.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+# Anchored: Trino always writes "id" first. Keeping it out of the URL alternation lets sre
+# use the prefixes' common literal start ("http") for a fast search.
+ID_PATTERN = re.compile(rb'\s*\{\s*"id"\s*:\s*"([^"]+)"')
+PATH_LOOKAHEAD = rb'(?=/v1/statement/[^"]|/v1/spooled/[^"]|/ui/[^"])'
+
+
+class UrlRewriter:
+    """Rewrites `prefix -> replacement` URLs and extracts the page's query id."""
+
+    __slots__ = ('_pattern', '_replace')
+
+    def __init__(self, replacements: Dict[str, str]):
+        replacements = {
+            prefix.encode('utf-8'): target.encode('utf-8')
+            for prefix, target in replacements.items() if prefix and prefix != target
+        }
+        self._pattern = None
+        self._replace = None
+        if replacements:
+            prefixes = sorted(replacements, key=len, reverse=True)
+            self._pattern = re.compile(b'(' + b'|'.join(re.escape(p) for p in prefixes) + b')' + PATH_LOOKAHEAD)
+            targets = set(replacements.values())
+            if len(targets) == 1:
+                # Literal template (proxy mode): no Python call per match
+                self._replace = targets.pop().replace(b'\\', b'\\\\')
+            else:
+                self._replace = lambda match: replacements[match.group(1)]
+
+    @property
+    def identity(self) -> bool:
+        """True when no URL would change (rewrite() returns the content object itself)."""
+        return self._pattern is None
+
+    def rewrite(self, content: bytes) -> Tuple[bytes, Optional[str]]:
+        """(rewritten content, query id or None)."""
+        match = ID_PATTERN.match(content)
+        query_id = match.group(1).decode('utf-8', 'replace') if match else None
+        if self._pattern is not None:
+            content = self._pattern.sub(self._replace, content)
+        return content, query_id
+
+
+class UrlRewriters:
+    """Rewriters for the current registry config; rebuilt when a reload swaps the config."""
+
+    def __init__(self, registry, proxy_url: str, tokens=None):
+        self.registry = registry
+        self.proxy_url = proxy_url
+        self.tokens = tokens
+        self._config = None
+        self._proxy: Dict[Optional[str], UrlRewriter] = {}
+        self._bypass: Dict[str, UrlRewriter] = {}
+
+    def _current(self):
+        config = self.registry.current()
+        if config is not self._config:
+            self._config = config
+            self._proxy = {}
+            self._bypass = {}
+        return config
+
+    def proxy(self, cluster_name: Optional[str] = None) -> UrlRewriter:
+        """
+        Every cluster URL -> the proxy (all traffic keeps going through it), with the cluster's
+        routing token. Tiers may share a URL, so the serving cluster's own URL gets its token.
+        """
+        config = self._current()
+        rewriter = self._proxy.get(cluster_name)
+        if rewriter is None:
+            replacements = {tier.url: self._proxy_url(tier.name) for tier in config.all_tiers()}
+            if config.has_tier(cluster_name):
+                replacements[config.tier(cluster_name).url] = self._proxy_url(cluster_name)
+            rewriter = self._proxy[cluster_name] = UrlRewriter(replacements)
+        return rewriter
+
+    def _proxy_url(self, cluster_name: str) -> str:
+        return self.proxy_url + (self.tokens.prefix(cluster_name) if self.tokens is not None else '')
+
+    def bypass(self, cluster_name: str) -> UrlRewriter:
+        """The cluster's internal URL -> its external URL (client talks to the cluster directly)."""
+        config = self._current()
+        rewriter = self._bypass.get(cluster_name)
+        if rewriter is None:
+            tier = config.tier(cluster_name)
+            rewriter = self._bypass[cluster_name] = UrlRewriter({tier.url: tier.external_url})
+        return rewriter
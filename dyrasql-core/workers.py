@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Workers - multi-process server mode (DYRASQL_WORKERS > 1).
+A supervisor forks the imported app into N uvicorn workers that each bind the port with
+SO_REUSEPORT, so the kernel spreads connections and a client's keep-alive connection (and so the
+polls of its query) stays on one worker. State that must survive a poll landing elsewhere is
+shared: the query map defaults to a SQLite file next to the worker stats, and the routing token
+secret is the same in every worker. Admission quotas are split (max_concurrent / N per worker).
+Every worker publishes its counters and latency histograms to DYRASQL_WORKER_STATS_DIR; any worker
+answers GET /api/v1/workers with the merged view. The supervisor replaces workers that exit,
+grow past DYRASQL_WORKER_MAX_RSS_MB or keep a request p95 above DYRASQL_WORKER_MAX_P95_MS:
+the replacement binds first, then the old worker drains its connections.
+"""
+
+import asyncio
+import bisect
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds (seconds) of the latency buckets; the last bucket is unbounded. The sub-millisecond
+# ones are for in-process routing stages (fingerprint, cache lookup)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Merging worker snapshots: numbers (and equal-length lists of numbers, e.g. histogram bucket
+# counts) are summed, except peaks (max across workers) and settings
+PEAK_KEYS = frozenset(('max', 'p50', 'p95', 'p99'))
+SETTING_KEYS = frozenset((
+    'default_limit', 'max_queue', 'max_wait_seconds', 'lease_seconds', 'reconcile_seconds',
+    'max_entries', 'ttl_seconds', 'backend_entries', 'workers',
+))
+
+
+def worker_count() -> int:
+    """Workers serving the app (set by the supervisor; 1 when running a single process)."""
+    return max(1, int(os.getenv('DYRASQL_WORKER_COUNT', '1')))
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds); mergeable across workers."""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        for i, count in enumerate(data.get('counts', ())[:len(self.counts)]):
+            self.counts[i] += count
+        self.count += data.get('count', 0)
+        self.sum += data.get('sum', 0.0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[min(i, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'buckets': list(BUCKETS),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Histogram':
+        histogram = cls()
+        histogram.merge(data)
+        return histogram
+
+
+def _numbers(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value)
+
+
+def merge_snapshots(total: Dict[str, Any], part: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds one worker's snapshot into `total` (in place)."""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            merge_snapshots(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in SETTING_KEYS:
+            current = total.get(key)
+            if not isinstance(current, (int, float)):
+                total[key] = value
+            elif key in PEAK_KEYS:
+                total[key] = max(current, value)
+            else:
+                total[key] = current + value
+        elif _numbers(value) and key in total:
+            current = total[key]
+            if _numbers(current) and len(current) == len(value):
+                total[key] = [a + b for a, b in zip(current, value)]
+        else:
+            total.setdefault(key, list(value) if _numbers(value) else value)
+    return total
+
+
+class WorkerStats:
+    """Request latency histograms and component snapshots of this worker, published for the others."""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.interval = float(os.getenv('DYRASQL_WORKER_STATS_SECONDS', '5'))
+        self.stats_dir = None
+        self.index = 0
+        self.started = time.time()
+        self.histograms: Dict[str, Histogram] = {}
+        # Requests since the last publish: the supervisor's latency threshold looks at this window
+        self.window = Histogram()
+        self._sources: Dict[str, Callable[[], Any]] = {}
+        self._publisher = None
+
+    def source(self, name: str, snapshot: Callable[[], Any]) -> None:
+        """Registers a component snapshot (plain or async callable returning a dict)."""
+        self._sources[name] = snapshot
+
+    def observe(self, kind: str, seconds: float) -> None:
+        histogram = self.histograms.get(kind)
+        if histogram is None:
+            histogram = self.histograms[kind] = Histogram()
+        histogram.observe(seconds)
+        self.window.observe(seconds)
+
+    async def collect(self) -> Dict[str, Any]:
+        sources = {}
+        for name, snapshot in self._sources.items():
+            try:
+                value = snapshot()
+                sources[name] = await value if asyncio.iscoroutine(value) else value
+            except Exception as e:
+                logger.warning("worker_stats source_failed source=%s error=%s", name, str(e))
+        return {
+            'index': self.index,
+            'pid': os.getpid(),
+            'started': self.started,
+            'rss_bytes': rss_bytes(),
+            'histograms': {kind: histogram.to_dict() for kind, histogram in self.histograms.items()},
+            'window': {'count': self.window.count, 'p95': self.window.quantile(0.95)},
+            'sources': sources,
+        }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.stats_dir, f"worker-{pid}.json")
+
+    async def publish(self) -> None:
+        snapshot = await self.collect()
+        self.window = Histogram()
+        path = self._path(os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.warning("worker_stats publish_failed error=%s", str(e))
+
+    async def start(self):
+        """Publishes right away (the supervisor reads it as readiness), then every interval."""
+        self.stats_dir = os.getenv('DYRASQL_WORKER_STATS_DIR') or None
+        self.index = int(os.getenv('DYRASQL_WORKER_INDEX', '0'))
+        self.started = time.time()
+        if self.stats_dir and self._publisher is None:
+            await self.publish()
+            self._publisher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+            try:
+                os.remove(self._path(os.getpid()))
+            except OSError:
+                pass
+
+    async def aggregate(self) -> Dict[str, Any]:
+        """Per-worker summary plus the merged histograms and component snapshots of all live workers."""
+        snapshots = [await self.collect()]
+        if self.stats_dir:
+            for path in glob.glob(os.path.join(self.stats_dir, 'worker-*.json')):
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                    if snapshot['pid'] == os.getpid():
+                        continue
+                    os.kill(snapshot['pid'], 0)
+                except (OSError, ValueError, KeyError):
+                    continue
+                snapshots.append(snapshot)
+        histograms: Dict[str, Histogram] = {}
+        totals: Dict[str, Any] = {}
+        workers = []
+        for snapshot in sorted(snapshots, key=lambda s: s['index']):
+            for kind, data in snapshot['histograms'].items():
+                histograms.setdefault(kind, Histogram()).merge(data)
+            merge_snapshots(totals, snapshot['sources'])
+            requests = snapshot['histograms']
+            workers.append({
+                'index': snapshot['index'],
+                'pid': snapshot['pid'],
+                'uptime_seconds': round(time.time() - snapshot['started'], 1),
+                'rss_bytes': snapshot['rss_bytes'],
+                'requests': sum(data['count'] for data in requests.values()),
+                'window_p95': snapshot['window']['p95'],
+            })
+        return {
+            'service': self.service,
+            'workers': workers,
+            'histograms': {kind: histogram.to_dict() for kind, histogram in histograms.items()},
+            'totals': totals,
+        }
+
+
+class RequestTimer:
+    """ASGI middleware: time to response start per request kind (submit, poll, other)."""
+
+    def __init__(self, app, stats: WorkerStats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        path = scope['path']
+        if 'v1/statement' not in path:
+            kind = 'other'
+        elif scope['method'] == 'POST' and path.rstrip('/').endswith('/v1/statement'):
+            kind = 'submit'
+        else:
+            kind = 'poll'
+        started = time.perf_counter()
+        observed = False
+
+        async def timed_send(message):
+            nonlocal observed
+            if not observed and message['type'] == 'http.response.start':
+                observed = True
+                self.stats.observe(kind, time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                self.stats.observe(kind, time.perf_counter() - started)
+
+
+class _Worker:
+
+    def __init__(self, index: int, process):
+        self.index = index
+        self.process = process
+        self.started = time.monotonic()
+        self.slow_checks = 0
+        self.retired_at = None
+
+
+def _bind(port: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('0.0.0.0', port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve_worker(app, port: int, index: int, shared_socket: Optional[socket.socket]):
+    import uvicorn
+    os.environ['DYRASQL_WORKER_INDEX'] = str(index)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    # A registry reload forwarded before the app installs its own handler must not kill the worker
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    sock = shared_socket or _bind(port, reuse_port=True)
+    server = uvicorn.Server(uvicorn.Config(app, host='0.0.0.0', port=port, log_config=None))
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks, watches and recycles the workers of one app."""
+
+    def __init__(self, app, port: int, workers: int):
+        self.app = app
+        self.port = port
+        self.count = workers
+        self.check_interval = float(os.getenv('DYRASQL_WORKER_CHECK_SECONDS', '5'))
+        self.max_rss = int(float(os.getenv('DYRASQL_WORKER_MAX_RSS_MB', '0')) * 1024 * 1024)
+        self.max_p95 = float(os.getenv('DYRASQL_WORKER_MAX_P95_MS', '0')) / 1000.0
+        self.slow_checks = int(os.getenv('DYRASQL_WORKER_SLOW_CHECKS', '3'))
+        self.min_requests = int(os.getenv('DYRASQL_WORKER_MIN_REQUESTS', '50'))
+        self.min_uptime = float(os.getenv('DYRASQL_WORKER_MIN_UPTIME_SECONDS', '60'))
+        self.drain_seconds = float(os.getenv('DYRASQL_WORKER_DRAIN_SECONDS', '30'))
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self._shared_socket = None
+        self._context = multiprocessing.get_context('fork')
+        self._workers: List[_Worker] = []
+        self._retiring: List[_Worker] = []
+        self._stopping = False
+        self._temporary_dir = None
+        self.restarts = {'exited': 0, 'memory': 0, 'latency': 0}
+
+    def _prepare_environment(self):
+        stats_dir = os.getenv('DYRASQL_WORKER_STATS_DIR')
+        if not stats_dir:
+            stats_dir = self._temporary_dir = tempfile.mkdtemp(prefix='dyrasql-workers-')
+        os.makedirs(stats_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(stats_dir, 'worker-*.json')):
+            os.remove(path)
+        os.environ['DYRASQL_WORKER_STATS_DIR'] = stats_dir
+        os.environ['DYRASQL_WORKER_COUNT'] = str(self.count)
+        if 'DYRASQL_QUERY_MAP_BACKEND' not in os.environ:
+            os.environ['DYRASQL_QUERY_MAP_BACKEND'] = 'sqlite'
+            os.environ.setdefault('DYRASQL_QUERY_MAP_URL', os.path.join(stats_dir, 'query-map.db'))
+        elif os.environ['DYRASQL_QUERY_MAP_BACKEND'].lower() == 'memory':
+            logger.warning("workers query_map_backend=memory polls_on_other_workers_route_by_token_only")
+        logger.info("workers starting count=%s port=%s stats_dir=%s reuse_port=%s query_map_backend=%s",
+                    self.count, self.port, stats_dir, self.reuse_port, os.environ['DYRASQL_QUERY_MAP_BACKEND'])
+
+    def _spawn(self, index: int) -> _Worker:
+        process = self._context.Process(
+            target=_serve_worker, args=(self.app, self.port, index, self._shared_socket),
+            name=f'dyrasql-worker-{index}', daemon=False,
+        )
+        process.start()
+        logger.info("worker_started index=%s pid=%s", index, process.pid)
+        return _Worker(index, process)
+
+    def _read_stats(self, pid: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(os.environ['DYRASQL_WORKER_STATS_DIR'], f"worker-{pid}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _wait_ready(self, worker: _Worker, timeout: float = 30.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and worker.process.is_alive():
+            if self._read_stats(worker.process.pid) is not None:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def _retire(self, worker: _Worker, reason: str):
+        """Starts the replacement, then asks the old worker to drain (SIGTERM: uvicorn stops accepting)."""
+        self.restarts[reason] += 1
+        logger.warning("worker_recycle index=%s pid=%s reason=%s", worker.index, worker.process.pid, reason)
+        replacement = self._spawn(worker.index)
+        if not self._wait_ready(replacement):
+            logger.warning("worker_replacement_not_ready index=%s pid=%s", worker.index, replacement.process.pid)
+        self._workers[self._workers.index(worker)] = replacement
+        worker.retired_at = time.monotonic()
+        worker.process.terminate()
+        self._retiring.append(worker)
+
+    def _check(self):
+        for worker in list(self._workers):
+            pid = worker.process.pid
+            if not worker.process.is_alive():
+                worker.process.join(0)
+                logger.warning("worker_exited index=%s pid=%s exitcode=%s", worker.index, pid, worker.process.exitcode)
+                self._remove_stats(pid)
+                self.restarts['exited'] += 1
+                self._workers[self._workers.index(worker)] = self._spawn(worker.index)
+                continue
+            if time.monotonic() - worker.started < self.min_uptime:
+                continue
+            if self.max_rss and rss_bytes(pid) > self.max_rss:
+                self._retire(worker, 'memory')
+                continue
+            stats = self._read_stats(pid)
+            window = (stats or {}).get('window') or {}
+            if self.max_p95 and window.get('count', 0) >= self.min_requests and (window.get('p95') or 0) > self.max_p95:
+                worker.slow_checks += 1
+                if worker.slow_checks >= self.slow_checks:
+                    self._retire(worker, 'latency')
+            else:
+                worker.slow_checks = 0
+        for worker in list(self._retiring):
+            if not worker.process.is_alive():
+                worker.process.join(0)
+                self._remove_stats(worker.process.pid)
+                self._retiring.remove(worker)
+            elif time.monotonic() - worker.retired_at > self.drain_seconds:
+                logger.warning("worker_drain_timeout index=%s pid=%s", worker.index, worker.process.pid)
+                worker.process.kill()
+
+    def _remove_stats(self, pid: int):
+        try:
+            os.remove(os.path.join(os.environ['DYRASQL_WORKER_STATS_DIR'], f"worker-{pid}.json"))
+        except OSError:
+            pass
+
+    def _signal_workers(self, signum: int):
+        for worker in self._workers + self._retiring:
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signum)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        self._prepare_environment()
+        if not self.reuse_port:
+            self._shared_socket = _bind(self.port, reuse_port=False)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        # Registry reloads reach every worker
+        signal.signal(signal.SIGHUP, lambda signum, frame: self._signal_workers(signal.SIGHUP))
+        self._workers = [self._spawn(index) for index in range(self.count)]
+        try:
+            while not self._stopping:
+                time.sleep(self.check_interval)
+                if not self._stopping:
+                    self._check()
+        finally:
+            logger.info("workers stopping count=%s restarts=%s", len(self._workers), self.restarts)
+            self._signal_workers(signal.SIGTERM)
+            deadline = time.monotonic() + self.drain_seconds
+            for worker in self._workers + self._retiring:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.kill()
+                self._remove_stats(worker.process.pid)
+            if self._temporary_dir:
+                shutil.rmtree(self._temporary_dir, ignore_errors=True)
+
+
+def serve(app, port: int):
+    """Runs the app on `port`: one uvicorn process, or a supervisor with DYRASQL_WORKERS workers."""
+    import uvicorn
+    workers = int(os.getenv('DYRASQL_WORKERS', '1'))
+    if workers <= 1:
+        # log_config=None: uvicorn's loggers propagate to the root logger (log_pipeline's queue)
+        uvicorn.run(app, host='0.0.0.0', port=port, log_config=None)
+        return
+    Supervisor(app, port, workers).run()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Routing replay and parameter sweep over the EXPLAIN archive.
+
+Streams the saved explains (EXPLAINS_DIR) and recorded execution metrics through
+DecisionEngine.decide_batch() for every combination of weights/thresholds in the grid,
+in parallel across a process pool, and reports per config:
+  - load distribution per cluster
+  - churn: fraction of routing events whose cluster differs from the current config
+  - regret: execution time lost versus the best observed cluster for the fingerprint
+
+Metrics come from a JSONL file (--metrics, one {"fingerprint", "cluster",
+"execution_time", "success"} per line) and/or the DynamoDB history table (--dynamodb).
+
+Tiers and the current weights come from the cluster registry (DYRASQL_CLUSTER_REGISTRY or env).
+
+Usage:
+  python scripts/replay_routing.py --explains-dir explains --since 20260901 \\
+      --w1 0.4:0.8:0.1 --w2 0.1,0.2,0.3 --w3 0.1 --threshold ecs=0.2:0.4:0.05 \\
+      --metrics metrics.jsonl --workers 8 --top 15
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Replay must never write new explains
+os.environ['SAVE_EXPLAINS'] = 'false'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core'))
+
+from cluster_registry import ClusterRegistry  # noqa: E402
+from decision_engine import DecisionEngine, COMPLEXITY_KEYS  # noqa: E402
+from query_analyzer import QueryAnalyzer  # noqa: E402
+
+# Explain files for the same fingerprint closer than this belong to one routing event
+# (IO attempt + DISTRIBUTED fallback are saved separately)
+EVENT_WINDOW_SECONDS = 60
+
+_replay = {}
+
+
+def parse_grid(spec):
+    """'0.1,0.2' -> [0.1, 0.2]; '0.2:0.4:0.1' -> [0.2, 0.3, 0.4] (inclusive)."""
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + i * step, 6) for i in range(count)]
+    return [float(v) for v in spec.split(',') if v]
+
+
+def list_explains(explains_dir, since=None, until=None):
+    """Explain file paths sorted by name (timestamp prefix), filtered by YYYYMMDD bounds."""
+    paths = []
+    with os.scandir(explains_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            day = entry.name[:8]
+            if (since and day < since) or (until and day > until):
+                continue
+            paths.append(entry.path)
+    paths.sort()
+    return paths
+
+
+def _load_explain_chunk(paths):
+    """Worker: reduce explain files to (fingerprint, epoch, size_bytes, complexity...) tuples."""
+    logging.disable(logging.CRITICAL)
+    analyzer = QueryAnalyzer()
+    rows = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        fingerprint = data.get('fingerprint')
+        query = data.get('query')
+        if not fingerprint or not query:
+            continue
+        parsed = data.get('parsed_result') or {}
+        # decide() sees metadata only when the explain yielded tables (NaN -> fv 0.5)
+        size_bytes = float(parsed.get('total_size_bytes', 0) or 0) if parsed.get('tables') else float('nan')
+        try:
+            epoch = time.mktime(time.strptime(os.path.basename(path)[:15], '%Y%m%d_%H%M%S'))
+        except ValueError:
+            epoch = 0.0
+        complexity = analyzer.analyze_complexity(query)
+        rows.append((fingerprint, epoch, size_bytes) + tuple(complexity[k] for k in COMPLEXITY_KEYS))
+    return rows
+
+
+def collapse_events(rows):
+    """Merge explain rows of one routing event; keeps the last row that carried metadata."""
+    rows.sort(key=lambda r: (r[0], r[1]))
+    events = []
+    for row in rows:
+        last = events[-1] if events else None
+        if last and last[0] == row[0] and row[1] - last[1] <= EVENT_WINDOW_SECONDS:
+            if row[2] == row[2] or last[2] != last[2]:
+                events[-1] = row
+            continue
+        events.append(row)
+    return events
+
+
+def load_metrics_file(path, observations, history, clusters):
+    """JSONL metrics -> observations[fingerprint][cluster] = [execution_time, ...]."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            fingerprint = record.get('fingerprint')
+            cluster = record.get('cluster')
+            if not fingerprint or cluster not in clusters:
+                continue
+            if record.get('execution_time') is not None and record.get('success', True):
+                observations[fingerprint][cluster].append(float(record['execution_time']))
+            if record.get('score') is not None:
+                history[fingerprint] = (float(record['score']), bool(record.get('success', True)))
+
+
+def load_metrics_dynamodb(observations, history, clusters):
+    """Scans the history table: (cluster, execution_time) observations and score/success for fh."""
+    import boto3
+
+    session = boto3.Session(profile_name=os.getenv('AWS_PROFILE', 'default'))
+    table = session.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1')).Table(
+        os.getenv('DYNAMODB_TABLE', 'dyrasql-history'))
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            fingerprint = item.get('fingerprint')
+            # executed_cluster: where the proxy saw it run (may differ from the cached decision)
+            cluster = item.get('executed_cluster') or item.get('cluster')
+            success = bool(item.get('success', True))
+            if cluster in clusters and item.get('execution_time') is not None and success:
+                observations[fingerprint][cluster].append(float(item['execution_time']))
+            if item.get('score') is not None:
+                history[fingerprint] = (float(item['score']), success)
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def build_arrays(events, observations, history, clusters):
+    """Columnar inputs for decide_batch plus the observed time matrix [events, clusters]."""
+    count = len(events)
+    size_bytes = np.fromiter((e[2] for e in events), dtype=np.float64, count=count)
+    complexity = {
+        key: np.fromiter((e[3 + i] for e in events), dtype=np.float64, count=count)
+        for i, key in enumerate(COMPLEXITY_KEYS)
+    }
+    historical = np.full(count, 0.5)
+    observed = np.full((count, len(clusters)), np.nan)
+    for row, event in enumerate(events):
+        fingerprint = event[0]
+        if fingerprint in history:
+            # Same rule as HistoryManager.get_historical_factor
+            score, success = history[fingerprint]
+            historical[row] = score if success else 1.0 - score
+        per_cluster = observations.get(fingerprint)
+        if per_cluster:
+            for index, cluster in enumerate(clusters):
+                if per_cluster.get(cluster):
+                    observed[row, index] = float(np.median(per_cluster[cluster]))
+    return size_bytes, complexity, historical, observed
+
+
+def _init_worker(base_config, size_bytes, complexity, historical, observed, baseline_index):
+    logging.disable(logging.CRITICAL)
+    _replay.update(engine=DecisionEngine(ClusterRegistry(config=base_config)), base_config=base_config,
+                   size_bytes=size_bytes, complexity=complexity, historical=historical,
+                   observed=observed, baseline_index=baseline_index,
+                   best=np.nanmin(np.where(np.isnan(observed).all(axis=1, keepdims=True), np.inf, observed), axis=1))
+
+
+def evaluate(config):
+    """Worker: scores all events under one config and summarizes load, churn and regret."""
+    routing = _replay['base_config'].with_overrides(config['weights'], config['max_scores'])
+    result = _replay['engine'].decide_batch(_replay['size_bytes'], _replay['complexity'],
+                                            _replay['historical'], config=routing)
+    index = result['cluster_index'].astype(np.intp)
+    observed = _replay['observed']
+
+    chosen_time = observed[np.arange(index.size), index]
+    known = ~np.isnan(chosen_time) & np.isfinite(_replay['best'])
+    regret = chosen_time[known] - _replay['best'][known]
+
+    return {
+        'config': config,
+        'load': dict(zip(routing.names, np.bincount(index, minlength=len(routing.tiers)).tolist())),
+        'churn': float(np.mean(index != _replay['baseline_index'])) if index.size else 0.0,
+        'regret_total_s': float(regret.sum()),
+        'regret_mean_s': float(regret.mean()) if regret.size else 0.0,
+        'regret_coverage': float(known.mean()) if index.size else 0.0,
+    }
+
+
+def grid_configs(args, base):
+    """Cartesian product of weight and tier max_score grids; invalid band orders are skipped."""
+    bounded = [t.name for t in base.tiers[:-1]]
+    thresholds = {}
+    for spec in args.threshold or []:
+        name, _, grid = spec.partition('=')
+        if name not in bounded:
+            raise SystemExit(f"--threshold {spec}: tier must be one of {bounded}")
+        thresholds[name] = parse_grid(grid)
+    axes = {
+        'volume': parse_grid(args.w1) if args.w1 else [base.weights['volume']],
+        'complexity': parse_grid(args.w2) if args.w2 else [base.weights['complexity']],
+        'historical': parse_grid(args.w3) if args.w3 else [base.weights['historical']],
+    }
+    for name in bounded:
+        axes[name] = thresholds.get(name, [base.tier(name).max_score])
+    for values in itertools.product(*axes.values()):
+        combo = dict(zip(axes.keys(), values))
+        weights = {k: combo[k] for k in ('volume', 'complexity', 'historical')}
+        max_scores = {name: combo[name] for name in bounded}
+        bounds = [max_scores[name] for name in bounded]
+        if bounds != sorted(bounds):
+            continue
+        if args.max_weight_error is not None and abs(sum(weights.values()) - 1.0) > args.max_weight_error:
+            continue
+        yield {'weights': weights, 'max_scores': max_scores}
+
+
+def format_row(summary, total):
+    config = summary['config']
+    weights = config['weights']
+    bands = ' '.join(f"{name}<{value:.2f}" for name, value in config['max_scores'].items())
+    load = ' '.join(f"{c}={n / total:6.1%}" for c, n in summary['load'].items()) if total else ''
+    return (f"w1={weights['volume']:.2f} w2={weights['complexity']:.2f} w3={weights['historical']:.2f} "
+            f"{bands} | {load} | churn={summary['churn']:6.1%} "
+            f"regret={summary['regret_total_s']:10.1f}s mean={summary['regret_mean_s']:7.2f}s "
+            f"coverage={summary['regret_coverage']:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--explains-dir', default=os.getenv('EXPLAINS_DIR', 'explains'))
+    parser.add_argument('--since', help='first day (YYYYMMDD) to replay')
+    parser.add_argument('--until', help='last day (YYYYMMDD) to replay')
+    parser.add_argument('--metrics', help='JSONL file with execution metrics')
+    parser.add_argument('--dynamodb', action='store_true', help='read metrics/history from DYNAMODB_TABLE')
+    parser.add_argument('--w1', help='volume weight grid: a,b,c or start:stop:step')
+    parser.add_argument('--w2', help='complexity weight grid')
+    parser.add_argument('--w3', help='historical weight grid')
+    parser.add_argument('--threshold', action='append', metavar='TIER=GRID',
+                        help='max_score grid of a tier, e.g. ecs=0.2:0.4:0.05 (repeatable)')
+    parser.add_argument('--max-weight-error', type=float, default=None,
+                        help='skip configs whose weights do not sum to 1.0 within this tolerance')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--sort', choices=['regret', 'churn'], default='regret')
+    parser.add_argument('--json', help='write all results to this file')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    started = time.perf_counter()
+    base = ClusterRegistry().current()
+    clusters = base.names
+
+    paths = list_explains(args.explains_dir, args.since, args.until)
+    chunk_size = max(1, min(2000, len(paths) // (args.workers * 4) or 1))
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for chunk_rows in pool.map(_load_explain_chunk, chunks):
+            rows.extend(chunk_rows)
+    events = collapse_events(rows)
+
+    observations = defaultdict(lambda: defaultdict(list))
+    history = {}
+    if args.metrics:
+        load_metrics_file(args.metrics, observations, history, clusters)
+    if args.dynamodb:
+        load_metrics_dynamodb(observations, history, clusters)
+
+    size_bytes, complexity, historical, observed = build_arrays(events, observations, history, clusters)
+    loaded = time.perf_counter()
+    print(f"loaded files={len(paths)} events={len(events)} fingerprints={len({e[0] for e in events})} "
+          f"observed_fingerprints={len(observations)} in {loaded - started:.1f}s")
+
+    baseline_engine = DecisionEngine(ClusterRegistry(config=base))
+    baseline_index = baseline_engine.decide_batch(size_bytes, complexity, historical)['cluster_index']
+    baseline_config = {
+        'weights': dict(base.weights),
+        'max_scores': {t.name: t.max_score for t in base.tiers[:-1]},
+    }
+
+    configs = list(grid_configs(args, base))
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(base, size_bytes, complexity, historical, observed, baseline_index)) as pool:
+        baseline = next(iter(pool.map(evaluate, [baseline_config])))
+        results = list(pool.map(evaluate, configs, chunksize=max(1, len(configs) // (args.workers * 4))))
+    swept = time.perf_counter()
+
+    key = (lambda r: (r['regret_total_s'], r['churn'])) if args.sort == 'regret' else (lambda r: (r['churn'], r['regret_total_s']))
+    results.sort(key=key)
+
+    total = len(events)
+    print(f"swept configs={len(configs)} in {swept - loaded:.1f}s ({args.workers} workers)")
+    print("current  " + format_row(baseline, total))
+    for rank, summary in enumerate(results[:args.top], 1):
+        print(f"#{rank:<7} " + format_row(summary, total))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'events': total, 'current': baseline, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
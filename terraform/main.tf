@@ -27,7 +27,8 @@ resource "aws_dynamodb_table" "dyrasql_history" {
     type = "S"
   }
 
-  # Habilita TTL para expiração automática de cache
+  # Habilita TTL para remoção automática de itens antigos (a validade da decisão é calculada
+  # pelo DyraSQL a partir de decided_at e stable_streak)
   ttl {
     attribute_name = "ttl"
     enabled        = true
@@ -9,16 +9,42 @@ from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.responses import StreamingResponse
 import httpx
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import sys
 import re
 import json
+import asyncio
 from urllib.parse import urljoin
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, Callable, List, Dict, Any, Tuple
+
+# Modules shared with dyrasql-core: copied next to app.py in the image, sibling dir when run from a checkout
+_CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dyrasql-core')
+if os.path.isdir(_CORE_DIR) and _CORE_DIR not in sys.path:
+    sys.path.append(_CORE_DIR)
+
+from cluster_registry import ClusterRegistry
+from catalog_cache import CatalogCache
+from admission import AdmissionController, AdmissionRejected
+from query_stats import MetricsCollector, PageScanner, scan_page
+from escalation import EscalationContext, EscalationTracker
+from page_rewriter import PageRewriter
+from compression import Decoder, Encoder, content_encoding, counters as compression_counters, decode, encode, negotiate
+from url_rewriter import UrlRewriter, UrlRewriters
+from query_map import QueryClusterMap
+from routing import DecisionCache, Router
+from probes import counters as probe_counters, matches as is_probe, respond as respond_probe
+from routing_token import RoutingTokens
+from spooling import HEADER as SPOOLING_HEADER, counters as spooling_counters, negotiate as negotiate_spooling
+from telemetry import inc, render as render_metrics, snapshot as telemetry_snapshot, timer
+from diagnostics import begin as begin_diagnostics, headers as diagnostic_headers, mark as mark_diagnostics
+from tracing import TracingMiddleware, configure as configure_tracing, current as current_span, headers as trace_headers, shutdown as shutdown_tracing, snapshot as tracing_snapshot
+from workers import RequestTimer, WorkerStats, serve
+from log_pipeline import configure as configure_logging, shutdown as shutdown_logging, snapshot as logging_snapshot
+from profiling import authorize as authorize_admin, cpu_profile, event_loop as event_loop_stats, memory_snapshot, start as start_profiling, stop as stop_profiling, structures as structure_sizes, track as track_structure, tracemalloc_start, tracemalloc_stop
 
 app = FastAPI(title="Trino Gateway Proxy", version="1.1.0")
 
-# Configure logging with both console and file handlers
+# Logging: console and rotating file, written by a background thread (see log_pipeline)
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_DIR = os.getenv('LOG_DIR', '/app/logs')
 LOG_FILE = os.path.join(LOG_DIR, 'trino-gateway-proxy.log')
@@ -26,48 +52,19 @@ LOG_FILE = os.path.join(LOG_DIR, 'trino-gateway-proxy.log')
 # Create logs directory if it doesn't exist
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Create formatter
-log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Create root logger
-root_logger = logging.getLogger()
-root_logger.setLevel(LOG_LEVEL)
-
-# Console handler (stdout)
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-root_logger.addHandler(console_handler)
-
-# File handler with rotation (10MB max, keep 5 backups)
-file_handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5,
-    encoding='utf-8'
-)
-file_handler.setFormatter(log_formatter)
-root_logger.addHandler(file_handler)
+configure_logging('trino-gateway-proxy', LOG_FILE, LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
 DYRASQL_CORE_URL = os.getenv('DYRASQL_CORE_URL', 'http://dyrasql-core:5000')
 TRINO_GATEWAY_URL = os.getenv('TRINO_GATEWAY_URL', 'http://trino-gateway:8080')
 
-# Internal cluster URLs (Docker network)
-CLUSTER_URLS = {
-    'ecs': os.getenv('TRINO_ECS_URL', 'http://trino-ecs:8080'),
-    'emr-standard': os.getenv('TRINO_EMR_STANDARD_URL', 'http://trino-emr-standard:8080'),
-    'emr-optimized': os.getenv('TRINO_EMR_OPTIMIZED_URL', 'http://trino-emr-optimized:8080')
-}
-
-# External cluster URLs (accessible by clients) - for bypass mode
-CLUSTER_EXTERNAL_URLS = {
-    'ecs': os.getenv('TRINO_ECS_EXTERNAL_URL', 'http://localhost:8081'),
-    'emr-standard': os.getenv('TRINO_EMR_STANDARD_EXTERNAL_URL', 'http://localhost:8082'),
-    'emr-optimized': os.getenv('TRINO_EMR_OPTIMIZED_EXTERNAL_URL', 'http://localhost:8083')
-}
-
-FALLBACK_CLUSTER = 'ecs'
+# Cluster tiers (internal/external URLs, score bands) shared with dyrasql-core
+cluster_registry = ClusterRegistry()
+
+# Per-cluster concurrency quotas (capacity.max_concurrent in the registry)
+admission_controller = AdmissionController(cluster_registry)
+
 TIMEOUT = int(os.getenv('ROUTING_TIMEOUT', '5'))
 DATA_TIMEOUT = int(os.getenv('DATA_TIMEOUT', '300'))  # Timeout for data fetching
 
@@ -78,8 +75,68 @@ BYPASS_MODE = os.getenv('BYPASS_MODE', 'true').lower() == 'true'
 # Streaming threshold: responses larger than this (bytes) use streaming
 STREAMING_THRESHOLD = int(os.getenv('STREAMING_THRESHOLD', '65536'))  # 64KB
 
-# Query ID to cluster mapping for routing subsequent requests
-query_cluster_map: dict = {}
+# Cluster tokens embedded in proxy-mode URLs, so any replica can route the next poll
+routing_tokens = RoutingTokens()
+
+# Cluster URL rewriters, precompiled per registry config
+url_rewriters = UrlRewriters(cluster_registry, 'http://localhost:8080', routing_tokens)
+
+# Query ID to cluster mapping for routing subsequent requests (bounded; optionally shared across workers)
+query_cluster_map = QueryClusterMap()
+
+# Per-user catalogs/schemas/tables/columns answering IDE discovery statements locally
+catalog_cache = CatalogCache(cluster_registry)
+
+# Routing: 'embedded' decides cache hits and catalog queries in-process (routing library + L1
+# decision cache) and asks DyraSQL Core only for queries that need EXPLAIN; 'remote' asks it always
+ROUTING_MODE = os.getenv('DYRASQL_ROUTING_MODE', 'embedded').lower()
+embedded_router = Router(cluster_registry, cache=DecisionCache()) if ROUTING_MODE == 'embedded' else None
+
+# One keep-alive connection pool to DyraSQL Core (routing, metrics, escalations)
+core_client = httpx.AsyncClient(timeout=TIMEOUT)
+
+
+async def submit_metrics_batch(records: List[Dict[str, Any]]) -> None:
+    """Sends captured post-execution metrics to DyraSQL Core (history store)."""
+    response = await core_client.post(f"{DYRASQL_CORE_URL}/api/v1/metrics/batch", json={'items': records})
+    response.raise_for_status()
+
+
+# Final stats of queries paged through the proxy (not available in bypass mode)
+metrics_collector = MetricsCollector(submit_metrics_batch)
+
+# SELECTs that can still move to a bigger tier (no rows relayed yet)
+escalation_tracker = EscalationTracker()
+
+# Latency histograms and component snapshots, merged across workers by /api/v1/workers
+worker_stats = WorkerStats('trino-gateway-proxy')
+worker_stats.source('admission', admission_controller.snapshot)
+worker_stats.source('metrics', metrics_collector.snapshot)
+worker_stats.source('escalation', escalation_tracker.snapshot)
+worker_stats.source('query_map', query_cluster_map.snapshot)
+worker_stats.source('routing_tokens', lambda: dict(routing_tokens.counters))
+worker_stats.source('compression', lambda: dict(compression_counters))
+worker_stats.source('spooling', lambda: dict(spooling_counters))
+worker_stats.source('probes', lambda: dict(probe_counters))
+worker_stats.source('catalog_cache', catalog_cache.snapshot)
+worker_stats.source('telemetry', telemetry_snapshot)
+worker_stats.source('tracing', tracing_snapshot)
+worker_stats.source('logging', logging_snapshot)
+# Components sized by /api/v1/admin/structures
+track_structure('cluster_registry', cluster_registry)
+track_structure('admission_controller', admission_controller)
+track_structure('metrics_collector', metrics_collector)
+track_structure('escalation_tracker', escalation_tracker)
+track_structure('routing_tokens', routing_tokens)
+track_structure('url_rewriters', url_rewriters)
+track_structure('query_cluster_map', query_cluster_map)
+track_structure('catalog_cache', catalog_cache)
+if embedded_router is not None:
+    worker_stats.source('decision_cache', embedded_router.cache.snapshot)
+    track_structure('embedded_router', embedded_router)
+app.add_middleware(RequestTimer, stats=worker_stats)
+configure_tracing('trino-gateway-proxy')
+app.add_middleware(TracingMiddleware)
 
 
 @app.get('/health')
@@ -92,60 +149,145 @@ async def health():
         'bypass_mode': BYPASS_MODE,
         'streaming_threshold': STREAMING_THRESHOLD,
         'dyrasql_core_url': DYRASQL_CORE_URL,
-        'trino_gateway_url': TRINO_GATEWAY_URL
+        'trino_gateway_url': TRINO_GATEWAY_URL,
+        'routing_mode': ROUTING_MODE
     }
 
 
-def rewrite_urls_for_bypass(content: str, cluster_name: str) -> str:
-    """
-    Rewrite internal cluster URLs to external URLs for bypass mode.
-    Client will connect directly to the cluster for subsequent requests.
-    """
-    cluster_url = CLUSTER_URLS.get(cluster_name, CLUSTER_URLS[FALLBACK_CLUSTER])
-    external_url = CLUSTER_EXTERNAL_URLS.get(cluster_name, CLUSTER_EXTERNAL_URLS[FALLBACK_CLUSTER])
+@app.get('/api/v1/admission')
+async def admission_stats():
+    """Admission control state per cluster: active slots, queue depth, wait times."""
+    return admission_controller.snapshot()
+
+
+@app.get('/api/v1/query-map')
+async def query_map_stats():
+    """Query ID to cluster map: entries, memory, hits/misses and evictions."""
+    return await query_cluster_map.snapshot()
+
+
+@app.get('/api/v1/workers')
+async def workers_stats():
+    """Server workers: per-worker summary plus counters and latency histograms merged across them."""
+    return await worker_stats.aggregate()
+
+
+@app.post('/api/v1/catalog-cache/invalidate')
+async def invalidate_catalog_cache():
+    """Drops the catalog snapshots of every worker (reloaded on the next discovery statement)."""
+    dropped = catalog_cache.invalidate()
+    logger.info("catalog_cache_invalidated reason=api snapshots=%s", dropped)
+    return {'invalidated': dropped}
 
-    # Replace internal URL with external URL
-    pattern = re.escape(cluster_url) + r'(/v1/statement/[^\"]+)'
-    replacement = external_url + r'\1'
-    content = re.sub(pattern, replacement, content)
 
-    # Also handle UI links
-    pattern_ui = re.escape(cluster_url) + r'(/ui/[^\"]+)'
-    replacement_ui = external_url + r'\1'
-    content = re.sub(pattern_ui, replacement_ui, content)
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus metrics (text format) of all workers: routing stages, clients, decisions, traffic."""
+    return Response(content=render_metrics(await worker_stats.aggregate()), media_type='text/plain; version=0.0.4')
 
-    return content
 
+@app.get('/api/v1/admin/profile')
+async def admin_profile(request: Request, seconds: float = 10, interval_ms: float = 10, mode: str = 'cpu'):
+    """Sampling profile of this worker as collapsed stacks (mode cpu: loop thread; tasks: await chains)."""
+    authorize_admin(request)
+    profile = await cpu_profile(seconds, interval_ms, mode)
+    return Response(content=profile['collapsed'], media_type='text/plain', headers={
+        'X-DyraSQL-Profile-Samples': str(profile['samples']), 'X-DyraSQL-Worker-Pid': str(os.getpid())})
 
-def rewrite_urls_for_proxy(content: str) -> str:
+
+@app.post('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_start(request: Request, frames: int = 1):
+    """Starts tracemalloc in this worker (allocations are slower until it is stopped)."""
+    authorize_admin(request)
+    return tracemalloc_start(frames)
+
+
+@app.get('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_snapshot(request: Request, group: str = 'lineno', limit: int = 20):
+    """Top allocation sites of this worker and the diff to its previous snapshot."""
+    authorize_admin(request)
+    return await memory_snapshot(group, limit)
+
+
+@app.delete('/api/v1/admin/tracemalloc')
+async def admin_tracemalloc_stop(request: Request):
+    """Stops tracemalloc and drops the kept snapshot."""
+    authorize_admin(request)
+    return tracemalloc_stop()
+
+
+@app.get('/api/v1/admin/structures')
+async def admin_structures(request: Request, types: int = 0):
+    """Approximate deep sizes of this worker's in-memory components, GC state and RSS."""
+    authorize_admin(request)
+    return await structure_sizes(types)
+
+
+@app.get('/api/v1/admin/event-loop')
+async def admin_event_loop(request: Request):
+    """Event loop lag histogram of this worker (all workers: event_loop_lag_seconds in /metrics)."""
+    authorize_admin(request)
+    return event_loop_stats()
+
+
+def rewrite_page(content: bytes, cluster_name: str) -> Tuple[bytes, Optional[str]]:
     """
-    Rewrite internal cluster URLs to proxy URL.
-    All traffic continues through the proxy.
+    Rewrite internal cluster URLs in a single pass; also returns the page's query ID.
+    Bypass mode: external URL of the cluster (client connects directly to it).
+    Proxy mode: the proxy URL (all traffic continues through the proxy).
     """
-    for cluster_name, cluster_url in CLUSTER_URLS.items():
-        # Rewrite statement URLs
-        pattern_next = re.escape(cluster_url) + r'(/v1/statement/[^\"]+)'
-        replacement_next = r'http://localhost:8080\1'
-        content = re.sub(pattern_next, replacement_next, content)
+    return page_url_rewriter(cluster_name).rewrite(content)
+
+
+def page_url_rewriter(cluster_name: str) -> UrlRewriter:
+    """URL rewriter for pages served by `cluster_name` in the current mode."""
+    return url_rewriters.bypass(cluster_name) if BYPASS_MODE else url_rewriters.proxy(cluster_name)
 
-        # Rewrite UI URLs
-        pattern_info = re.escape(cluster_url) + r'(/ui/[^\"]+)'
-        replacement_info = r'http://localhost:8080\1'
-        content = re.sub(pattern_info, replacement_info, content)
 
-    return content
+def page_rewrite_function(cluster_name: str) -> Callable[[bytes], bytes]:
+    """URL rewrite for pages served by `cluster_name` in the current mode."""
+    return lambda content: rewrite_page(content, cluster_name)[0]
 
 
-def extract_query_id_and_map_cluster(content: str, cluster_name: str) -> None:
-    """Extract query ID from response and map it to cluster for subsequent requests."""
+async def map_query_cluster(query_id: Optional[str], cluster_name: str) -> None:
+    """Map query ID to cluster for subsequent requests."""
+    if query_id:
+        await query_cluster_map.set(query_id, cluster_name)
+        logger.debug("query_mapped query_id=%s cluster=%s", query_id, cluster_name)
+
+
+async def record_escalation(fingerprint: str, from_cluster: str, to_cluster: str, reason: str, query_id: str) -> None:
+    """Tells DyraSQL Core to correct the fingerprint's cached decision after an escalation."""
+    if embedded_router is not None:
+        # The next run asks the core, which answers with the corrected decision
+        embedded_router.invalidate(fingerprint)
     try:
-        response_json = json.loads(content)
-        query_id = response_json.get('id')
-        if query_id:
-            query_cluster_map[query_id] = cluster_name
-            logger.debug("query_mapped query_id=%s cluster=%s", query_id, cluster_name)
-    except (json.JSONDecodeError, KeyError):
-        pass
+        await core_client.post(f"{DYRASQL_CORE_URL}/api/v1/escalations", headers=trace_headers(), json={
+            'fingerprint': fingerprint,
+            'from_cluster': from_cluster,
+            'to_cluster': to_cluster,
+            'reason': reason,
+            'query_id': query_id
+        })
+    except Exception as e:
+        logger.warning("escalation_record_failed fingerprint=%s error=%s", fingerprint[:16], str(e))
+
+
+def finish_query(query_id: Optional[str], scanner: Optional[PageScanner]) -> None:
+    """Terminal page relayed (or query cancelled): frees the admission slot, captures the final stats
+    and forgets the query's cluster."""
+    admission_controller.release_query(query_id)
+    metrics_collector.complete(query_id, scanner)
+    query_cluster_map.discard(query_id)
+
+
+def admission_rejected_response(e: AdmissionRejected) -> Response:
+    """503 + Retry-After: Trino clients retry the statement submission on 503."""
+    return Response(
+        content=json.dumps({'error': 'Cluster at capacity', 'cluster': e.cluster, 'reason': e.reason}).encode('utf-8'),
+        status_code=503,
+        headers={'Content-Type': 'application/json', 'Retry-After': str(e.retry_after)},
+    )
 
 
 @app.post('/v1/statement')
@@ -154,6 +296,9 @@ async def route_statement(request: Request):
     Intercepts SQL queries and routes based on DyraSQL Core decision.
     This is the main routing endpoint - always buffered for URL rewriting.
     """
+    admission = None
+    decision = {}
+    stages = begin_diagnostics(request.headers)
     try:
         query = (await request.body()).decode('utf-8')
         user = request.headers.get('X-Trino-User', 'admin')
@@ -161,24 +306,49 @@ async def route_statement(request: Request):
         if not query or not query.strip():
             raise HTTPException(status_code=400, detail='SQL query is required')
 
-        query_normalized = query.strip().upper().rstrip(';').strip()
-        is_keepalive = query_normalized in ['SELECT 1', 'SELECT 1 AS KEEPALIVE', 'SELECT 1 AS 1']
+        # Keepalive / validation probes: answered here, no query on the cluster
+        probe = respond_probe(query, str(request.base_url))
+        if probe is not None:
+            logger.info("statement_routing reason=probe answered=local user=%s", user)
+            return Response(content=probe, status_code=200, headers={'Content-Type': 'application/json'})
+        # IDE discovery (SHOW ..., DESCRIBE) answered from the user's catalog snapshot when exact
+        discovery = catalog_cache.answer(query, request.headers, str(request.base_url))
+        if discovery is not None:
+            logger.info("statement_routing reason=catalog_cache answered=local user=%s", user)
+            return Response(content=discovery, status_code=200, headers={'Content-Type': 'application/json'})
+        catalog_cache.observe(query)
+
+        # Probes not answered above (responses off, or not only literals) stay on the default tier
+        is_keepalive = is_probe(query)
+
+        config = cluster_registry.current()
+        fallback_cluster = config.default_tier
 
         if is_keepalive:
             logger.debug("statement_request keepalive user=%s", user)
-            cluster_name = FALLBACK_CLUSTER
+            cluster_name = fallback_cluster
         else:
             logger.info("statement_request user=%s query_preview=%s", user, query[:80].replace('\n', ' '))
-            cluster_name = await get_routing_decision(query)
+            decision = await get_routing_decision(query) or {}
+            cluster_name = decision.get('cluster')
             if not cluster_name:
-                logger.warning("routing_fallback reason=dyrasql_unavailable cluster=%s", FALLBACK_CLUSTER)
-                cluster_name = FALLBACK_CLUSTER
+                logger.warning("routing_fallback reason=dyrasql_unavailable cluster=%s", fallback_cluster)
+                cluster_name = fallback_cluster
 
-        cluster_url = CLUSTER_URLS.get(cluster_name)
-        if not cluster_url:
-            logger.error("routing_fallback reason=cluster_not_found cluster=%s fallback=%s", cluster_name, FALLBACK_CLUSTER)
-            cluster_url = CLUSTER_URLS[FALLBACK_CLUSTER]
-            cluster_name = FALLBACK_CLUSTER
+        if cluster_name not in config.names:
+            logger.error("routing_fallback reason=cluster_not_found cluster=%s fallback=%s", cluster_name, fallback_cluster)
+            cluster_name = fallback_cluster
+
+        if not is_keepalive:
+            admission = await admission_controller.acquire(cluster_name, config)
+            if admission.spilled:
+                logger.info("statement_spilled from=%s to=%s", cluster_name, admission.cluster)
+            cluster_name = admission.cluster
+        inc('routing_decisions_total', cluster_name)
+        server_span = current_span()
+        server_span.set('dyrasql.cluster', cluster_name)
+        server_span.set('dyrasql.fingerprint', decision.get('fingerprint'))
+        cluster_url = config.tier(cluster_name).url
 
         if not is_keepalive:
             logger.info("statement_routing cluster=%s url=%s bypass=%s", cluster_name, cluster_url, BYPASS_MODE)
@@ -194,20 +364,33 @@ async def route_statement(request: Request):
         for header in ['X-Trino-Catalog', 'X-Trino-Schema', 'X-Trino-Source', 'X-Trino-Client-Info']:
             if header in request.headers:
                 headers[header] = request.headers[header]
+        # Spooled protocol: segments are fetched by the client, not relayed in the pages
+        data_encoding = negotiate_spooling(request.headers.get(SPOOLING_HEADER))
+        if data_encoding:
+            headers[SPOOLING_HEADER] = data_encoding
 
+        mark_diagnostics(stages, 'routing')
         async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
-            response = await client.post(target_url, content=query, headers=headers)
-
-            response_content = response.content.decode('utf-8')
-
+            with timer('trino_request_seconds', 'submit'):
+                response = await client.post(target_url, content=query, headers={**headers, **trace_headers()})
+
+            # Rewrite URLs based on mode; the same pass finds the query ID
+            response_content, query_id = rewrite_page(response.content, cluster_name)
+            server_span.set('trino.query_id', query_id)
+            inc('proxied_pages_total', cluster_name)
+            inc('proxied_bytes_total', cluster_name, len(response_content))
             # Map query ID to cluster for subsequent requests
-            extract_query_id_and_map_cluster(response_content, cluster_name)
-
-            # Rewrite URLs based on mode
-            if BYPASS_MODE:
-                response_content = rewrite_urls_for_bypass(response_content, cluster_name)
-            else:
-                response_content = rewrite_urls_for_proxy(response_content)
+            await map_query_cluster(query_id, cluster_name)
+            if admission is not None:
+                admission_controller.bind(admission, query_id)
+            if not BYPASS_MODE:
+                fingerprint = decision.get('fingerprint')
+                metrics_collector.register(query_id, fingerprint, cluster_name)
+                escalation_tracker.register(query_id, EscalationContext(
+                    query, headers, cluster_name, fingerprint, decision.get('expected_runtime')))
+            scanner = scan_page(response.content)
+            if scanner.terminal:
+                finish_query(query_id, scanner)
 
             response_headers = {}
             for key, value in response.headers.items():
@@ -216,55 +399,79 @@ async def route_statement(request: Request):
 
             content_type = response.headers.get('Content-Type', 'application/json')
             response_headers['Content-Type'] = content_type
+            if stages is not None:
+                response_headers.update(diagnostic_headers(
+                    stages, cluster_name, decision.get('fingerprint'), decision,
+                    decision.get('cached') if decision else None))
 
             return Response(
-                content=response_content.encode('utf-8'),
+                content=response_content,
                 status_code=response.status_code,
                 headers=response_headers,
             )
 
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except httpx.TimeoutException:
+        admission_controller.release(admission)
         logger.warning("statement_request timeout")
         raise HTTPException(status_code=504, detail='Query execution timeout')
     except Exception as e:
+        admission_controller.release(admission)
         logger.exception("statement_request error=%s", str(e))
         raise HTTPException(status_code=500, detail='Query routing failed')
 
 
-async def stream_response(response: httpx.Response, cluster_name: str) -> AsyncGenerator[bytes, None]:
+async def stream_response(response: httpx.Response, cluster_name: str,
+                          query_id: Optional[str] = None,
+                          rewriter: Optional[PageRewriter] = None,
+                          client: Optional[httpx.AsyncClient] = None) -> AsyncGenerator[bytes, None]:
     """
     Stream response chunks from cluster to client.
     Minimal memory footprint for large responses.
+    Statement pages are scanned on the fly for the terminal page and its final stats, and
+    their top-level URIs are rewritten by `rewriter`. Closes the upstream response (and client).
+    Statement pages are counted per cluster once fully sent.
     """
-    async for chunk in response.aiter_bytes(chunk_size=8192):
-        yield chunk
-
-
-async def stream_response_with_rewrite(response: httpx.Response, cluster_name: str) -> AsyncGenerator[bytes, None]:
-    """
-    Stream response with URL rewriting for smaller responses.
-    For larger responses, streams without modification (acceptable for data chunks).
-    """
-    # For small responses, buffer and rewrite
-    content_length = response.headers.get('content-length')
-    if content_length and int(content_length) < STREAMING_THRESHOLD:
-        content = b''
-        async for chunk in response.aiter_bytes():
-            content += chunk
-
-        try:
-            text_content = content.decode('utf-8')
-            if BYPASS_MODE:
-                text_content = rewrite_urls_for_bypass(text_content, cluster_name)
-            else:
-                text_content = rewrite_urls_for_proxy(text_content)
-            yield text_content.encode('utf-8')
-        except UnicodeDecodeError:
-            yield content
-    else:
-        # For large responses, stream directly (data chunks don't need URL rewriting)
-        async for chunk in response.aiter_bytes(chunk_size=8192):
-            yield chunk
+    scanner = PageScanner() if query_id else None
+    encoding = content_encoding(response.headers)
+    # Compressed pages: decoded for the scanner/rewriter; re-encoded only when rewritten
+    decoder = Decoder(encoding) if encoding and (scanner is not None or rewriter is not None) else None
+    encoder = Encoder(encoding) if encoding and rewriter is not None else None
+    if encoding:
+        compression_counters['recompressed' if encoder is not None else 'passthrough'] += 1
+    sent = 0
+    try:
+        async for raw in response.aiter_raw(chunk_size=8192):
+            chunk = decoder.decompress(raw) if decoder is not None else raw
+            if scanner is not None:
+                scanner.feed(chunk)
+            if rewriter is None:
+                sent += len(raw)
+                yield raw
+                continue
+            chunk = rewriter.feed(chunk)
+            if encoder is not None:
+                chunk = encoder.compress(chunk)
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        if rewriter is not None:
+            tail = rewriter.close()
+            if encoder is not None:
+                tail = encoder.compress(tail) + encoder.flush()
+            if tail:
+                sent += len(tail)
+                yield tail
+        if scanner is not None and scanner.terminal:
+            finish_query(query_id, scanner)
+        if query_id:
+            inc('proxied_pages_total', cluster_name)
+            inc('proxied_bytes_total', cluster_name, sent)
+    finally:
+        await response.aclose()
+        if client is not None:
+            await client.aclose()
 
 
 @app.get('/v1/info')
@@ -272,19 +479,20 @@ async def info():
     """Trino /v1/info endpoint - proxies to default cluster."""
     try:
         async with httpx.AsyncClient(timeout=2, headers={'Accept-Encoding': 'identity'}) as client:
-            response = await client.get(f"{CLUSTER_URLS[FALLBACK_CLUSTER]}/v1/info")
+            config = cluster_registry.current()
+            response = await client.get(f"{config.tier(config.default_tier).url}/v1/info")
 
             response_headers = {}
             for key, value in response.headers.items():
-                if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding']:
+                if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding', 'content-length']:
                     response_headers[key] = value
 
-            response_content = response.content.decode('utf-8')
+            response_content = response.content
             if not BYPASS_MODE:
-                response_content = rewrite_urls_for_proxy(response_content)
+                response_content = url_rewriters.proxy(config.default_tier).rewrite(response_content)[0]
 
             return Response(
-                content=response_content.encode('utf-8'),
+                content=response_content,
                 status_code=response.status_code,
                 headers=response_headers,
             )
@@ -328,18 +536,79 @@ async def get_statement():
     raise HTTPException(status_code=405, detail='Method not allowed. Use POST /v1/statement to execute queries.')
 
 
-def get_cluster_for_path(path: str) -> str:
-    """Determine which cluster handles this path based on query ID."""
+def get_query_id_from_path(path: str) -> Optional[str]:
+    """Trino query ID embedded in statement/query paths, if any."""
     query_id_match = re.search(r'/(\d{8}_\d{6}_\d{5}_[^/]+)/', path)
-    if query_id_match:
-        query_id = query_id_match.group(1)
-        if query_id in query_cluster_map:
-            cluster_name = query_cluster_map[query_id]
+    return query_id_match.group(1) if query_id_match else None
+
+
+async def get_cluster_for_path(path: str) -> str:
+    """Determine which cluster handles this path based on query ID."""
+    query_id = get_query_id_from_path(path)
+    if query_id:
+        cluster_name = await query_cluster_map.get(query_id)
+        if cluster_name:
             logger.debug("path_cluster_resolved path=%s cluster=%s query_id=%s", path[:60], cluster_name, query_id)
             return cluster_name
         else:
-            logger.debug("path_cluster_unknown query_id=%s fallback=%s", query_id, FALLBACK_CLUSTER)
-    return FALLBACK_CLUSTER
+            logger.debug("path_cluster_unknown query_id=%s fallback=%s", query_id, cluster_registry.current().default_tier)
+    return cluster_registry.current().default_tier
+
+
+async def escalate_query(query_id: str, reason: str) -> Optional[Response]:
+    """
+    Resubmits a failed/runaway SELECT on the next tier and returns that submission's page in place of
+    the current one, so the client just follows the new nextUri. None when there is no bigger tier.
+    """
+    context = escalation_tracker.forget(query_id)
+    config = cluster_registry.current()
+    next_tier = config.next_tier(context.cluster) if context else None
+    if next_tier is None:
+        return None
+
+    try:
+        admission = await admission_controller.acquire(next_tier.name, config)
+    except AdmissionRejected as e:
+        escalation_tracker.counters['failed'] += 1
+        logger.warning("escalation_failed query_id=%s from=%s reason=%s error=admission_%s", query_id, context.cluster, reason, e.reason)
+        return None
+
+    cluster_name = admission.cluster
+    try:
+        async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
+            response = await client.post(urljoin(config.tier(cluster_name).url, '/v1/statement'),
+                                         content=context.query, headers=context.headers)
+            if reason == 'runaway':
+                # Original query is still running: cancel it once the new one is accepted
+                await client.delete(
+                    f"{config.tier(context.cluster).url}/v1/query/{query_id}",
+                    headers={'X-Trino-User': context.headers.get('X-Trino-User', 'admin')}
+                )
+                finish_query(query_id, None)
+    except Exception as e:
+        admission_controller.release(admission)
+        escalation_tracker.counters['failed'] += 1
+        logger.warning("escalation_failed query_id=%s from=%s to=%s reason=%s error=%s", query_id, context.cluster, cluster_name, reason, str(e))
+        return None
+
+    response_content, new_query_id = url_rewriters.proxy(cluster_name).rewrite(response.content)
+    await map_query_cluster(new_query_id, cluster_name)
+    admission_controller.bind(admission, new_query_id)
+    metrics_collector.register(new_query_id, context.fingerprint, cluster_name)
+    escalation_tracker.register(new_query_id, EscalationContext(
+        context.query, context.headers, cluster_name, context.fingerprint, hops=context.hops + 1))
+    escalation_tracker.counters['escalated'] += 1
+    logger.info("query_escalated query_id=%s new_query_id=%s from=%s to=%s reason=%s",
+                query_id, new_query_id, context.cluster, cluster_name, reason)
+
+    if context.fingerprint and new_query_id:
+        await record_escalation(context.fingerprint, context.cluster, cluster_name, reason, query_id)
+
+    return Response(
+        content=response_content,
+        status_code=response.status_code,
+        headers={'Content-Type': response.headers.get('Content-Type', 'application/json')},
+    )
 
 
 @app.api_route('/{path:path}', methods=['GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'])
@@ -351,6 +620,9 @@ async def proxy_other(path: str, request: Request):
     """
     logger.debug("proxy_request path=%s method=%s", path[:60], request.method)
 
+    # Rewritten URLs carry their cluster (/c/<token>/...); older ones are looked up by query ID
+    token_cluster, path = routing_tokens.resolve(path, cluster_registry.current())
+
     normalized_path = path.strip('/')
     if normalized_path == 'loginType':
         logger.debug("proxy_loginType returning empty supportedTypes")
@@ -399,8 +671,11 @@ async def proxy_other(path: str, request: Request):
             logger.warning("proxy_ui_redirect_failed fallback_to_cluster error=%s", str(e))
 
     # Determine target cluster based on query ID in path
-    cluster_name = get_cluster_for_path(path)
-    cluster_url = CLUSTER_URLS.get(cluster_name, CLUSTER_URLS[FALLBACK_CLUSTER])
+    cluster_name = token_cluster or await get_cluster_for_path(path)
+    cluster_url = cluster_registry.current().tier(cluster_name).url
+    query_id = get_query_id_from_path(path) if path.startswith('v1/statement/') else None
+    current_span().set('trino.query_id', query_id)
+    current_span().set('dyrasql.cluster', cluster_name)
 
     try:
         if path.startswith('/'):
@@ -412,50 +687,101 @@ async def proxy_other(path: str, request: Request):
         for key, value in request.headers.items():
             if key.lower() not in ['host', 'content-length', 'connection', 'transfer-encoding']:
                 headers[key] = value
-        headers['Accept-Encoding'] = 'identity'
+        if SPOOLING_HEADER.lower() in headers:
+            data_encoding = negotiate_spooling(headers.pop(SPOOLING_HEADER.lower()))
+            if data_encoding:
+                headers[SPOOLING_HEADER] = data_encoding
+        # GET pages may come compressed in a codec this client reads (relayed or re-encoded below)
+        headers['Accept-Encoding'] = negotiate(request.headers.get('accept-encoding')) if request.method == 'GET' else 'identity'
 
         body = await request.body() if request.method in ['POST', 'PUT'] else None
 
         # Use streaming for GET requests (data fetching)
         if request.method == 'GET':
-            async with httpx.AsyncClient(timeout=DATA_TIMEOUT) as client:
-                async with client.stream('GET', target_url, headers=headers, params=request.query_params) as response:
-                    response_headers = {}
-                    for key, value in response.headers.items():
-                        if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding', 'content-length']:
-                            response_headers[key] = value
-
-                    content_type = response.headers.get('Content-Type', 'application/json')
-                    response_headers['Content-Type'] = content_type
-
-                    # Check if we need URL rewriting (for JSON responses with nextUri)
-                    if 'application/json' in content_type:
-                        # Buffer small JSON responses for URL rewriting
-                        content_length = response.headers.get('content-length')
-                        if content_length and int(content_length) < STREAMING_THRESHOLD:
-                            content = b''
-                            async for chunk in response.aiter_bytes():
-                                content += chunk
-
-                            text_content = content.decode('utf-8')
-                            if BYPASS_MODE:
-                                text_content = rewrite_urls_for_bypass(text_content, cluster_name)
-                            else:
-                                text_content = rewrite_urls_for_proxy(text_content)
-
-                            return Response(
-                                content=text_content.encode('utf-8'),
-                                status_code=response.status_code,
-                                headers=response_headers,
-                            )
-
-                    # For large responses or non-JSON, stream directly
-                    return StreamingResponse(
-                        stream_response(response, cluster_name),
-                        status_code=response.status_code,
-                        headers=response_headers,
-                        media_type=content_type
+            # The upstream stream must outlive this handler when the page is streamed to the client
+            client = httpx.AsyncClient(timeout=DATA_TIMEOUT)
+            try:
+                with timer('trino_request_seconds', 'poll'):
+                    response = await client.send(
+                        client.build_request('GET', target_url, headers={**headers, **trace_headers()},
+                                             params=request.query_params),
+                        stream=True
                     )
+            except BaseException:
+                await client.aclose()
+                raise
+            streaming = False
+            try:
+                response_headers = {}
+                for key, value in response.headers.items():
+                    if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding', 'content-length']:
+                        response_headers[key] = value
+
+                content_type = response.headers.get('Content-Type', 'application/json')
+                response_headers['Content-Type'] = content_type
+                encoding = content_encoding(response.headers)
+                if encoding:
+                    response_headers['Content-Encoding'] = encoding
+
+                # Check if we need URL rewriting (for JSON responses with nextUri)
+                if 'application/json' in content_type:
+                    # Buffer small JSON responses for URL rewriting (threshold applies to the wire size)
+                    content_length = response.headers.get('content-length')
+                    if content_length and int(content_length) < STREAMING_THRESHOLD:
+                        raw = b''.join([chunk async for chunk in response.aiter_raw()])
+                        content = decode(raw, encoding)
+
+                        if response.status_code >= 400:
+                            finish_query(query_id, None)
+                        elif query_id:
+                            scanner = scan_page(content)
+                            if scanner.terminal:
+                                finish_query(query_id, scanner)
+                            else:
+                                admission_controller.touch(query_id)
+
+                        if response.status_code == 200 and escalation_tracker.tracking(query_id):
+                            reason = escalation_tracker.check(query_id, json.loads(content), cluster_registry.current().tier(cluster_name))
+                            if reason:
+                                escalated = await escalate_query(query_id, reason)
+                                if escalated is not None:
+                                    return escalated
+
+                        page = rewrite_page(content, cluster_name)[0]
+                        if encoding:
+                            # Pages without cluster URLs go out exactly as the cluster compressed them
+                            if page is content:
+                                compression_counters['passthrough'] += 1
+                                page = raw
+                            else:
+                                compression_counters['recompressed'] += 1
+                                page = encode(page, encoding)
+                        if query_id:
+                            inc('proxied_pages_total', cluster_name)
+                            inc('proxied_bytes_total', cluster_name, len(page))
+                        return Response(
+                            content=page,
+                            status_code=response.status_code,
+                            headers=response_headers,
+                        )
+
+                admission_controller.touch(query_id)
+                # Large pages carry rows: the query can no longer be escalated
+                escalation_tracker.forget(query_id)
+                # For large responses or non-JSON, stream directly (JSON pages get their head URIs rewritten)
+                rewrite_head = 'application/json' in content_type and not page_url_rewriter(cluster_name).identity
+                rewriter = PageRewriter(page_rewrite_function(cluster_name)) if rewrite_head else None
+                streaming = True
+                return StreamingResponse(
+                    stream_response(response, cluster_name, query_id, rewriter, client),
+                    status_code=response.status_code,
+                    headers=response_headers,
+                    media_type=content_type
+                )
+            finally:
+                if not streaming:
+                    await response.aclose()
+                    await client.aclose()
         else:
             # For non-GET requests, use regular async client
             async with httpx.AsyncClient(timeout=DATA_TIMEOUT, follow_redirects=True) as client:
@@ -465,6 +791,8 @@ async def proxy_other(path: str, request: Request):
                     response = await client.put(target_url, content=body, headers=headers)
                 elif request.method == 'DELETE':
                     response = await client.delete(target_url, headers=headers)
+                    if '/partialCancel/' not in path:
+                        finish_query(query_id, None)
                 elif request.method == 'HEAD':
                     response = await client.head(target_url, headers=headers)
                 elif request.method == 'OPTIONS':
@@ -474,17 +802,11 @@ async def proxy_other(path: str, request: Request):
 
                 response_headers = {}
                 for key, value in response.headers.items():
-                    if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding']:
+                    if key.lower() not in ['connection', 'transfer-encoding', 'content-encoding', 'content-length']:
                         response_headers[key] = value
 
-                response_content = response.content.decode('utf-8')
-                if BYPASS_MODE:
-                    response_content = rewrite_urls_for_bypass(response_content, cluster_name)
-                else:
-                    response_content = rewrite_urls_for_proxy(response_content)
-
                 return Response(
-                    content=response_content.encode('utf-8'),
+                    content=rewrite_page(response.content, cluster_name)[0],
                     status_code=response.status_code,
                     headers=response_headers,
                 )
@@ -497,29 +819,44 @@ async def proxy_other(path: str, request: Request):
         raise HTTPException(status_code=500, detail='Proxy request failed')
 
 
-async def get_routing_decision(query: str) -> Optional[str]:
-    """Calls DyraSQL Core to get routing decision."""
+async def get_routing_decision(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Routing decision (cluster, fingerprint, expected_runtime...). Embedded mode answers cache hits
+    and catalog queries in-process; the rest (and remote mode) is decided by DyraSQL Core.
+    """
+    if embedded_router is not None:
+        _, decision = embedded_router.route(query, 'routing')
+        if decision:
+            return decision
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.post(
+        with timer('routing_stage_seconds', 'remote'):
+            response = await core_client.post(
                 f"{DYRASQL_CORE_URL}/api/v1/route",
-                json={'query': query}
+                json={'query': query},
+                headers=trace_headers()
             )
-            if response.status_code == 200:
-                data = response.json()
-                cluster = data.get('cluster')
-                score = data.get('score', 0)
-                cached = data.get('cached', False)
-                factors = data.get('factors', {})
-                if cached:
-                    logger.info("routing_decision cached=true cluster=%s score=%.3f", cluster, score)
-                else:
-                    logger.info("routing_decision cluster=%s score=%.3f volume=%.2f complexity=%.2f historical=%.2f",
-                        cluster, score, factors.get('volume', 0), factors.get('complexity', 0), factors.get('historical', 0))
-                return cluster
+        if response.status_code == 200:
+            data = response.json()
+            cluster = data.get('cluster')
+            score = data.get('score', 0)
+            cached = data.get('cached', False)
+            factors = data.get('factors', {})
+            if cached:
+                logger.info("routing_decision cached=true cluster=%s score=%.3f", cluster, score)
             else:
-                logger.warning("dyrasql_core_error status=%s body=%s", response.status_code, response.text[:200])
-                return None
+                logger.info("routing_decision cluster=%s score=%.3f volume=%.2f complexity=%.2f historical=%.2f",
+                    cluster, score, factors.get('volume', 0), factors.get('complexity', 0), factors.get('historical', 0))
+            if embedded_router is not None and cluster and data.get('fingerprint'):
+                embedded_router.save(data['fingerprint'], {
+                    'cluster': cluster,
+                    'score': score,
+                    'factors': factors,
+                    'expected_runtime': data.get('expected_runtime')
+                })
+            return data
+        else:
+            logger.warning("dyrasql_core_error status=%s body=%s", response.status_code, response.text[:200])
+            return None
     except httpx.TimeoutException:
         logger.warning("dyrasql_core_timeout")
         return None
@@ -528,20 +865,53 @@ async def get_routing_decision(query: str) -> Optional[str]:
         return None
 
 
+# Trino query states after which the coordinator no longer runs the query
+TERMINAL_QUERY_STATES = ('FINISHED', 'FAILED')
+
+
+async def query_finished(cluster_name: str, query_id: str) -> bool:
+    """Admission reconcile probe: True once the coordinator reports the query done (or forgotten)."""
+    async with httpx.AsyncClient(timeout=5) as client:
+        response = await client.get(
+            f"{cluster_registry.current().tier(cluster_name).url}/v1/query/{query_id}",
+            params={'pruned': 'true'},
+            headers={'X-Trino-User': 'dyrasql', 'Accept-Encoding': 'identity'}
+        )
+    if response.status_code in (404, 410):
+        return True
+    if response.status_code != 200:
+        return False
+    return response.json().get('state') in TERMINAL_QUERY_STATES
+
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event."""
-    logger.info("trino_gateway_proxy starting version=1.1.0 bypass_mode=%s streaming_threshold=%s dyrasql_core_url=%s",
-                BYPASS_MODE, STREAMING_THRESHOLD, DYRASQL_CORE_URL)
+    logger.info("trino_gateway_proxy starting version=1.1.0 bypass_mode=%s streaming_threshold=%s dyrasql_core_url=%s routing_mode=%s",
+                BYPASS_MODE, STREAMING_THRESHOLD, DYRASQL_CORE_URL, ROUTING_MODE)
+    cluster_registry.start_watching(asyncio.get_running_loop())
+    admission_controller.start(query_finished)
+    metrics_collector.start()
+    query_cluster_map.start()
+    catalog_cache.start()
+    await worker_stats.start()
+    start_profiling()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event."""
     logger.info("trino_gateway_proxy shutting down")
+    await metrics_collector.stop()
+    await worker_stats.stop()
+    await stop_profiling()
+    await catalog_cache.stop()
+    await core_client.aclose()
+    shutdown_tracing()
+    shutdown_logging()
 
 
 if __name__ == '__main__':
-    import uvicorn
     port = int(os.getenv('PORT', '8080'))
-    uvicorn.run(app, host='0.0.0.0', port=port)
+    # DYRASQL_WORKERS > 1: supervisor with that many SO_REUSEPORT workers
+    serve(app, port)